@@ -1,9 +1,19 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, abort, current_app
 from flask_login import login_required, current_user
 from database import db
 from admin import admin_bp
-from models import Incident, User, DiaryEntry
+from models import Incident, AlertDelivery, PendingDigestItem
 from datetime import datetime
+from geo import geocode_incident
+from clusters import get_cluster_index
+from cache import bump_data_version
+from pagination import keyset_page, page_args
+from stats import get_stats
+import rollups
+import outbox
+from search.index import index_incident, remove_incident
+from photos import photo_url
+from instrumentation import get_query_stats
 
 def admin_required(func):
     from functools import wraps
@@ -15,41 +25,84 @@ def admin_required(func):
         return func(*args, **kwargs)
     return decorated_view
 
+def pending_query():
+    return Incident.query.filter_by(approved=False).options(db.joinedload(Incident.reporter))
+
 @admin_bp.route('/dashboard')
 @login_required
 @admin_required
 def dashboard():
-    pending_incidents = Incident.query.filter_by(approved=False).order_by(Incident.timestamp.desc()).all()
+    cursor, limit = page_args()
+    try:
+        page = keyset_page(pending_query(), Incident, cursor, limit)
+    except ValueError:
+        abort(400)
+    snapshot = get_stats()
     
-    # Get additional stats for dashboard
-    today = datetime.utcnow().date()
-    approved_count = Incident.query.filter_by(approved=True).filter(
-        db.func.date(Incident.timestamp) == today
-    ).count()
-    total_users = User.query.count()
-    total_diaries = DiaryEntry.query.count()
+    # Approved-today is a single row of the daily rollup
+    approved_count = rollups.day_count(rollups.APPROVED_INCIDENTS, datetime.utcnow().date())
     
     return render_template('admin/dashboard.html', 
-                         incidents=pending_incidents,
+                         incidents=page.items,
+                         next_cursor=page.next_cursor,
+                         pending_count=snapshot['pending_incidents'],
                          approved_count=approved_count,
-                         total_users=total_users,
-                         total_diaries=total_diaries)
+                         total_users=snapshot['total_users'],
+                         total_diaries=snapshot['total_diaries'])
+
+@admin_bp.route('/api/pending')
+@login_required
+@admin_required
+def api_pending():
+    cursor, limit = page_args()
+    try:
+        page = keyset_page(pending_query(), Incident, cursor, limit)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    items = []
+    for incident in page.items:
+        items.append({
+            'id': incident.id,
+            'location': incident.location,
+            'category': incident.category,
+            'description': incident.description,
+            'photo_filename': incident.photo_filename,
+            'photo_url': photo_url(incident),
+            'thumbnail_url': photo_url(incident, 'thumb'),
+            'reporter': incident.reporter.username if incident.reporter else None,
+            'timestamp': incident.timestamp.isoformat()
+        })
+    return jsonify({'items': items, 'next_cursor': page.next_cursor})
 
 @admin_bp.route('/approve_incident/<int:incident_id>', methods=['POST'])
 @login_required
 @admin_required
 def approve_incident(incident_id):
     incident = Incident.query.get_or_404(incident_id)
+    was_approved = incident.approved
     incident.approved = True
+    if incident.geohash is None:
+        geocode_incident(incident)
+    if not was_approved:
+        rollups.incident_approved(incident)
+        index_incident(incident)
+        # The alert is recorded in the same commit as the approval
+        outbox.enqueue('incident.approved', {'incident_id': incident_id})
     db.session.commit()
+    if not was_approved:
+        get_cluster_index().add(incident, bump_data_version())
     
-    # Trigger alert task
+    # Publish right away; anything left behind is picked up by relay_outbox
     try:
-        from tasks import send_incident_alert
-        send_incident_alert.delay(incident_id)
-        flash('Incident approved and alerts are being sent.')
+        from tasks import relay_outbox_batch
+        stats = relay_outbox_batch(current_app.config['OUTBOX_BATCH_SIZE'])
+        if stats['failed']:
+            flash('Incident approved. Alerts are queued and will be sent once the task queue is reachable.')
+        else:
+            flash('Incident approved and alerts are being sent.')
     except Exception as e:
-        flash(f'Incident approved, but alert sending failed: {str(e)}')
+        db.session.rollback()
+        flash(f'Incident approved. Alerts are queued and will be sent shortly: {str(e)}')
     
     return redirect(url_for('admin.dashboard'))
 
@@ -58,8 +111,21 @@ def approve_incident(incident_id):
 @admin_required
 def reject_incident(incident_id):
     incident = Incident.query.get_or_404(incident_id)
+    was_approved = incident.approved
+    # Delivery rows and buffered digest items reference the incident, so they
+    # go in the same transaction
+    db.session.execute(db.delete(AlertDelivery).where(AlertDelivery.incident_id == incident.id))
+    db.session.execute(
+        db.delete(PendingDigestItem).where(PendingDigestItem.incident_id == incident.id))
     db.session.delete(incident)
+    rollups.incident_reported(incident, -1)
+    if was_approved:
+        rollups.incident_approved(incident, -1)
+        remove_incident(incident.id)
     db.session.commit()
+    version = bump_data_version()
+    if was_approved:
+        get_cluster_index().remove(incident, version)
     flash('Incident rejected and deleted.')
     return redirect(url_for('admin.dashboard'))
 
@@ -71,17 +137,15 @@ def health_check():
         db.session.execute(db.text('SELECT 1'))
         
         # Check basic stats
-        user_count = User.query.count()
-        incident_count = Incident.query.count()
-        diary_count = DiaryEntry.query.count()
+        snapshot = get_stats()
         
         return jsonify({
             'status': 'ok',
             'database': 'connected',
             'stats': {
-                'users': user_count,
-                'incidents': incident_count,
-                'diaries': diary_count
+                'users': snapshot['total_users'],
+                'incidents': snapshot['total_incidents'],
+                'diaries': snapshot['total_diaries']
             },
             'timestamp': datetime.utcnow().isoformat()
         })
@@ -91,3 +155,16 @@ def health_check():
             'message': str(e),
             'timestamp': datetime.utcnow().isoformat()
         }), 500
+
+@admin_bp.route('/api/sql-stats', methods=['GET', 'DELETE'])
+@login_required
+@admin_required
+def api_sql_stats():
+    stats = get_query_stats()
+    if stats is None:
+        return jsonify({'status': 'error',
+                        'message': 'SQL instrumentation is off (set SQL_INSTRUMENTATION=True)'}), 404
+    if request.method == 'DELETE':
+        stats.reset()
+        return jsonify({'status': 'ok'})
+    return jsonify({'status': 'ok', 'slow_query_ms': stats.slow_ms, **stats.snapshot()})
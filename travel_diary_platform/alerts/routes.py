@@ -3,20 +3,98 @@ from flask_login import login_required
 from database import db
 from alerts import alerts_bp
 from models import Incident
+import geo
+from clusters import get_cluster_index, cluster_precision
+from cache import cached_json, data_version
+from photos import photo_url
+
+def viewport_filter(boxes, precision):
+    """SQL filter matching approved incidents inside any of the given boxes.
+
+    Each covering cell becomes a geohash range (``'~'`` sorts after every
+    geohash character) with the approval flag, so each one is a seek on the
+    (approved, geohash) index; a prefix LIKE cannot use the index in SQLite.
+    The coordinate range then trims the cell edges to the exact viewport.
+    """
+    clauses = []
+    for min_lat, min_lon, max_lat, max_lon in boxes:
+        cells = geo.cover_bbox(min_lat, min_lon, max_lat, max_lon, precision)
+        clauses.append(db.and_(
+            db.or_(*[db.and_(Incident.approved == True, Incident.geohash >= cell,
+                             Incident.geohash < cell + '~')
+                     for cell in sorted(cells)]),
+            Incident.latitude.between(min_lat, max_lat),
+            Incident.longitude.between(min_lon, max_lon),
+        ))
+    return db.or_(*clauses)
+
+def viewport_precision(boxes, zoom=None):
+    """Geohash precision for a viewport, from the zoom level or the box size"""
+    by_size = min(geo.precision_for_bbox(*box) for box in boxes)
+    if zoom is None:
+        return by_size
+    # Never use more cells than the size-based choice would
+    return min(geo.precision_for_zoom(zoom), by_size)
 
 @alerts_bp.route('/api/risks')
 def api_risks():
-    approved_incidents = Incident.query.filter_by(approved=True).all()
-    risks = []
-    for incident in approved_incidents:
-        risks.append({
-            'id': incident.id,
-            'location': incident.location,
-            'category': incident.category,
-            'description': incident.description,
-            'timestamp': incident.timestamp.isoformat()
-        })
-    return jsonify(risks)
+    boxes = zoom = None
+    bbox = request.args.get('bbox')
+    if bbox:
+        try:
+            boxes = geo.parse_bbox(bbox)
+            zoom = request.args.get('zoom', type=int)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': f'Invalid bbox: {e}'}), 400
+
+    def build():
+        if boxes:
+            # The viewport filter checks approval itself, inside each cell range
+            query = Incident.query.filter(viewport_filter(boxes, viewport_precision(boxes, zoom))) \
+                .order_by(Incident.timestamp.desc()) \
+                .limit(current_app.config['RISKS_MAX_RESULTS'])
+        else:
+            query = Incident.query.filter_by(approved=True)
+
+        risks = []
+        for incident in query.all():
+            risks.append({
+                'id': incident.id,
+                'location': incident.location,
+                'category': incident.category,
+                'description': incident.description,
+                'timestamp': incident.timestamp.isoformat(),
+                'latitude': incident.latitude,
+                'longitude': incident.longitude,
+                'thumbnail_url': photo_url(incident, 'thumb')
+            })
+        return risks
+
+    return cached_json('risks', build)
+
+@alerts_bp.route('/api/clusters')
+def api_clusters():
+    zoom = request.args.get('zoom', default=2, type=int)
+    precision = cluster_precision(zoom)
+
+    boxes = cover_precision = None
+    bbox = request.args.get('bbox')
+    if bbox:
+        try:
+            boxes = geo.parse_bbox(bbox)
+        except ValueError as e:
+            return jsonify({'status': 'error', 'message': f'Invalid bbox: {e}'}), 400
+        cover_precision = viewport_precision(boxes, zoom)
+
+    def build():
+        version, _ = data_version()
+        return {
+            'zoom': zoom,
+            'precision': precision,
+            'clusters': get_cluster_index().clusters(precision, boxes, cover_precision, version)
+        }
+
+    return cached_json('clusters', build)
 
 @alerts_bp.route('/alerts')
 @login_required
@@ -2,16 +2,33 @@ import os
 from flask import Flask, render_template
 from werkzeug.middleware.proxy_fix import ProxyFix
 from config import Config
+import database
 from database import db, login_manager
+import cache
+import clusters
+import stats
+import photos
+import instrumentation
+from search import index as search_index
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
     app.config.from_object(Config)
+    # Overrides must be in place before the extensions read them (the
+    # database engine is built from the config in init_app)
+    if config:
+        app.config.update(config)
 
     # Initialize extensions
-    db.init_app(app)
+    database.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
+    cache.init_app(app)
+    clusters.init_app(app)
+    stats.init_app(app)
+    search_index.init_app(app)
+    photos.init_app(app)
+    instrumentation.init_app(app)
 
     # Register blueprints
     from auth.routes import auth_bp
@@ -19,41 +36,43 @@ def create_app():
     from incidents.routes import incidents_bp
     from alerts.routes import alerts_bp
     from admin.routes import admin_bp
+    from search import search_bp
+    from export import export_bp
 
     app.register_blueprint(auth_bp, url_prefix='/auth')
     app.register_blueprint(diary_bp, url_prefix='/diary')
     app.register_blueprint(incidents_bp, url_prefix='/incidents')
     app.register_blueprint(alerts_bp, url_prefix='/alerts')
     app.register_blueprint(admin_bp, url_prefix='/admin')
+    app.register_blueprint(search_bp, url_prefix='/search')
+    app.register_blueprint(export_bp, url_prefix='/export')
 
     # Fix for proxy headers (if behind proxy)
     app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
     @app.route('/')
     def index():
-        from models import DiaryEntry, Incident, User
-        
-        # Get recent content for homepage
-        recent_diaries = DiaryEntry.query.order_by(DiaryEntry.timestamp.desc()).limit(3).all()
-        recent_incidents = Incident.query.filter_by(approved=True).order_by(Incident.timestamp.desc()).limit(3).all()
-        
-        # Get stats for homepage
-        stats = {
-            'total_diaries': DiaryEntry.query.count(),
-            'total_incidents': Incident.query.filter_by(approved=True).count(),
-            'total_users': User.query.count()
-        }
+        # Counts and recent content come from the cached stats snapshot
+        snapshot = stats.get_stats()
         
         return render_template('index.html', 
-                             recent_diaries=recent_diaries,
-                             recent_incidents=recent_incidents,
-                             stats=stats)
+                             recent_diaries=snapshot['recent_diaries'],
+                             recent_incidents=snapshot['recent_incidents'],
+                             stats={
+                                 'total_diaries': snapshot['total_diaries'],
+                                 'total_incidents': snapshot['approved_incidents'],
+                                 'total_users': snapshot['total_users']
+                             })
 
     # Error handlers
     @app.errorhandler(404)
     def not_found_error(error):
         return render_template('errors/404.html'), 404
 
+    @app.errorhandler(413)
+    def too_large_error(error):
+        return render_template('errors/413.html'), 413
+
     @app.errorhandler(500)
     def internal_error(error):
         db.session.rollback()
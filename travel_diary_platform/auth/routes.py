@@ -4,6 +4,9 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from database import db
 from auth import auth_bp
 from models import User, Preference
+from stats import invalidate_stats
+from geo import get_geocoder
+from subscriptions import parse_cells, update_subscription
 
 @auth_bp.route('/signup', methods=['GET', 'POST'])
 def signup():
@@ -27,6 +30,7 @@ def signup():
         pref = Preference(user_id=user.id, alert_via_email=True)
         db.session.add(pref)
         db.session.commit()
+        invalidate_stats()
         flash('Account created successfully. Please log in.')
         return redirect(url_for('auth.login'))
     return render_template('auth/signup.html')
@@ -63,10 +67,30 @@ def profile():
         alert_via_email = 'alert_via_email' in request.form
         whatsapp_number = request.form.get('whatsapp_number')
         email = request.form.get('email')
+        home_location = request.form.get('home_location', '').strip()
+        alert_radius_km = request.form.get('alert_radius_km', type=float)
+        alert_cells = request.form.get('alert_cells', '').strip()
+        
+        # Resolve the area of interest before touching the saved preferences
+        home = get_geocoder().geocode(home_location) if home_location else None
+        if home_location and home is None:
+            flash('Could not find that home location. Try a city name or "lat, lon".')
+            return render_template('auth/profile.html', pref=pref)
+        try:
+            parse_cells(alert_cells)
+        except ValueError as e:
+            flash(f'Invalid alert areas: {str(e)}')
+            return render_template('auth/profile.html', pref=pref)
+        
         pref.alert_via_whatsapp = alert_via_whatsapp
         pref.alert_via_email = alert_via_email
         pref.whatsapp_number = whatsapp_number
         pref.email = email
+        pref.home_location = home_location or None
+        pref.home_latitude, pref.home_longitude = home or (None, None)
+        pref.alert_radius_km = alert_radius_km if alert_radius_km and alert_radius_km > 0 else None
+        pref.alert_cells = alert_cells or None
+        update_subscription(pref)
         db.session.commit()
         flash('Preferences updated.')
         return redirect(url_for('auth.profile'))
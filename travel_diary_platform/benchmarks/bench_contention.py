@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Write contention on one SQLite file shared by web and worker processes.
+
+Mirrors the docker-compose deployment: ``--web`` processes serve likes and
+the diary feed through the Flask test client while ``--workers`` processes
+insert alert batches the way the alert task does, all on the same database
+file. Each mode runs against a freshly seeded scratch database:
+
+- ``tuned``: the configured pragmas (WAL, synchronous=NORMAL, busy timeout)
+- ``legacy``: rollback journal and synchronous=FULL, as before the tuning
+
+Run from the travel_diary_platform directory:
+
+    python benchmarks/bench_contention.py --web 4 --workers 1 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'benchpass'
+USERS = 200
+DIARIES = 2000
+ALERT_BATCH = 200
+
+MODES = {
+    'tuned': {},
+    'legacy': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL'},
+}
+
+
+def setup_database():
+    from app import create_app, db
+    from setup import seed_database
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed_database(users=USERS, diaries=DIARIES, incidents=DIARIES, comments=0, likes=0,
+                      alerts=0, password=PASSWORD)
+
+
+def web_process(index, args, start, results):
+    """Logged-in traffic: likes (writes) mixed with diary feed reads"""
+    from app import create_app
+    app = create_app()
+    # Failed requests are counted, not logged
+    app.logger.disabled = True
+    client = app.test_client()
+    client.post('/auth/login', data={'username': f'user{index + 1}', 'password': PASSWORD})
+    rng = random.Random(index)
+    timings = {'like': [], 'feed': []}
+    errors = {'like': 0, 'feed': 0}
+    start.wait()
+    deadline = time.perf_counter() + args.seconds
+    while time.perf_counter() < deadline:
+        kind = 'like' if rng.random() < args.write_share else 'feed'
+        started = time.perf_counter()
+        if kind == 'like':
+            response = client.post('/diary/like', data={'diary_id': rng.randint(1, DIARIES)})
+        else:
+            response = client.get('/diary/all')
+        response.close()
+        timings[kind].append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 500:
+            errors[kind] += 1
+    results.put((timings, errors, {}))
+
+
+def worker_process(index, args, start, results):
+    """Alert task writes: a batch of alert rows per transaction"""
+    from sqlalchemy.exc import OperationalError
+    from app import create_app, db
+    from models import Alert
+    app = create_app()
+    rng = random.Random(1000 + index)
+    timings = {'alert_batch': []}
+    errors = {'alert_batch': 0}
+    messages = {}
+    start.wait()
+    deadline = time.perf_counter() + args.seconds
+    with app.app_context():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                db.session.execute(db.insert(Alert), [
+                    {'user_id': rng.randint(1, USERS), 'message': 'Safety Alert: benchmark'}
+                    for _ in range(ALERT_BATCH)
+                ])
+                db.session.commit()
+            except OperationalError as e:
+                db.session.rollback()
+                errors['alert_batch'] += 1
+                messages.setdefault('alert_batch', str(e.orig))
+            timings['alert_batch'].append((time.perf_counter() - started) * 1000)
+    results.put((timings, errors, messages))
+
+
+def run_mode(mode, args):
+    context = multiprocessing.get_context('spawn')
+    scratch = tempfile.mkdtemp(prefix='tdp-contention-')
+    saved = dict(os.environ)
+    try:
+        # Children read the database settings from the environment at import
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+        os.environ.update(MODES[mode])
+        setup = context.Process(target=setup_database)
+        setup.start()
+        setup.join()
+
+        results = context.Queue()
+        # Everyone starts timing together, once every process has built its app
+        start = context.Barrier(args.web + args.workers)
+        processes = [context.Process(target=web_process, args=(i, args, start, results))
+                     for i in range(args.web)]
+        processes += [context.Process(target=worker_process, args=(i, args, start, results))
+                      for i in range(args.workers)]
+        for process in processes:
+            process.start()
+        collected = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        os.environ.clear()
+        os.environ.update(saved)
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    summary = {}
+    for timings, errors, messages in collected:
+        for kind, values in timings.items():
+            entry = summary.setdefault(kind, {'timings': [], 'errors': 0, 'first_error': None})
+            entry['timings'].extend(values)
+            entry['errors'] += errors[kind]
+            entry['first_error'] = entry['first_error'] or messages.get(kind)
+    for kind, entry in summary.items():
+        values = sorted(entry['timings'])
+        rate = len(values) / args.seconds
+        p99 = values[min(len(values) - 1, int(len(values) * 0.99))] if values else 0
+        print(f"{mode:<7} {kind:<12} {len(values):7d} ops {rate:8.1f} ops/s   "
+              f"p50 {statistics.median(values) if values else 0:8.2f} ms   p99 {p99:8.2f} ms   "
+              f"{entry['errors']} errors")
+        if entry['first_error']:
+            print(f"        first error: {entry['first_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--web', type=int, default=4, help='web processes')
+    parser.add_argument('--workers', type=int, default=1, help='alert worker processes')
+    parser.add_argument('--seconds', type=int, default=10, help='duration of each mode')
+    parser.add_argument('--write-share', type=float, default=0.5,
+                        help='fraction of web requests that are likes rather than feed reads')
+    parser.add_argument('--mode', action='append', choices=list(MODES),
+                        help='run only these modes (repeatable)')
+    args = parser.parse_args()
+    for mode in args.mode or MODES:
+        run_mode(mode, args)
+
+
+if __name__ == '__main__':
+    main()
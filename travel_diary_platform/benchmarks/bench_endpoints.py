@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Latency and throughput of the main endpoints against a seeded dataset.
+
+Seeds a fresh SQLite database with ``--scale`` incidents and diaries (using
+the generator behind ``python setup.py seed``), then
+drives each scenario in-process through the Flask test client, or against a
+running server with ``--url``. Records p50/p99 latency, requests per second
+and SQL statements per request, and can compare the run with a baseline.
+Run from the travel_diary_platform directory:
+
+    python benchmarks/bench_endpoints.py --scale 10000 --output benchmarks/baseline.json
+    python benchmarks/bench_endpoints.py --scale 10000 --compare benchmarks/baseline.json
+
+Against gunicorn, seed a database, start the server on it (with
+SQL_INSTRUMENTATION=True for query counts) and point the runner at it:
+
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/bench_endpoints.py --scale 100000 --seed-only
+    DATABASE_URL=sqlite:////tmp/bench.db SQL_INSTRUMENTATION=True gunicorn -w 4 'app:create_app()'
+    python benchmarks/bench_endpoints.py --scale 100000 --url http://127.0.0.1:8000
+"""
+import argparse
+import atexit
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'benchpass'
+# One map viewport over Paris, the busiest seeded city, as the map page would
+# request it: min_lon,min_lat,max_lon,max_lat
+RISKS_VIEWPORT = '2.25,48.80,2.45,48.92'
+
+# (name, method, path, login as)
+SCENARIOS = [
+    ('home', 'GET', '/', None),
+    ('diary_feed', 'GET', '/diary/all', None),
+    ('risks', 'GET', f'/alerts/api/risks?bbox={RISKS_VIEWPORT}&zoom=12', None),
+    ('admin_dashboard', 'GET', '/admin/dashboard', 'user1'),
+    ('like', 'POST', '/diary/like', 'user2'),
+]
+
+
+def seed(scale, seed_value):
+    """Recreate the current app's database with ``scale`` incidents and diaries"""
+    from app import db
+    from setup import seed_database
+    db.drop_all()
+    db.create_all()
+    # user1 is the admin, the others are travellers
+    return seed_database(users=max(10, scale // 10), diaries=scale, incidents=scale, admins=1,
+                         password=PASSWORD, seed=seed_value)
+
+
+class InProcessClient:
+    """Flask test client; one per thread"""
+
+    def __init__(self, app):
+        self._client = app.test_client()
+
+    def login(self, username):
+        self._client.post('/auth/login', data={'username': username, 'password': PASSWORD})
+
+    def request(self, method, path, data=None):
+        response = self._client.open(path, method=method, data=data)
+        response.close()
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+class HttpClient:
+    """HTTP session against a running server; one per thread"""
+
+    def __init__(self, url):
+        import requests
+        self._url = url.rstrip('/')
+        self._session = requests.Session()
+
+    def login(self, username):
+        self._session.post(self._url + '/auth/login', data={'username': username, 'password': PASSWORD})
+
+    def request(self, method, path, data=None):
+        response = self._session.request(method, self._url + path, data=data, allow_redirects=False)
+        return response.status_code, response.headers.get('Server-Timing', '')
+
+
+def query_count(server_timing):
+    # Set by the SQL instrumentation: db;dur=1.23;desc="4 queries"
+    if 'desc="' not in server_timing:
+        return None
+    return int(server_timing.split('desc="', 1)[1].split()[0])
+
+
+def run_scenario(make_client, scenario, requests_total, concurrency, diaries, rng):
+    name, method, path, username = scenario
+    timings, queries, errors = [], [], []
+    lock = threading.Lock()
+    per_thread = max(1, requests_total // concurrency)
+
+    def worker(seed_value):
+        local_rng = random.Random(seed_value)
+        client = make_client()
+        if username:
+            client.login(username)
+        # One untimed request so connections and caches are warm
+        client.request(method, path, {'diary_id': 1} if method == 'POST' else None)
+        mine_timings, mine_queries, mine_errors = [], [], 0
+        for _ in range(per_thread):
+            data = {'diary_id': local_rng.randint(1, diaries)} if method == 'POST' else None
+            started = time.perf_counter()
+            status, server_timing = client.request(method, path, data)
+            mine_timings.append((time.perf_counter() - started) * 1000)
+            count = query_count(server_timing)
+            if count is not None:
+                mine_queries.append(count)
+            # A redirect here means the login failed, so it counts as an error
+            if status >= 300:
+                mine_errors += 1
+        with lock:
+            timings.extend(mine_timings)
+            queries.extend(mine_queries)
+            errors.append(mine_errors)
+
+    threads = [threading.Thread(target=worker, args=(rng.random(),)) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    timings.sort()
+    return {
+        'requests': len(timings),
+        'errors': sum(errors),
+        'p50_ms': round(statistics.median(timings), 3),
+        'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 3),
+        'rps': round(len(timings) / elapsed, 1),
+        'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Print the change against ``baseline``; returns the regressed scenarios.
+
+    Latency and throughput may drift by ``tolerance`` (a fraction) before
+    counting as a regression. Any rise in queries per request is one, since
+    it usually means a new N+1 pattern rather than noise.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:<16} no baseline")
+            continue
+        problems = []
+        if result['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            problems.append(f"p99 {base['p99_ms']} -> {result['p99_ms']} ms")
+        if result['rps'] < base['rps'] * (1 - tolerance):
+            problems.append(f"rps {base['rps']} -> {result['rps']}")
+        if (result['queries_per_request'] is not None and base.get('queries_per_request') is not None
+                and result['queries_per_request'] > base['queries_per_request']):
+            problems.append(f"queries {base['queries_per_request']} -> {result['queries_per_request']}")
+        print(f"{name:<16} {'REGRESSED: ' + '; '.join(problems) if problems else 'ok'}")
+        if problems:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=int, default=10000,
+                        help='incidents and diaries to seed (e.g. 10000 up to 1000000)')
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=4, help='client threads')
+    parser.add_argument('--scenario', action='append', choices=[s[0] for s in SCENARIOS],
+                        help='run only these scenarios (repeatable)')
+    parser.add_argument('--url', help='benchmark a running server instead of running in-process')
+    parser.add_argument('--seed-only', action='store_true', help='seed DATABASE_URL and exit')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for data and requests')
+    parser.add_argument('--output', help='write (merge) the results into this JSON baseline')
+    parser.add_argument('--compare', help='compare with this JSON baseline; exit 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed latency/throughput drift when comparing (fraction)')
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    # Seeding drops every table, so only --seed-only touches DATABASE_URL; an
+    # in-process run points the app at a scratch file before importing it
+    if args.seed_only and 'DATABASE_URL' not in os.environ:
+        parser.error('--seed-only needs DATABASE_URL set to the database to (re)create')
+    if not args.url and not args.seed_only:
+        scratch = tempfile.mkdtemp(prefix='tdp-bench-')
+        atexit.register(shutil.rmtree, scratch, ignore_errors=True)
+        os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    os.environ.setdefault('SQL_INSTRUMENTATION', 'True')
+    # Seeding runs long statements on purpose; keep the slow-query log quiet
+    os.environ.setdefault('SLOW_QUERY_MS', '1000')
+
+    if not args.url:
+        from app import create_app
+        app = create_app()
+        with app.app_context():
+            started = time.perf_counter()
+            counts = seed(args.scale, args.seed)
+            print(f"Seeded {counts} in {time.perf_counter() - started:.1f} s")
+        if args.seed_only:
+            return
+        make_client = lambda: InProcessClient(app)
+    else:
+        make_client = lambda: HttpClient(args.url)
+
+    results = {}
+    for scenario in SCENARIOS:
+        if args.scenario and scenario[0] not in args.scenario:
+            continue
+        result = run_scenario(make_client, scenario, args.requests, args.concurrency, args.scale, rng)
+        results[scenario[0]] = result
+        queries = result['queries_per_request']
+        print(f"{scenario[0]:<16} p50 {result['p50_ms']:8.2f} ms   p99 {result['p99_ms']:8.2f} ms   "
+              f"{result['rps']:8.1f} req/s   "
+              f"{'-' if queries is None else queries} queries/req   {result['errors']} errors")
+
+    key = str(args.scale)
+    if args.output:
+        baseline = {}
+        if os.path.exists(args.output):
+            with open(args.output) as f:
+                baseline = json.load(f)
+        baseline[key] = results
+        with open(args.output, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Results for scale {key} written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f).get(key, {})
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Per-task bootstrap overhead: create_app() per task vs the shared worker app.
+
+Run from the travel_diary_platform directory:
+
+    python benchmarks/bench_task_bootstrap.py --iterations 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from celery import Celery
+from app import create_app, db
+from tasks import FlaskTask, make_celery
+
+# A throwaway Celery app, so the benchmark task never joins the real registry;
+# FlaskTask runs it in the app bound by make_celery, as the worker does
+bench = Celery('bench_task_bootstrap', task_cls=FlaskTask)
+
+
+@bench.task(shared=False)
+def ping():
+    """Smallest useful task: one round trip on the pooled engine"""
+    db.session.execute(db.text('SELECT 1'))
+
+
+def per_task_app():
+    # What every task used to do before touching the database
+    app = create_app()
+    with app.app_context():
+        db.session.execute(db.text('SELECT 1'))
+
+
+def time_calls(func, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def summary(name, timings):
+    timings = sorted(timings)
+    p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+    print(f"{name:<16} mean {statistics.mean(timings):8.3f} ms   "
+          f"p50 {statistics.median(timings):8.3f} ms   p99 {p99:8.3f} ms")
+    return statistics.mean(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    make_celery(create_app())
+
+    # Warm both paths so imports and the first connection are not counted
+    per_task_app()
+    ping()
+
+    before = summary('create_app/task', time_calls(per_task_app, args.iterations))
+    after = summary('shared app', time_calls(ping, args.iterations))
+    print(f"speedup          {before / after:8.1f}x")
+
+
+if __name__ == '__main__':
+    main()
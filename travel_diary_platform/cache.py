@@ -0,0 +1,155 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from flask import current_app, request
+
+
+class LocalVersionCounter:
+    """Data version kept in process memory.
+
+    Only bumps made in this process are seen, so with several web processes
+    the others keep serving their entries until ``CACHE_MAX_AGE`` expires them.
+    """
+
+    def __init__(self):
+        self._version = 0
+        self._modified = time.time()
+        self._lock = threading.Lock()
+
+    def get(self):
+        return self._version, self._modified
+
+    def bump(self):
+        with self._lock:
+            self._version += 1
+            self._modified = time.time()
+            return self._version
+
+
+class RedisVersionCounter:
+    """Data version shared by every web process through Redis"""
+
+    def __init__(self, url, prefix='travel_diary:'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._version_key = prefix + 'data_version'
+        self._modified_key = prefix + 'data_modified'
+
+    def get(self):
+        version, modified = self._redis.mget(self._version_key, self._modified_key)
+        return int(version or 0), float(modified or 0)
+
+    def bump(self):
+        pipe = self._redis.pipeline()
+        pipe.incr(self._version_key)
+        pipe.set(self._modified_key, time.time())
+        return pipe.execute()[0]
+
+
+class CachedBody:
+    __slots__ = ('version', 'body', 'etag', 'last_modified', 'created')
+
+    def __init__(self, version, body, last_modified):
+        self.version = version
+        self.body = body
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.last_modified = last_modified
+        self.created = time.monotonic()
+
+
+class ResponseCache:
+    """Bounded LRU of serialized response bodies tagged with a data version.
+
+    Entries are never invalidated one by one: bumping the version counter
+    makes every older entry a miss, and it is replaced on next use. With a
+    ``max_age`` (seconds), entries older than that are misses as well.
+    """
+
+    def __init__(self, counter, max_entries=256, max_age=None):
+        self.counter = counter
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.version != version:
+                return None
+            if self.max_age and time.monotonic() - entry.created > self.max_age:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+def init_app(app):
+    """Attach the data version counter and response cache to an app"""
+    if app.config.get('CACHE_REDIS_URL'):
+        counter = RedisVersionCounter(app.config['CACHE_REDIS_URL'],
+                                      app.config.get('CACHE_KEY_PREFIX', 'travel_diary:'))
+        max_age = None
+    else:
+        # Bumps in other processes are never seen, so bound staleness by age
+        counter = LocalVersionCounter()
+        max_age = app.config.get('CACHE_MAX_AGE', 30)
+    app.extensions['response_cache'] = ResponseCache(
+        counter, app.config.get('CACHE_MAX_ENTRIES', 256), max_age)
+
+
+def get_response_cache():
+    return current_app.extensions['response_cache']
+
+
+def data_version():
+    """Current (version, modified timestamp) of the public incident data"""
+    return get_response_cache().counter.get()
+
+
+def bump_data_version():
+    """Invalidate every cached response built from incident data"""
+    try:
+        return get_response_cache().counter.bump()
+    except Exception as e:
+        current_app.logger.warning(f"Could not bump data version: {str(e)}")
+        return None
+
+
+def cached_json(namespace, build):
+    """Serve ``build()`` as JSON, cached per data version with ETag/304 support.
+
+    The cache key is the namespace plus the query string. On a hit whose ETag
+    matches ``If-None-Match`` the response is a 304 and ``build`` never runs,
+    so polling clients cost no database work at all.
+    """
+    cache = get_response_cache()
+    try:
+        version, modified = cache.counter.get()
+    except Exception as e:
+        current_app.logger.warning(f"Response cache unavailable: {str(e)}")
+        version = modified = None
+
+    key = (namespace, request.query_string)
+    entry = cache.get(key, version) if version is not None else None
+    if entry is None:
+        body = current_app.json.dumps(build()).encode('utf-8')
+        last_modified = datetime.fromtimestamp(modified or time.time(), timezone.utc)
+        entry = CachedBody(version, body, last_modified)
+        if version is not None:
+            cache.put(key, entry)
+
+    response = current_app.response_class(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.last_modified = entry.last_modified
+    # Clients may keep the body but must revalidate before reusing it
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
@@ -0,0 +1,174 @@
+import threading
+import time
+from flask import current_app
+from bisect import bisect_left, insort
+from database import db
+from models import Incident
+import geo
+
+# Finest grid the clustering endpoint will build
+MAX_CLUSTER_PRECISION = 8
+
+
+class ClusterIndex:
+    """In-memory grids of approved incident counts, one per geohash precision.
+
+    A grid is built with one GROUP BY the first time its precision is asked
+    for, then kept current incrementally through ``add``/``remove`` as incidents
+    are approved or deleted. Cell keys are kept sorted, so the cells under a
+    viewport's covering prefixes are found by bisection rather than by scanning
+    the whole grid.
+
+    The index remembers the data version it reflects. A change it did not see
+    (another process approved something) shows up as a version gap, and the
+    grids are dropped and rebuilt instead of patched. A process-local version
+    never shows such a gap, so with ``max_age`` (seconds) a grid is also
+    rebuilt once it is that old.
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = max_age
+        self._grids = {}
+        self._keys = {}
+        self._built = {}
+        self._lock = threading.Lock()
+        self.version = None
+
+    def _advance(self, version):
+        """Move to ``version``; returns True if the grids may be patched in place"""
+        if version is None:
+            return True
+        patchable = self.version is not None and version == self.version + 1
+        if not patchable:
+            self._grids.clear()
+            self._keys.clear()
+        self.version = version
+        return patchable
+
+    def _build(self, precision):
+        cell = db.func.substr(Incident.geohash, 1, precision)
+        rows = db.session.query(
+            cell,
+            Incident.category,
+            db.func.count(Incident.id),
+            db.func.sum(Incident.latitude),
+            db.func.sum(Incident.longitude),
+        ).filter(
+            Incident.approved == True,
+            Incident.geohash.isnot(None),
+        ).group_by(cell, Incident.category).all()
+
+        grid = {}
+        for key, category, count, lat_sum, lon_sum in rows:
+            entry = grid.setdefault(key, {'count': 0, 'lat_sum': 0.0, 'lon_sum': 0.0, 'categories': {}})
+            entry['count'] += count
+            entry['lat_sum'] += lat_sum
+            entry['lon_sum'] += lon_sum
+            entry['categories'][category] = entry['categories'].get(category, 0) + count
+        return grid
+
+    def _grid(self, precision):
+        """Return (grid, sorted keys) for ``precision``; call with the lock held"""
+        expired = (self.max_age and precision in self._grids
+                   and time.monotonic() - self._built[precision] > self.max_age)
+        if precision not in self._grids or expired:
+            grid = self._build(precision)
+            self._grids[precision] = grid
+            self._keys[precision] = sorted(grid)
+            self._built[precision] = time.monotonic()
+        return self._grids[precision], self._keys[precision]
+
+    def _apply(self, incident, delta):
+        if not incident.geohash:
+            return
+        for precision, grid in self._grids.items():
+            key = incident.geohash[:precision]
+            entry = grid.get(key)
+            if entry is None:
+                if delta < 0:
+                    continue
+                entry = grid[key] = {'count': 0, 'lat_sum': 0.0, 'lon_sum': 0.0, 'categories': {}}
+                insort(self._keys[precision], key)
+            entry['count'] += delta
+            entry['lat_sum'] += delta * incident.latitude
+            entry['lon_sum'] += delta * incident.longitude
+            categories = entry['categories']
+            categories[incident.category] = categories.get(incident.category, 0) + delta
+            if categories[incident.category] <= 0:
+                del categories[incident.category]
+            if entry['count'] <= 0:
+                del grid[key]
+                keys = self._keys[precision]
+                del keys[bisect_left(keys, key)]
+
+    def add(self, incident, version=None):
+        """Count a newly approved incident in every built grid"""
+        with self._lock:
+            if self._advance(version):
+                self._apply(incident, 1)
+
+    def remove(self, incident, version=None):
+        """Take a deleted approved incident out of every built grid"""
+        with self._lock:
+            if self._advance(version):
+                self._apply(incident, -1)
+
+    def clear(self):
+        """Drop every grid; they are rebuilt on next use"""
+        with self._lock:
+            self._grids.clear()
+            self._keys.clear()
+
+    def clusters(self, precision, boxes=None, cover_precision=None, version=None):
+        """Return cluster dicts at ``precision``, limited to ``boxes`` if given"""
+        with self._lock:
+            if version is not None and version != self.version:
+                self._grids.clear()
+                self._keys.clear()
+                self.version = version
+            grid, keys = self._grid(precision)
+            if boxes is None:
+                selected = list(keys)
+            else:
+                selected = []
+                prefixes = set()
+                for box in boxes:
+                    prefixes |= geo.cover_bbox(*box, min(cover_precision or precision, precision))
+                for prefix in sorted(prefixes):
+                    i = bisect_left(keys, prefix)
+                    while i < len(keys) and keys[i].startswith(prefix):
+                        selected.append(keys[i])
+                        i += 1
+            result = []
+            for key in selected:
+                entry = grid[key]
+                lat = entry['lat_sum'] / entry['count']
+                lon = entry['lon_sum'] / entry['count']
+                if boxes is not None and not any(
+                        min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
+                        for min_lat, min_lon, max_lat, max_lon in boxes):
+                    continue
+                result.append({
+                    'cell': key,
+                    'latitude': round(lat, 6),
+                    'longitude': round(lon, 6),
+                    'count': entry['count'],
+                    'categories': dict(entry['categories']),
+                })
+        return result
+
+
+def init_app(app):
+    # Grids follow the response cache: without a shared version counter they
+    # miss other processes' approvals, so they expire after CACHE_MAX_AGE too
+    max_age = None if app.config.get('CACHE_REDIS_URL') else app.config.get('CACHE_MAX_AGE', 30)
+    app.extensions['cluster_index'] = ClusterIndex(max_age)
+
+
+def get_cluster_index():
+    return current_app.extensions['cluster_index']
+
+
+def cluster_precision(zoom):
+    """Grid precision for a zoom level: one step finer than the viewport cover"""
+    return min(geo.precision_for_zoom(zoom) + 1, MAX_CLUSTER_PRECISION)
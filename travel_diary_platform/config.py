@@ -8,17 +8,141 @@ class Config:
         'sqlite:///' + os.path.join(basedir, 'app.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Pragmas run on every SQLite connection. WAL lets the web app read while
+    # the worker writes, and writers wait up to the busy timeout for each
+    # other; synchronous=NORMAL is durable across crashes in WAL mode
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE') or 'WAL'
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS') or 'NORMAL'
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS') or 5000)
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB') or 20000)
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE') or 256 * 1024 * 1024)
+
+    # Connection pool per process for server databases (PostgreSQL, MySQL).
+    # Pre-ping and recycling drop connections the server or a proxy closed;
+    # SQLALCHEMY_ENGINE_OPTIONS may still override any engine option
+    DATABASE_POOL_SIZE = int(os.environ.get('DATABASE_POOL_SIZE') or 10)
+    DATABASE_MAX_OVERFLOW = int(os.environ.get('DATABASE_MAX_OVERFLOW') or 20)
+    DATABASE_POOL_TIMEOUT = int(os.environ.get('DATABASE_POOL_TIMEOUT') or 30)
+    DATABASE_POOL_RECYCLE = int(os.environ.get('DATABASE_POOL_RECYCLE') or 1800)
+    DATABASE_POOL_PRE_PING = os.environ.get('DATABASE_POOL_PRE_PING', 'True') == 'True'
+
     # Twilio config
     TWILIO_ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
     TWILIO_AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
     TWILIO_WHATSAPP_FROM = os.environ.get('TWILIO_WHATSAPP_FROM')
+    # Provider rate limit (messages per second and burst size); a 429 pauses
+    # every sender in the process for the server's Retry-After
+    TWILIO_RATE_LIMIT = float(os.environ.get('TWILIO_RATE_LIMIT') or 10)
+    TWILIO_RATE_BURST = int(os.environ.get('TWILIO_RATE_BURST') or 10)
+    TWILIO_MAX_RETRIES = int(os.environ.get('TWILIO_MAX_RETRIES') or 3)
+    TWILIO_TIMEOUT = float(os.environ.get('TWILIO_TIMEOUT') or 10)
+    # Override the Twilio API host, e.g. to point at a local stub server
+    TWILIO_API_BASE_URL = os.environ.get('TWILIO_API_BASE_URL')
 
     # Email SMTP config fallback
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'localhost'
     MAIL_PORT = int(os.environ.get('MAIL_PORT') or 25)
-    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') == 'True'
+    # STARTTLS unless MAIL_USE_TLS is set to something other than 'true'
+    MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS', 'True').lower() == 'true'
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+    MAIL_TIMEOUT = int(os.environ.get('MAIL_TIMEOUT') or 30)
+    # Authenticated SMTP sessions kept open per worker process, and how many
+    # messages each session sends before it is recycled
+    MAIL_POOL_SIZE = int(os.environ.get('MAIL_POOL_SIZE') or 4)
+    MAIL_POOL_MAX_MESSAGES = int(os.environ.get('MAIL_POOL_MAX_MESSAGES') or 100)
+
+    # Alert fan-out: recipients are streamed in chunks and each delivery channel
+    # sends on its own pool of that channel's concurrency (ALERT_MAX_WORKERS
+    # for a channel without one), so a slow provider only queues its own sends
+    ALERT_CHUNK_SIZE = int(os.environ.get('ALERT_CHUNK_SIZE') or 500)
+    ALERT_MAX_WORKERS = int(os.environ.get('ALERT_MAX_WORKERS') or 16)
+    ALERT_WHATSAPP_CONCURRENCY = int(os.environ.get('ALERT_WHATSAPP_CONCURRENCY') or 8)
+    ALERT_EMAIL_CONCURRENCY = int(os.environ.get('ALERT_EMAIL_CONCURRENCY') or 8)
+
+    # Alert retention: rows older than the window are deleted in primary-key
+    # batches, optionally archived first as gzipped NDJSON under ALERT_ARCHIVE_DIR;
+    # finished delivery records past the window are deleted too
+    ALERT_RETENTION_DAYS = int(os.environ.get('ALERT_RETENTION_DAYS') or 30)
+    ALERT_PURGE_BATCH_SIZE = int(os.environ.get('ALERT_PURGE_BATCH_SIZE') or 5000)
+    ALERT_ARCHIVE_DIR = os.environ.get('ALERT_ARCHIVE_DIR')
+
+    # Safety reports are written to REPORT_DIR when set (stdout otherwise);
+    # a non-zero region precision adds a breakdown by geohash prefix
+    REPORT_DIR = os.environ.get('REPORT_DIR')
+    REPORT_REGION_PRECISION = int(os.environ.get('REPORT_REGION_PRECISION') or 0)
+
+    # Geohash prefix length used to bucket approved incidents in the daily rollups
+    ROLLUP_BUCKET_PRECISION = int(os.environ.get('ROLLUP_BUCKET_PRECISION') or 4)
+
+    # Transactional outbox relay: events per batch and beat interval in seconds
+    OUTBOX_BATCH_SIZE = int(os.environ.get('OUTBOX_BATCH_SIZE') or 100)
+    OUTBOX_RELAY_INTERVAL = int(os.environ.get('OUTBOX_RELAY_INTERVAL') or 10)
+
+    # Geo-targeted alerts: areas of interest are indexed as at most
+    # SUBSCRIPTION_MAX_CELLS geohash cells; users without an area still get
+    # every alert unless ALERT_BROADCAST_UNTARGETED is turned off
+    ALERT_DEFAULT_RADIUS_KM = float(os.environ.get('ALERT_DEFAULT_RADIUS_KM') or 25)
+    SUBSCRIPTION_MAX_CELLS = int(os.environ.get('SUBSCRIPTION_MAX_CELLS') or 32)
+    ALERT_BROADCAST_UNTARGETED = os.environ.get('ALERT_BROADCAST_UNTARGETED', 'True') == 'True'
+
+    # Digest mode: with a non-zero window (seconds), approvals are buffered per
+    # recipient and sent as one message once the buffer has been quiet for the
+    # window, or at the latest ALERT_DIGEST_MAX_LATENCY seconds after the first
+    ALERT_DIGEST_WINDOW = int(os.environ.get('ALERT_DIGEST_WINDOW') or 0)
+    ALERT_DIGEST_MAX_LATENCY = int(os.environ.get('ALERT_DIGEST_MAX_LATENCY') or 600)
+    ALERT_DIGEST_FLUSH_INTERVAL = int(os.environ.get('ALERT_DIGEST_FLUSH_INTERVAL') or 30)
+    # A digest that fails to send is buffered again and retried after the
+    # window, up to this many sends before its deliveries are marked failed
+    ALERT_DIGEST_MAX_ATTEMPTS = int(os.environ.get('ALERT_DIGEST_MAX_ATTEMPTS') or 5)
+
+    # Full-text search: 'fts5' (SQLite), 'memory' (in-process index) or
+    # 'auto' to use FTS5 whenever the database supports it
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND') or 'auto'
+
+    # Incident photos are stored by content hash; the folder must be the
+    # static/uploads directory the templates link to. A background task
+    # renders WebP derivatives whose longest edge is at most these sizes
+    UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER') or os.path.join(basedir, 'static', 'uploads')
+    PHOTO_THUMB_SIZE = int(os.environ.get('PHOTO_THUMB_SIZE') or 320)
+    PHOTO_LARGE_SIZE = int(os.environ.get('PHOTO_LARGE_SIZE') or 1280)
+    # Uploads stream to disk and are refused as soon as they pass the photo
+    # limit; the request limit leaves room for the form fields
+    PHOTO_MAX_BYTES = int(os.environ.get('PHOTO_MAX_BYTES') or 5 * 1024 * 1024)
+    MAX_CONTENT_LENGTH = PHOTO_MAX_BYTES + 1024 * 1024
+
+    # Opt-in SQL instrumentation: per-endpoint query counts and DB time,
+    # a Server-Timing header, and a log of statements slower than
+    # SLOW_QUERY_MS, all reported at /admin/api/sql-stats
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', 'False') == 'True'
+    SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS') or 100)
+    SLOW_QUERY_LOG_SIZE = int(os.environ.get('SLOW_QUERY_LOG_SIZE') or 50)
+
+    # Rows fetched per round trip by the streaming /export endpoints
+    EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE') or 1000)
+
+    # Offline geocoder used to place incidents on the map at approval time;
+    # GEOCODER_GAZETTEER_PATH adds places from a name,lat,lon CSV
+    GEOCODER = os.environ.get('GEOCODER') or 'geo.GazetteerGeocoder'
+    GEOCODER_GAZETTEER_PATH = os.environ.get('GEOCODER_GAZETTEER_PATH')
+    # Upper bound on incidents returned for one map viewport
+    RISKS_MAX_RESULTS = int(os.environ.get('RISKS_MAX_RESULTS') or 1000)
+
+    # Cached JSON for the map APIs is invalidated through a data version
+    # counter; set CACHE_REDIS_URL to share it between web processes. Without
+    # it a process never sees another's bumps, so its entries (and cluster
+    # grids) expire after CACHE_MAX_AGE seconds instead
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+    CACHE_KEY_PREFIX = os.environ.get('CACHE_KEY_PREFIX') or 'travel_diary:'
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES') or 256)
+    CACHE_MAX_AGE = int(os.environ.get('CACHE_MAX_AGE') or 30)
+
+    # Seconds the homepage/dashboard stats snapshot may be served before reload
+    STATS_TTL = int(os.environ.get('STATS_TTL') or 60)
+
+    # Keyset pagination for listings and their JSON endpoints
+    PAGE_SIZE = int(os.environ.get('PAGE_SIZE') or 20)
+    MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE') or 100)
 
     # Google Maps API Key
     GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY')
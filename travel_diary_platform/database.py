@@ -1,5 +1,108 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
 
 db = SQLAlchemy()
 login_manager = LoginManager()
+
+# Backends insert_ignore and insert_or_add can build an upsert for
+SUPPORTED_DIALECTS = ('sqlite', 'postgresql', 'mysql', 'mariadb')
+
+def engine_options(config):
+    """Engine options for the configured database.
+
+    Server databases get a sized, pre-pinged and recycled connection pool;
+    SQLite keeps SQLAlchemy's defaults, since its connections are cheap and
+    tuned through pragmas instead. Anything in SQLALCHEMY_ENGINE_OPTIONS wins.
+    """
+    options = {}
+    if not config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        options.update(
+            pool_size=config['DATABASE_POOL_SIZE'],
+            max_overflow=config['DATABASE_MAX_OVERFLOW'],
+            pool_timeout=config['DATABASE_POOL_TIMEOUT'],
+            pool_recycle=config['DATABASE_POOL_RECYCLE'],
+            pool_pre_ping=config['DATABASE_POOL_PRE_PING'],
+        )
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+def sqlite_pragmas(config):
+    """(name, value) pragmas run on every new SQLite connection, in order"""
+    pragmas = [
+        # Wait for a competing writer instead of failing with "database is locked"
+        ('busy_timeout', config['SQLITE_BUSY_TIMEOUT_MS']),
+        ('journal_mode', config['SQLITE_JOURNAL_MODE']),
+        ('synchronous', config['SQLITE_SYNCHRONOUS']),
+        # Negative sizes are in KiB rather than pages
+        ('cache_size', -config['SQLITE_CACHE_SIZE_KB']),
+        ('mmap_size', config['SQLITE_MMAP_SIZE']),
+    ]
+    return [(name, value) for name, value in pragmas if value not in (None, '')]
+
+def _pragma_listener(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                if name == 'journal_mode':
+                    # Switching modes takes an exclusive lock, so only ask when
+                    # the file is not already in the mode (WAL is persistent)
+                    current = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+                    if current.lower() in (str(value).lower(), 'memory'):
+                        continue
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+    return set_pragmas
+
+def init_app(app):
+    """Set up ``db`` for ``app`` with engine options and SQLite pragmas from its config"""
+    # Refuse other backends now rather than on the first alert or rollup write
+    dialect = make_url(app.config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+    if dialect not in SUPPORTED_DIALECTS:
+        raise ValueError(f'DATABASE_URL uses {dialect}, which is not supported; '
+                         f'use one of {", ".join(SUPPORTED_DIALECTS)}')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    db.init_app(app)
+    with app.app_context():
+        engines = list(db.engines.values())
+    listener = _pragma_listener(sqlite_pragmas(app.config))
+    for engine in engines:
+        if engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', listener)
+
+def insert_ignore(model):
+    """INSERT for ``model`` that skips rows violating a unique constraint"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(model).on_conflict_do_nothing()
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(model).on_conflict_do_nothing()
+    if dialect in ('mysql', 'mariadb'):
+        return db.insert(model).prefix_with('IGNORE')
+    raise NotImplementedError(f'insert_ignore is not supported on {dialect}')
+
+def insert_or_add(model, index_elements, column):
+    """INSERT for ``model`` that adds to ``column`` when the unique key already exists"""
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(model)
+        return stmt.on_conflict_do_update(
+            index_elements=index_elements,
+            set_={column: getattr(model, column) + getattr(stmt.excluded, column)},
+        )
+    if dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        stmt = insert(model)
+        return stmt.on_duplicate_key_update(
+            {column: getattr(model, column) + getattr(stmt.inserted, column)}
+        )
+    raise NotImplementedError(f'insert_or_add is not supported on {dialect}')
@@ -0,0 +1,67 @@
+from database import db, insert_ignore
+from models import DiaryEntry, Comment, Like
+
+
+def _bump(diary_id, column, delta):
+    """Move a diary's counter by ``delta``; returns False if there is no such diary"""
+    return db.session.execute(
+        db.update(DiaryEntry)
+        .where(DiaryEntry.id == diary_id)
+        .values({column: getattr(DiaryEntry, column) + delta})
+    ).rowcount > 0
+
+
+def toggle_like(diary_id, user_id):
+    """Flip a user's like on a diary; returns (liked, like_count).
+
+    The unique (diary_id, user_id) index makes the toggle a single DELETE or
+    INSERT ... ON CONFLICT DO NOTHING, and the counter moves only by the rows
+    actually changed, all inside one transaction. Returns (None, None) if the
+    diary does not exist.
+    """
+    deleted = db.session.execute(
+        db.delete(Like).where(Like.diary_id == diary_id, Like.user_id == user_id)
+    ).rowcount
+    if deleted:
+        liked = False
+        _bump(diary_id, 'like_count', -deleted)
+    else:
+        liked = True
+        inserted = db.session.execute(
+            insert_ignore(Like).values(diary_id=diary_id, user_id=user_id)
+        ).rowcount
+        if inserted:
+            _bump(diary_id, 'like_count', inserted)
+
+    like_count = db.session.execute(
+        db.select(DiaryEntry.like_count).where(DiaryEntry.id == diary_id)
+    ).scalar()
+    if like_count is None:
+        db.session.rollback()
+        return None, None
+    db.session.commit()
+    return liked, like_count
+
+
+def add_comment(diary_id, user_id, body):
+    """Insert a comment and bump the diary's comment counter in one commit.
+
+    Returns None, without inserting, if the diary does not exist.
+    """
+    if not _bump(diary_id, 'comment_count', 1):
+        db.session.rollback()
+        return None
+    comment = Comment(diary_id=diary_id, user_id=user_id, body=body)
+    db.session.add(comment)
+    db.session.commit()
+    return comment
+
+
+def recount_diary_counters():
+    """Recompute every diary's counters from the like and comment tables"""
+    likes = db.select(db.func.count(Like.id)) \
+        .where(Like.diary_id == DiaryEntry.id).scalar_subquery()
+    comments = db.select(db.func.count(Comment.id)) \
+        .where(Comment.diary_id == DiaryEntry.id).scalar_subquery()
+    db.session.execute(db.update(DiaryEntry).values(like_count=likes, comment_count=comments))
+    db.session.commit()
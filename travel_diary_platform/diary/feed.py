@@ -0,0 +1,55 @@
+from collections import namedtuple
+from database import db
+from models import DiaryEntry, Comment, Like
+
+FeedEntry = namedtuple('FeedEntry', 'diary like_count comment_count liked recent_comments')
+
+RECENT_COMMENTS = 3
+
+
+def feed_query(user_id=None):
+    """Diary entries with their author, counts and the viewer's liked flag.
+
+    Counts come from the denormalized counter columns and the liked flag is
+    an EXISTS on the (diary_id, user_id) index, so the whole page is one round
+    trip no matter how many entries it holds.
+    """
+    if user_id is not None:
+        liked = db.exists().where(Like.diary_id == DiaryEntry.id, Like.user_id == user_id)
+    else:
+        liked = db.false()
+    return db.session.query(
+        DiaryEntry,
+        DiaryEntry.like_count,
+        DiaryEntry.comment_count,
+        liked.label('liked'),
+    ).options(db.joinedload(DiaryEntry.author))
+
+
+def recent_comments(diary_ids, limit=RECENT_COMMENTS):
+    """Latest ``limit`` comments for each diary, in a single windowed query"""
+    if not diary_ids:
+        return {}
+    rank = db.func.row_number().over(
+        partition_by=Comment.diary_id,
+        order_by=(Comment.timestamp.desc(), Comment.id.desc()),
+    ).label('rank')
+    ranked = db.select(Comment.id, rank).where(Comment.diary_id.in_(diary_ids)).subquery()
+    comments = Comment.query.join(ranked, ranked.c.id == Comment.id) \
+        .filter(ranked.c.rank <= limit) \
+        .options(db.joinedload(Comment.user)) \
+        .order_by(Comment.diary_id, ranked.c.rank) \
+        .all()
+    by_diary = {}
+    for comment in comments:
+        by_diary.setdefault(comment.diary_id, []).append(comment)
+    return by_diary
+
+
+def build_feed(rows):
+    """Turn ``feed_query`` rows into FeedEntry tuples with recent comments attached"""
+    comments = recent_comments([row[0].id for row in rows])
+    return [
+        FeedEntry(diary, like_count, comment_count, bool(liked), comments.get(diary.id, []))
+        for diary, like_count, comment_count, liked in rows
+    ]
@@ -1,8 +1,14 @@
-from flask import render_template, redirect, url_for, flash, request, jsonify
+from flask import render_template, redirect, url_for, flash, request, jsonify, abort
 from flask_login import login_required, current_user
 from database import db
 from diary import diary_bp
-from models import DiaryEntry, Comment, Like
+from models import DiaryEntry
+from diary.feed import feed_query, build_feed
+from diary import counters
+from stats import invalidate_stats
+import rollups
+from search.index import index_diary, remove_diary
+from pagination import keyset_page, page_args
 
 @diary_bp.route('/create', methods=['GET', 'POST'])
 @login_required
@@ -13,7 +19,11 @@ def create_diary():
         safety_tips = request.form.get('safety_tips')
         diary = DiaryEntry(user_id=current_user.id, title=title, body=body, safety_tips=safety_tips)
         db.session.add(diary)
+        db.session.flush()
+        rollups.diary_created(diary)
+        index_diary(diary)
         db.session.commit()
+        invalidate_stats()
         flash('Diary entry created.')
         return redirect(url_for('diary.view_diaries'))
     return render_template('diary/create_edit.html', action='Create')
@@ -29,7 +39,9 @@ def edit_diary(diary_id):
         diary.title = request.form['title']
         diary.body = request.form['body']
         diary.safety_tips = request.form.get('safety_tips')
+        index_diary(diary)
         db.session.commit()
+        invalidate_stats()
         flash('Diary entry updated.')
         return redirect(url_for('diary.view_diaries'))
     return render_template('diary/create_edit.html', diary=diary, action='Edit')
@@ -42,38 +54,64 @@ def delete_diary(diary_id):
         flash('You do not have permission to delete this diary.')
         return redirect(url_for('diary.view_diaries'))
     db.session.delete(diary)
+    rollups.diary_created(diary, -1)
+    remove_diary(diary.id)
     db.session.commit()
+    invalidate_stats()
     flash('Diary entry deleted.')
     return redirect(url_for('diary.view_diaries'))
 
 @diary_bp.route('/all')
 def view_diaries():
-    diaries = DiaryEntry.query.order_by(DiaryEntry.timestamp.desc()).all()
-    return render_template('diary/all_diaries.html', diaries=diaries)
+    user_id = current_user.id if current_user.is_authenticated else None
+    cursor, limit = page_args()
+    try:
+        page = keyset_page(feed_query(user_id), DiaryEntry, cursor, limit, key=lambda row: row[0])
+    except ValueError:
+        abort(400)
+    return render_template('diary/all_diaries.html', diaries=build_feed(page.items),
+                           next_cursor=page.next_cursor)
+
+@diary_bp.route('/api/diaries')
+def api_diaries():
+    user_id = current_user.id if current_user.is_authenticated else None
+    cursor, limit = page_args()
+    try:
+        page = keyset_page(feed_query(user_id), DiaryEntry, cursor, limit, key=lambda row: row[0])
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    items = []
+    for entry in build_feed(page.items):
+        diary = entry.diary
+        items.append({
+            'id': diary.id,
+            'title': diary.title,
+            'body': diary.body,
+            'safety_tips': diary.safety_tips,
+            'author': diary.author.username if diary.author else None,
+            'timestamp': diary.timestamp.isoformat(),
+            'like_count': entry.like_count,
+            'comment_count': entry.comment_count,
+            'liked': entry.liked
+        })
+    return jsonify({'items': items, 'next_cursor': page.next_cursor})
 
 @diary_bp.route('/comment', methods=['POST'])
 @login_required
 def add_comment():
-    diary_id = request.form['diary_id']
+    diary_id = request.form.get('diary_id', type=int)
+    if diary_id is None:
+        abort(400)
     body = request.form['body']
-    comment = Comment(diary_id=diary_id, user_id=current_user.id, body=body)
-    db.session.add(comment)
-    db.session.commit()
+    if counters.add_comment(diary_id, current_user.id, body) is None:
+        return jsonify({'status': 'error', 'message': 'Diary not found'}), 404
     return jsonify({'status': 'success', 'comment': body})
 
 @diary_bp.route('/like', methods=['POST'])
 @login_required
 def like_diary():
-    diary_id = request.form['diary_id']
-    like = Like.query.filter_by(diary_id=diary_id, user_id=current_user.id).first()
-    if like:
-        db.session.delete(like)
-        db.session.commit()
-        liked = False
-    else:
-        new_like = Like(diary_id=diary_id, user_id=current_user.id)
-        db.session.add(new_like)
-        db.session.commit()
-        liked = True
-    like_count = Like.query.filter_by(diary_id=diary_id).count()
+    diary_id = request.form.get('diary_id', type=int)
+    liked, like_count = counters.toggle_like(diary_id, current_user.id)
+    if liked is None:
+        return jsonify({'status': 'error', 'message': 'Diary not found'}), 404
     return jsonify({'liked': liked, 'like_count': like_count})
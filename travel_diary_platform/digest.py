@@ -0,0 +1,140 @@
+from datetime import datetime, timedelta
+from database import db
+from fanout import pick_channel
+from models import AlertDelivery, Incident, PendingDigestItem
+
+DIGEST_ITEMS = 10
+
+
+def queue_digest_items(incident_id, recipients):
+    """Buffer an incident for each claimed recipient instead of messaging them now.
+
+    The matching deliveries move to ``queued`` so a retry of the incident
+    task neither re-queues nor re-sends them. Commits.
+    """
+    if not recipients:
+        return 0
+    db.session.execute(db.insert(PendingDigestItem), [
+        {'user_id': recipient.id, 'incident_id': incident_id, 'channel': pick_channel(recipient)[0]}
+        for recipient in recipients
+    ])
+    db.session.execute(
+        db.update(AlertDelivery)
+        .where(AlertDelivery.incident_id == incident_id,
+               AlertDelivery.user_id.in_([recipient.id for recipient in recipients]),
+               AlertDelivery.status == 'pending')
+        .values(status='queued')
+    )
+    db.session.commit()
+    return len(recipients)
+
+
+def due_digest_users(window, max_latency, limit, now=None):
+    """Ids of users whose buffer is ready to flush.
+
+    A buffer is due once it has been quiet for ``window`` seconds (no new
+    item), or once its oldest item has waited ``max_latency`` seconds, so a
+    steady stream of approvals cannot hold a digest back forever.
+    """
+    now = now or datetime.utcnow()
+    return db.session.execute(
+        db.select(PendingDigestItem.user_id)
+        .where(PendingDigestItem.claim.is_(None))
+        .group_by(PendingDigestItem.user_id)
+        .having(db.or_(
+            db.func.max(PendingDigestItem.created_at) <= now - timedelta(seconds=window),
+            db.func.min(PendingDigestItem.created_at) <= now - timedelta(seconds=max_latency),
+        ))
+        .order_by(PendingDigestItem.user_id)
+        .limit(limit)
+    ).scalars().all()
+
+
+def claim_digest_items(user_ids, claim):
+    """Tag the unclaimed items of ``user_ids`` with ``claim``; returns {user_id: [incident rows]}.
+
+    Rejecting an incident deletes its items, so only live incidents are
+    returned. Commits, so a concurrent flush sees the claim and skips these users.
+    """
+    db.session.execute(
+        db.update(PendingDigestItem)
+        .where(PendingDigestItem.user_id.in_(user_ids), PendingDigestItem.claim.is_(None))
+        .values(claim=claim)
+    )
+    rows = db.session.execute(
+        db.select(PendingDigestItem.user_id, PendingDigestItem.incident_id,
+                  Incident.location, Incident.category, Incident.description)
+        .join(Incident, Incident.id == PendingDigestItem.incident_id)
+        .where(PendingDigestItem.claim == claim)
+        .order_by(PendingDigestItem.user_id, PendingDigestItem.created_at, PendingDigestItem.id)
+    ).all()
+    db.session.commit()
+    items = {}
+    for row in rows:
+        items.setdefault(row.user_id, []).append(row)
+    return items
+
+
+def compose_digest(items, single):
+    """(subject, message) for one recipient's buffered incidents.
+
+    A lone incident is sent in the normal single-alert format via ``single``
+    (called with the incident row); several are summarised in one message.
+    """
+    if len(items) == 1:
+        return single(items[0])
+    lines = [f"🚨 TRAVEL SAFETY DIGEST: {len(items)} NEW INCIDENTS 🚨", ""]
+    for item in items[:DIGEST_ITEMS]:
+        description = item.description[:100] + ('...' if len(item.description) > 100 else '')
+        lines.append(f"- {item.category.title()} at {item.location}: {description}")
+    if len(items) > DIGEST_ITEMS:
+        lines.append(f"- ...and {len(items) - DIGEST_ITEMS} more on the safety map")
+    lines += ["", "Stay safe and be aware of your surroundings.", "", "- Travel Diary Platform"]
+    return f"Safety Alerts: {len(items)} new incidents", '\n'.join(lines)
+
+
+def finish_digests(items, results, claim, max_attempts):
+    """Record per-incident delivery outcomes for a flushed chunk.
+
+    Sent items are dropped. Failed items are released back into the buffer
+    as if just queued, so a later flush retries them once the window has
+    passed; after ``max_attempts`` sends their deliveries are marked failed
+    and the items dropped. Runs in the caller's transaction.
+    """
+    now = datetime.utcnow()
+    retry = [user_id for user_id, (channel, ok) in results.items() if channel and not ok]
+    if retry:
+        db.session.execute(
+            db.update(PendingDigestItem)
+            .where(PendingDigestItem.claim == claim,
+                   PendingDigestItem.user_id.in_(retry),
+                   PendingDigestItem.attempts + 1 < max_attempts)
+            .values(claim=None, created_at=now, attempts=PendingDigestItem.attempts + 1)
+        )
+    # Whatever failed and is still claimed has run out of attempts (or channels)
+    outcomes = {
+        'sent': [(user_id, item.incident_id)
+                 for user_id, (channel, ok) in results.items() if ok
+                 for item in items.get(user_id, [])],
+        'failed': db.session.execute(
+            db.select(PendingDigestItem.user_id, PendingDigestItem.incident_id)
+            .where(PendingDigestItem.claim == claim,
+                   PendingDigestItem.user_id.in_([user_id for user_id, (channel, ok)
+                                                  in results.items() if not ok]))
+        ).all(),
+    }
+    for status, pairs in outcomes.items():
+        if not pairs:
+            continue
+        db.session.execute(
+            db.update(AlertDelivery)
+            .where(db.tuple_(AlertDelivery.user_id, AlertDelivery.incident_id).in_(
+                       [tuple(pair) for pair in pairs]),
+                   AlertDelivery.status == 'queued')
+            .values(status=status, sent_at=now if status == 'sent' else None)
+        )
+    db.session.execute(
+        db.delete(PendingDigestItem)
+        .where(PendingDigestItem.claim == claim,
+               PendingDigestItem.user_id.in_(list(results)))
+    )
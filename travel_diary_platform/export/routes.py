@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta
+from flask import Response, request, jsonify, current_app, stream_with_context
+from export import export_bp
+from export.stream import (FORMATS, INCIDENT_FIELDS, DIARY_FIELDS, incident_rows, diary_rows,
+                           export_stream)
+
+def export_args():
+    """Parse format, gzip and the date window; raises ValueError for bad input"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        raise ValueError(f'format must be one of {", ".join(FORMATS)}')
+    since = request.args.get('since')
+    until = request.args.get('until')
+    # Dates are inclusive days; ``until`` covers the whole of its day
+    since = datetime.fromisoformat(since) if since else None
+    until = datetime.fromisoformat(until) + timedelta(days=1) if until else None
+    gzip = request.args.get('gzip') in ('1', 'true')
+    return fmt, gzip, since, until
+
+def export_response(name, rows, fields, fmt, gzip):
+    """Stream ``rows`` as a download; the request context stays open until the last row"""
+    filename = f'{name}.{fmt}' + ('.gz' if gzip else '')
+    body = stream_with_context(export_stream(rows, fields, fmt, gzip))
+    response = Response(body, mimetype='application/gzip' if gzip else FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    # Ask a buffering reverse proxy to pass chunks through as they are written
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@export_bp.route('/incidents')
+def export_incidents():
+    try:
+        fmt, gzip, since, until = export_args()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    rows = incident_rows(since, until, request.args.get('category') or None,
+                         current_app.config['EXPORT_BATCH_SIZE'])
+    return export_response('incidents', rows, INCIDENT_FIELDS, fmt, gzip)
+
+@export_bp.route('/diaries')
+def export_diaries():
+    try:
+        fmt, gzip, since, until = export_args()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    rows = diary_rows(since, until, current_app.config['EXPORT_BATCH_SIZE'])
+    return export_response('diaries', rows, DIARY_FIELDS, fmt, gzip)
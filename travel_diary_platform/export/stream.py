@@ -0,0 +1,114 @@
+import csv
+import json
+import zlib
+from datetime import datetime
+from database import db
+from models import DiaryEntry, Incident, User
+
+INCIDENT_FIELDS = ('id', 'location', 'category', 'description', 'timestamp',
+                   'latitude', 'longitude', 'geohash')
+DIARY_FIELDS = ('id', 'title', 'body', 'safety_tips', 'author', 'timestamp',
+                'like_count', 'comment_count')
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+# Serialized lines are gathered into chunks of about this many bytes before
+# being handed to the server, so a large export is not one write per row
+CHUNK_SIZE = 64 * 1024
+
+
+def _window(column, since=None, until=None):
+    clauses = []
+    if since:
+        clauses.append(column >= since)
+    if until:
+        clauses.append(column < until)
+    return clauses
+
+
+def incident_rows(since=None, until=None, category=None, batch_size=1000):
+    """Approved incidents as plain rows, in id order.
+
+    ``yield_per`` makes the driver fetch ``batch_size`` rows at a time (a
+    server-side cursor where the database supports one), so memory stays flat
+    however many rows the export covers.
+    """
+    query = (db.select(*[getattr(Incident, field) for field in INCIDENT_FIELDS])
+             .where(Incident.approved == True,
+                    *_window(Incident.timestamp, since, until))
+             .order_by(Incident.id))
+    if category:
+        query = query.where(Incident.category == category)
+    return db.session.execute(query.execution_options(yield_per=batch_size))
+
+
+def diary_rows(since=None, until=None, batch_size=1000):
+    """Diary entries with their author's username, in id order; see ``incident_rows``"""
+    query = (db.select(DiaryEntry.id, DiaryEntry.title, DiaryEntry.body, DiaryEntry.safety_tips,
+                       User.username.label('author'), DiaryEntry.timestamp,
+                       DiaryEntry.like_count, DiaryEntry.comment_count)
+             .outerjoin(User, User.id == DiaryEntry.user_id)
+             .where(*_window(DiaryEntry.timestamp, since, until))
+             .order_by(DiaryEntry.id))
+    return db.session.execute(query.execution_options(yield_per=batch_size))
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def ndjson_lines(rows, fields):
+    """One JSON object per row, newline-terminated"""
+    for row in rows:
+        yield json.dumps({field: _value(value) for field, value in zip(fields, row)},
+                         ensure_ascii=False) + '\n'
+
+
+class _Line:
+    """Write target that hands csv.writer's output straight back"""
+
+    def write(self, text):
+        return text
+
+
+def csv_lines(rows, fields):
+    """A header line followed by one CSV line per row"""
+    writer = csv.writer(_Line())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([_value(value) for value in row])
+
+
+def encode(lines, chunk_size=CHUNK_SIZE):
+    """UTF-8 encode ``lines`` and regroup them into chunks of about ``chunk_size`` bytes"""
+    buffer, size = [], 0
+    for line in lines:
+        data = line.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= chunk_size:
+            yield b''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress a byte stream into gzip format incrementally"""
+    # wbits 16 + MAX_WBITS selects the gzip container rather than raw zlib
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(rows, fields, fmt, gzip=False):
+    """Byte chunks of ``rows`` serialized as ``fmt``, optionally gzipped"""
+    lines = ndjson_lines(rows, fields) if fmt == 'ndjson' else csv_lines(rows, fields)
+    chunks = encode(lines)
+    return gzip_chunks(chunks) if gzip else chunks
@@ -0,0 +1,214 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime
+from database import db, insert_ignore
+from models import User, Preference, AlertDelivery
+from subscriptions import subscribers_for
+
+
+def recipient_query(incident=None, broadcast_untargeted=True):
+    """Query for users who opted in to at least one alert channel.
+
+    With an ``incident`` the audience narrows to users whose area of interest
+    contains its geohash, found through the cell index, plus users with no
+    area at all when ``broadcast_untargeted`` is set. An incident that was
+    never located only reaches those untargeted users.
+    """
+    query = db.session.query(
+        User.id,
+        Preference.alert_via_whatsapp,
+        Preference.whatsapp_number,
+        Preference.alert_via_email,
+        Preference.email,
+    ).join(Preference, Preference.user_id == User.id).filter(
+        (Preference.alert_via_whatsapp == True) |
+        (Preference.alert_via_email == True)
+    )
+    if incident is None:
+        return query
+
+    audience = []
+    if incident.geohash:
+        audience.append(User.id.in_(subscribers_for(incident.geohash)))
+    if broadcast_untargeted:
+        audience.append(Preference.geo_targeted == False)
+    if not audience:
+        return query.filter(db.false())
+    return query.filter(db.or_(*audience))
+
+
+def iter_recipient_chunks(query, chunk_size):
+    """Stream recipient rows in chunks using keyset pagination on user id.
+
+    Only one chunk is held in memory at a time, and each chunk is a single
+    indexed range query, so the cost per chunk does not grow with the offset.
+    """
+    last_id = 0
+    while True:
+        rows = query.filter(User.id > last_id).order_by(User.id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+        if len(rows) < chunk_size:
+            return
+
+
+def pick_channel(recipient):
+    """Return (channel, address) for a recipient, preferring WhatsApp over email"""
+    if recipient.alert_via_whatsapp and recipient.whatsapp_number:
+        return 'whatsapp', recipient.whatsapp_number
+    elif recipient.alert_via_email and recipient.email:
+        return 'email', recipient.email
+    return None, None
+
+
+def claim_deliveries(incident_id, chunk, claim):
+    """Return the recipients in ``chunk`` this run may alert about ``incident_id``.
+
+    Each reachable recipient gets an (incident, user, channel) delivery row
+    via INSERT ... ON CONFLICT DO NOTHING tagged with ``claim``; rows left
+    ``failed`` by an earlier run are re-tagged. Only rows carrying this run's
+    tag are returned, so a retried or duplicated task skips everyone already
+    alerted or being alerted by another run.
+    """
+    channels = {}
+    for recipient in chunk:
+        channel, _ = pick_channel(recipient)
+        if channel:
+            channels[recipient.id] = channel
+    if not channels:
+        return []
+
+    db.session.execute(insert_ignore(AlertDelivery), [
+        {'incident_id': incident_id, 'user_id': user_id, 'channel': channel,
+         'status': 'pending', 'claim': claim, 'attempts': 1}
+        for user_id, channel in channels.items()
+    ])
+    db.session.execute(
+        db.update(AlertDelivery)
+        .where(AlertDelivery.incident_id == incident_id,
+               AlertDelivery.user_id.in_(list(channels)),
+               AlertDelivery.status == 'failed')
+        .values(status='pending', claim=claim, attempts=AlertDelivery.attempts + 1)
+    )
+    claimed = set(db.session.execute(
+        db.select(AlertDelivery.user_id)
+        .where(AlertDelivery.incident_id == incident_id,
+               AlertDelivery.claim == claim,
+               AlertDelivery.status == 'pending')
+        .where(AlertDelivery.user_id.in_(list(channels)))
+    ).scalars())
+    db.session.commit()
+    return [recipient for recipient in chunk if recipient.id in claimed]
+
+
+def record_deliveries(incident_id, results):
+    """Mark claimed deliveries sent or failed from ``AlertFanout`` chunk results"""
+    sent = [user_id for user_id, (channel, success) in results.items() if channel and success]
+    failed = [user_id for user_id, (channel, success) in results.items() if channel and not success]
+    if sent:
+        db.session.execute(
+            db.update(AlertDelivery)
+            .where(AlertDelivery.incident_id == incident_id, AlertDelivery.user_id.in_(sent))
+            .values(status='sent', sent_at=datetime.utcnow())
+        )
+    if failed:
+        db.session.execute(
+            db.update(AlertDelivery)
+            .where(AlertDelivery.incident_id == incident_id, AlertDelivery.user_id.in_(failed))
+            .values(status='failed')
+        )
+
+
+class AlertFanout:
+    """Send one message to many recipients with bounded, per-channel concurrency.
+
+    ``senders`` maps a channel name to a callable taking ``(address, subject,
+    message)`` and returning True on success. Each channel sends on its own
+    thread pool of ``channel_limits[channel]`` threads (``max_workers`` when
+    unset), so sends queued behind a slow provider wait in that channel's queue
+    without holding threads another channel could use. Chunks are processed one
+    after another, which keeps the number of in-flight sends (and memory)
+    bounded by ``chunk_size``.
+    """
+
+    def __init__(self, senders, max_workers=16, channel_limits=None):
+        self.senders = senders
+        self.max_workers = max_workers
+        channel_limits = channel_limits or {}
+        self._limits = {
+            channel: channel_limits.get(channel) or max_workers
+            for channel in senders
+        }
+
+    def _send(self, channel, address, subject, message):
+        try:
+            return bool(self.senders[channel](address, subject, message))
+        except Exception as e:
+            print(f"Error sending {channel} alert to {address}: {str(e)}")
+            return False
+
+    def run(self, chunks, subject, message, on_chunk=None, on_progress=None, compose=None):
+        """Fan ``message`` out to every recipient yielded by ``chunks``.
+
+        ``compose(recipient)``, if given, returns a per-recipient
+        ``(subject, message)`` in place of the shared one.
+
+        ``on_chunk(chunk, results)`` is called on the calling thread after each
+        chunk with ``results`` mapping recipient id to ``(channel, success)``,
+        so database writes never happen on the pool threads. ``on_progress``
+        receives the running totals after each chunk.
+        """
+        stats = {'recipients': 0, 'sent': 0, 'failed': 0, 'skipped': 0, 'chunks': 0}
+        started = time.monotonic()
+
+        with ExitStack() as stack:
+            executors = {
+                channel: stack.enter_context(ThreadPoolExecutor(
+                    max_workers=limit, thread_name_prefix=f'alert-{channel}'))
+                for channel, limit in self._limits.items()
+            }
+            for chunk in chunks:
+                chunk_started = time.monotonic()
+                futures = {}
+                results = {}
+                for recipient in chunk:
+                    channel, address = pick_channel(recipient)
+                    if channel is None or channel not in self.senders:
+                        results[recipient.id] = (None, False)
+                        stats['skipped'] += 1
+                        continue
+                    if compose:
+                        recipient_subject, recipient_message = compose(recipient)
+                    else:
+                        recipient_subject, recipient_message = subject, message
+                    futures[recipient.id] = (channel, executors[channel].submit(
+                        self._send, channel, address, recipient_subject, recipient_message))
+
+                for recipient_id, (channel, future) in futures.items():
+                    success = future.result()
+                    results[recipient_id] = (channel, success)
+                    if success:
+                        stats['sent'] += 1
+                    else:
+                        stats['failed'] += 1
+
+                if on_chunk:
+                    on_chunk(chunk, results)
+
+                chunk_elapsed = time.monotonic() - chunk_started
+                stats['chunks'] += 1
+                stats['recipients'] += len(chunk)
+                stats['last_chunk_size'] = len(chunk)
+                stats['last_chunk_seconds'] = round(chunk_elapsed, 3)
+                stats['last_chunk_rate'] = round(len(chunk) / chunk_elapsed, 1) if chunk_elapsed else None
+                stats['elapsed'] = round(time.monotonic() - started, 3)
+                print(f"Alert fan-out chunk {stats['chunks']}: {len(chunk)} recipients "
+                      f"in {chunk_elapsed:.2f}s ({stats['last_chunk_rate']} recipients/s)")
+                if on_progress:
+                    on_progress(dict(stats))
+
+        stats['elapsed'] = round(time.monotonic() - started, 3)
+        return stats
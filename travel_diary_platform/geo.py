@@ -0,0 +1,289 @@
+import csv
+import math
+import re
+from werkzeug.utils import import_string
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+GEOHASH_PRECISION = 12
+KM_PER_DEGREE = 111.32
+
+# Geohash length to use for a Google Maps zoom level, chosen so that a typical
+# viewport is covered by a handful of cells
+_ZOOM_PRECISION = [1, 1, 1, 2, 2, 3, 3, 3, 4, 4, 5, 5, 5, 6, 6, 7, 7, 8, 8, 8, 8, 8, 8]
+
+
+def encode(lat, lon, precision=GEOHASH_PRECISION):
+    """Encode a point as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        rng, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def decode_bbox(geohash):
+    """Return (min_lat, min_lon, max_lat, max_lon) of a geohash cell"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            rng = lon_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if value >> shift & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return lat_range[0], lon_range[0], lat_range[1], lon_range[1]
+
+
+def decode(geohash):
+    """Return the (lat, lon) centre of a geohash cell"""
+    min_lat, min_lon, max_lat, max_lon = decode_bbox(geohash)
+    return (min_lat + max_lat) / 2, (min_lon + max_lon) / 2
+
+
+def cell_size(precision):
+    """Return (height, width) in degrees of a cell at ``precision``"""
+    bits = 5 * precision
+    lon_bits = (bits + 1) // 2
+    lat_bits = bits // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def cover_bbox(min_lat, min_lon, max_lat, max_lon, precision):
+    """Return the set of geohash cells at ``precision`` intersecting a box"""
+    height, width = cell_size(precision)
+    cells = set()
+    lat = max(min_lat, -90.0)
+    max_lat = min(max_lat, 90.0)
+    while True:
+        lon = min_lon
+        while True:
+            cells.add(encode(min(lat, 90.0 - 1e-9), min(lon, 180.0 - 1e-9), precision))
+            if lon >= max_lon:
+                break
+            lon = min(lon + width, max_lon)
+        if lat >= max_lat:
+            break
+        lat = min(lat + height, max_lat)
+    return cells
+
+
+def count_cover(min_lat, min_lon, max_lat, max_lon, precision):
+    """Estimate how many cells ``cover_bbox`` would return, without building them"""
+    height, width = cell_size(precision)
+    rows = math.floor(max_lat / height) - math.floor(min_lat / height) + 1
+    cols = math.floor(max_lon / width) - math.floor(min_lon / width) + 1
+    return rows * cols
+
+
+def precision_for_zoom(zoom):
+    """Geohash precision matching a map zoom level"""
+    zoom = max(0, min(int(zoom), len(_ZOOM_PRECISION) - 1))
+    return _ZOOM_PRECISION[zoom]
+
+
+def precision_for_bbox(min_lat, min_lon, max_lat, max_lon, max_cells=32):
+    """Finest precision whose cover of the box stays within ``max_cells``"""
+    precision = 1
+    for candidate in range(2, GEOHASH_PRECISION + 1):
+        if count_cover(min_lat, min_lon, max_lat, max_lon, candidate) > max_cells:
+            break
+        precision = candidate
+    return precision
+
+
+def cover_radius(lat, lon, radius_km, max_cells=32):
+    """Cells covering the box around a circle, at the finest precision within ``max_cells``.
+
+    Small radii get small cells and large radii coarse ones, so every area of
+    interest costs at most ``max_cells`` index rows.
+    """
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    min_lon, max_lon = lon - dlon, lon + dlon
+    if dlon >= 180:
+        boxes = [(min_lat, -180.0, max_lat, 180.0)]
+    elif min_lon < -180:
+        boxes = [(min_lat, min_lon + 360, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
+    elif max_lon > 180:
+        boxes = [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon - 360)]
+    else:
+        boxes = [(min_lat, min_lon, max_lat, max_lon)]
+    precision = min(precision_for_bbox(*box, max_cells=max_cells // len(boxes)) for box in boxes)
+    cells = set()
+    for box in boxes:
+        cells |= cover_bbox(*box, precision)
+    return cells
+
+
+def prefixes(geohash):
+    """Every prefix of a geohash, coarsest first"""
+    return [geohash[:i] for i in range(1, len(geohash) + 1)]
+
+
+def parse_bbox(value):
+    """Parse ``min_lon,min_lat,max_lon,max_lat`` into a list of boxes.
+
+    Boxes are returned as (min_lat, min_lon, max_lat, max_lon). A viewport that
+    crosses the antimeridian (min_lon > max_lon) is split in two. Raises
+    ValueError for malformed input.
+    """
+    parts = [float(part) for part in value.split(',')]
+    if len(parts) != 4:
+        raise ValueError('bbox must have four comma-separated numbers')
+    min_lon, min_lat, max_lon, max_lat = parts
+    if not (-90 <= min_lat <= max_lat <= 90) or not (-180 <= min_lon <= 180 and -180 <= max_lon <= 180):
+        raise ValueError('bbox is out of range')
+    if min_lon > max_lon:
+        return [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
+    return [(min_lat, min_lon, max_lat, max_lon)]
+
+
+class Geocoder:
+    """Resolve a free-text location to a (lat, lon) pair, or None"""
+
+    def geocode(self, location):
+        raise NotImplementedError
+
+
+# Places the safety map used to fake client-side, plus common destinations
+DEFAULT_GAZETTEER = {
+    'new york': (40.7128, -74.0060),
+    'london': (51.5074, -0.1278),
+    'paris': (48.8566, 2.3522),
+    'tokyo': (35.6762, 139.6503),
+    'sydney': (-33.8688, 151.2093),
+    'rome': (41.9028, 12.4964),
+    'bangkok': (13.7563, 100.5018),
+    'barcelona': (41.3851, 2.1734),
+    'amsterdam': (52.3676, 4.9041),
+    'berlin': (52.5200, 13.4050),
+    'madrid': (40.4168, -3.7038),
+    'lisbon': (38.7223, -9.1393),
+    'istanbul': (41.0082, 28.9784),
+    'dubai': (25.2048, 55.2708),
+    'singapore': (1.3521, 103.8198),
+    'hong kong': (22.3193, 114.1694),
+    'mumbai': (19.0760, 72.8777),
+    'delhi': (28.7041, 77.1025),
+    'cairo': (30.0444, 31.2357),
+    'cape town': (-33.9249, 18.4241),
+    'rio de janeiro': (-22.9068, -43.1729),
+    'buenos aires': (-34.6037, -58.3816),
+    'mexico city': (19.4326, -99.1332),
+    'los angeles': (34.0522, -118.2437),
+    'san francisco': (37.7749, -122.4194),
+    'toronto': (43.6532, -79.3832),
+}
+
+_LATLON = re.compile(r'^\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*$')
+
+
+class GazetteerGeocoder(Geocoder):
+    """Offline geocoder backed by a place-name table.
+
+    Accepts literal ``lat, lon`` strings, otherwise returns the coordinates of
+    the longest place name found as whole words in the location text, so
+    'Jerome Ave' is not Rome. Extra places can be loaded from a
+    ``name,lat,lon`` CSV file.
+    """
+
+    def __init__(self, places=None, path=None):
+        self.places = dict(DEFAULT_GAZETTEER if places is None else places)
+        if path:
+            with open(path, newline='', encoding='utf-8') as f:
+                for row in csv.reader(f):
+                    if len(row) >= 3 and not row[0].startswith('#'):
+                        self.places[row[0].strip().lower()] = (float(row[1]), float(row[2]))
+        # Longest names first so 'new york' wins over 'york' at the same
+        # position; names may contain punctuation, so words are delimited
+        # by lookarounds rather than \b
+        names = sorted(self.places, key=len, reverse=True)
+        self._pattern = re.compile(
+            r'(?<!\w)(?:%s)(?!\w)' % '|'.join(re.escape(name) for name in names))
+
+    def geocode(self, location):
+        if not location:
+            return None
+        match = _LATLON.match(location)
+        if match:
+            lat, lon = float(match.group(1)), float(match.group(2))
+            if -90 <= lat <= 90 and -180 <= lon <= 180:
+                return lat, lon
+        names = self._pattern.findall(location.lower())
+        if not names:
+            return None
+        return self.places[max(names, key=len)]
+
+
+_geocoder = None
+
+
+def get_geocoder(config=None):
+    """Return the configured geocoder (``GEOCODER`` is a dotted class path)"""
+    global _geocoder
+    if _geocoder is None:
+        if config is None:
+            from flask import current_app
+            config = current_app.config
+        geocoder_class = import_string(config.get('GEOCODER', 'geo.GazetteerGeocoder'))
+        if issubclass(geocoder_class, GazetteerGeocoder):
+            _geocoder = geocoder_class(path=config.get('GEOCODER_GAZETTEER_PATH'))
+        else:
+            _geocoder = geocoder_class()
+    return _geocoder
+
+
+def geocode_incident(incident):
+    """Fill an incident's coordinates and geohash; returns True if it was located"""
+    point = get_geocoder().geocode(incident.location)
+    if point is None:
+        return False
+    incident.latitude, incident.longitude = point
+    incident.geohash = encode(*point)
+    return True
+
+
+def geocode_missing_incidents(batch_size=500):
+    """Geocode approved incidents that have no geohash yet, e.g. ones approved
+    before incidents were geocoded; returns (located, checked). Commits per batch.
+    """
+    from database import db
+    from models import Incident
+
+    located = checked = last_id = 0
+    while True:
+        batch = Incident.query.filter(
+            Incident.approved == True, Incident.geohash.is_(None), Incident.id > last_id,
+        ).order_by(Incident.id).limit(batch_size).all()
+        if not batch:
+            return located, checked
+        for incident in batch:
+            located += geocode_incident(incident)
+        checked += len(batch)
+        last_id = batch[-1].id
+        db.session.commit()
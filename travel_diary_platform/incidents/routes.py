@@ -1,17 +1,17 @@
-import os
-from flask import render_template, redirect, url_for, flash, request, current_app
+from flask import render_template, redirect, url_for, flash, request, jsonify, abort
 from flask_login import login_required, current_user
-from werkzeug.utils import secure_filename
 from database import db
 from incidents import incidents_bp
 from models import Incident
+from pagination import keyset_page, page_args
+from stats import invalidate_stats
+import rollups
+from search.index import index_incident
+import outbox
+import photos
 
-UPLOAD_FOLDER = 'travel_diary_platform/static/uploads'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+def incident_query():
+    return Incident.query.options(db.joinedload(Incident.reporter))
 
 @incidents_bp.route('/report', methods=['GET', 'POST'])
 @login_required
@@ -21,16 +21,27 @@ def report_incident():
         category = request.form['category']
         description = request.form['description']
         photo = request.files.get('photo')
-        filename = None
-        if photo and allowed_file(photo.filename):
-            filename = secure_filename(photo.filename)
-            # Ensure upload directory exists
-            os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-            photo.save(os.path.join(UPLOAD_FOLDER, filename))
+        filename = status = None
+        if photo and photos.allowed_file(photo.filename):
+            # Already on disk and hashed by the request parser; storing it is a
+            # rename under its content hash, so re-uploads share one file
+            filename, created = photos.store_upload(photo)
+            status = photos.READY if not created and photos.has_derivatives(filename) \
+                else photos.PENDING
         incident = Incident(user_id=current_user.id, location=location, category=category,
-                            description=description, photo_filename=filename)
+                            description=description, photo_filename=filename, photo_status=status)
         db.session.add(incident)
+        db.session.flush()
+        if status == photos.PENDING:
+            # Thumbnails are rendered by a worker once the report has committed
+            outbox.enqueue('photo.stored', {'name': filename})
+        elif filename is None and photo and photo.filename:
+            flash('Photos must be PNG, JPG or GIF files; the report was saved without it.')
+        rollups.incident_reported(incident)
+        # Reports are only searchable once approved; this keeps the index honest
+        index_incident(incident)
         db.session.commit()
+        invalidate_stats()
         flash('Incident reported successfully. Awaiting admin approval.')
         return redirect(url_for('incidents.report_incident'))
     return render_template('incidents/report.html')
@@ -38,5 +49,31 @@ def report_incident():
 @incidents_bp.route('/list')
 @login_required
 def list_incidents():
-    incidents = Incident.query.order_by(Incident.timestamp.desc()).all()
-    return render_template('incidents/list.html', incidents=incidents)
+    cursor, limit = page_args()
+    try:
+        page = keyset_page(incident_query(), Incident, cursor, limit)
+    except ValueError:
+        abort(400)
+    return render_template('incidents/list.html', incidents=page.items,
+                           next_cursor=page.next_cursor)
+
+@incidents_bp.route('/api/incidents')
+@login_required
+def api_incidents():
+    cursor, limit = page_args()
+    try:
+        page = keyset_page(incident_query(), Incident, cursor, limit)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    items = []
+    for incident in page.items:
+        items.append({
+            'id': incident.id,
+            'location': incident.location,
+            'category': incident.category,
+            'description': incident.description,
+            'approved': incident.approved,
+            'reporter': incident.reporter.username if incident.reporter else None,
+            'timestamp': incident.timestamp.isoformat()
+        })
+    return jsonify({'items': items, 'next_cursor': page.next_cursor})
@@ -0,0 +1,133 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from database import db
+
+PARAMETERS_PREVIEW = 200
+
+
+class QueryStats:
+    """Per-endpoint SQL counts and timings, plus a ring buffer of slow statements.
+
+    Aggregates live in process memory, so with several workers each one
+    reports its own share of the traffic.
+    """
+
+    def __init__(self, slow_ms=100, slow_log_size=50):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._slow = deque(maxlen=slow_log_size)
+
+    def record_request(self, endpoint, queries, db_seconds, request_seconds):
+        with self._lock:
+            stats = self._endpoints.setdefault(endpoint, {
+                'requests': 0, 'queries': 0, 'max_queries': 0, 'db_time': 0.0, 'request_time': 0.0,
+            })
+            stats['requests'] += 1
+            stats['queries'] += queries
+            stats['max_queries'] = max(stats['max_queries'], queries)
+            stats['db_time'] += db_seconds
+            stats['request_time'] += request_seconds
+
+    def record_slow(self, endpoint, statement, parameters, seconds):
+        with self._lock:
+            self._slow.append({
+                'endpoint': endpoint,
+                'statement': statement,
+                'parameters': repr(parameters)[:PARAMETERS_PREVIEW],
+                'duration_ms': round(seconds * 1000, 2),
+                'at': datetime.utcnow().isoformat(),
+            })
+
+    def snapshot(self):
+        """Endpoints by total DB time (busiest first) and the slow statements, newest first"""
+        with self._lock:
+            endpoints = [dict(stats, endpoint=endpoint) for endpoint, stats in self._endpoints.items()]
+            slow = list(reversed(self._slow))
+        endpoints.sort(key=lambda stats: stats['db_time'], reverse=True)
+        return {
+            'endpoints': [{
+                'endpoint': stats['endpoint'],
+                'requests': stats['requests'],
+                'queries': stats['queries'],
+                'avg_queries': round(stats['queries'] / stats['requests'], 2),
+                'max_queries': stats['max_queries'],
+                'db_ms': round(stats['db_time'] * 1000, 2),
+                'avg_db_ms': round(stats['db_time'] * 1000 / stats['requests'], 2),
+                'avg_request_ms': round(stats['request_time'] * 1000 / stats['requests'], 2),
+            } for stats in endpoints],
+            'slow_queries': slow,
+        }
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+            self._slow.clear()
+
+
+def instrument_engine(engine, stats):
+    """Time every statement ``engine`` runs, adding it to the current request's counters"""
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        endpoint = None
+        if has_request_context():
+            endpoint = request.endpoint
+            counters = g.get('sql_counters')
+            if counters is not None:
+                counters[0] += 1
+                counters[1] += elapsed
+        if elapsed * 1000 >= stats.slow_ms:
+            stats.record_slow(endpoint, statement, parameters, elapsed)
+            print(f"Slow query ({elapsed * 1000:.1f} ms) in {endpoint or 'background'}: "
+                  f"{statement[:200]}")
+
+
+def _start_request():
+    g.sql_counters = [0, 0.0]
+    g.request_started = time.perf_counter()
+
+
+def _finish_request(response):
+    counters = g.pop('sql_counters', None)
+    if counters is None:
+        return response
+    queries, db_seconds = counters
+    request_seconds = time.perf_counter() - g.pop('request_started')
+    current_app.extensions['query_stats'].record_request(
+        request.endpoint or 'unmatched', queries, db_seconds, request_seconds)
+    # Streamed bodies are still running here; their queries are not counted
+    response.headers.add('Server-Timing', f'db;dur={db_seconds * 1000:.2f};desc="{queries} queries"')
+    response.headers.add('Server-Timing', f'app;dur={request_seconds * 1000:.2f}')
+    return response
+
+
+def init_app(app):
+    """Count and time SQL per request when ``SQL_INSTRUMENTATION`` is on.
+
+    Off by default: no events are registered, so there is no overhead.
+    """
+    if not app.config.get('SQL_INSTRUMENTATION'):
+        return
+    stats = QueryStats(app.config['SLOW_QUERY_MS'], app.config['SLOW_QUERY_LOG_SIZE'])
+    app.extensions['query_stats'] = stats
+    with app.app_context():
+        engines = list(db.engines.values())
+    for engine in engines:
+        instrument_engine(engine, stats)
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+
+def get_query_stats():
+    """The app's QueryStats, or None when instrumentation is off"""
+    return current_app.extensions.get('query_stats')
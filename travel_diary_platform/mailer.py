@@ -0,0 +1,153 @@
+import queue
+import smtplib
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+
+class SMTPPool:
+    """A small pool of authenticated SMTP sessions shared across threads.
+
+    Each session pays for connect, STARTTLS and login once and then sends many
+    messages. Sessions are recycled after ``max_messages`` sends (most servers
+    cap messages per session) and transparently reopened when the server drops
+    them.
+    """
+
+    def __init__(self, host, port, username=None, password=None, use_tls=True,
+                 size=4, max_messages=100, timeout=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.size = size
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a pool from the ``MAIL_*`` settings of a Flask config"""
+        return cls(
+            host=config['MAIL_SERVER'],
+            port=config['MAIL_PORT'],
+            username=config.get('MAIL_USERNAME'),
+            password=config.get('MAIL_PASSWORD'),
+            use_tls=config.get('MAIL_USE_TLS', True),
+            size=config.get('MAIL_POOL_SIZE', 4),
+            max_messages=config.get('MAIL_POOL_MAX_MESSAGES', 100),
+            timeout=config.get('MAIL_TIMEOUT', 30),
+        )
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            server.starttls()
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        server.sent_count = 0
+        return server
+
+    def _discard(self, server):
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+    def _checkout(self):
+        self._slots.acquire()
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _checkin(self, server):
+        if server is not None:
+            if self._closed or server.sent_count >= self.max_messages:
+                self._discard(server)
+            else:
+                self._idle.put(server)
+        self._slots.release()
+
+    def sendmail(self, from_addr, to_addrs, message):
+        """Send one message, reconnecting once if the session was dropped"""
+        server = self._checkout()
+        try:
+            try:
+                server.sendmail(from_addr, to_addrs, message)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                server.close()
+                server = None
+                server = self._connect()
+                server.sendmail(from_addr, to_addrs, message)
+            server.sent_count += 1
+        except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+            # The message was refused but the session is still usable, unless
+            # the refusal came from reconnecting and there is no session
+            if server is not None:
+                try:
+                    server.rset()
+                except Exception:
+                    self._discard(server)
+                    server = None
+            raise
+        except Exception:
+            if server is not None:
+                self._discard(server)
+                server = None
+            raise
+        finally:
+            self._checkin(server)
+
+    def send(self, to, subject, body, sender=None):
+        """Build a plain-text message and send it through the pool"""
+        sender = sender or self.username
+        msg = MIMEMultipart()
+        msg['From'] = sender
+        msg['To'] = to
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+        self.sendmail(sender, to, msg.as_string())
+
+    def close(self):
+        """Close every idle session; sessions in use are closed on check-in"""
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_mail_pool(config=None):
+    """Return the process-wide SMTP pool, creating it from ``config`` on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if config is None:
+                    from flask import current_app
+                    config = current_app.config
+                _pool = SMTPPool.from_config(config)
+    return _pool
+
+
+def close_mail_pool():
+    """Close and forget the process-wide SMTP pool"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -0,0 +1,53 @@
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+from database import db
+
+
+def _add_column(connection, table, column):
+    preparer = connection.dialect.identifier_preparer
+    ddl = CreateColumn(column).compile(dialect=connection.dialect)
+    connection.execute(db.text(f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}'))
+
+
+def _drop_duplicates(connection, index):
+    """Delete rows that would violate a new unique index, keeping the oldest of each set"""
+    table = index.table
+    columns = list(index.columns)
+    keep = db.select(db.func.min(table.c.id)).group_by(*columns)
+    # Rows with a NULL key never conflict, so they are left alone
+    return connection.execute(
+        db.delete(table).where(*[column.is_not(None) for column in columns],
+                               table.c.id.not_in(keep))
+    ).rowcount
+
+
+def upgrade_schema():
+    """Bring a database created by an older release up to the current models.
+
+    ``create_all`` only creates missing tables, so columns and indexes added
+    to existing tables are added here: new columns are nullable or carry a
+    server default, and duplicate rows are removed before a unique index is
+    built. Runs in one transaction and is safe to repeat; returns a list of
+    the changes made. Backfilling the new columns is up to the caller.
+    """
+    db.create_all()
+    changes = []
+    with db.engine.begin() as connection:
+        inspector = inspect(connection)
+        for table in db.metadata.sorted_tables:
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    _add_column(connection, table, column)
+                    changes.append(f'added column {table.name}.{column.name}')
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in sorted(table.indexes, key=lambda index: index.name):
+                if index.name in indexes:
+                    continue
+                if index.unique:
+                    removed = _drop_duplicates(connection, index)
+                    if removed:
+                        changes.append(f'removed {removed} duplicate {table.name} rows')
+                index.create(connection)
+                changes.append(f'created index {index.name}')
+    return changes
@@ -26,6 +26,22 @@ class Preference(db.Model):
     alert_via_email = db.Column(db.Boolean, default=True)
     whatsapp_number = db.Column(db.String(20))
     email = db.Column(db.String(120))
+    # Area of interest: a home point plus radius and/or explicit geohash cells.
+    # Users with neither are untargeted (see ALERT_BROADCAST_UNTARGETED)
+    home_location = db.Column(db.String(255))
+    home_latitude = db.Column(db.Float)
+    home_longitude = db.Column(db.Float)
+    alert_radius_km = db.Column(db.Float)
+    alert_cells = db.Column(db.Text)
+    geo_targeted = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+
+class AlertSubscriptionCell(db.Model):
+    """Inverted index from geohash cell to the users watching it"""
+    id = db.Column(db.Integer, primary_key=True)
+    cell = db.Column(db.String(12), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    __table_args__ = (db.Index('ux_alert_subscription_cell', 'cell', 'user_id', unique=True),)
 
 class DiaryEntry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -34,9 +50,15 @@ class DiaryEntry(db.Model):
     body = db.Column(db.Text, nullable=False)
     safety_tips = db.Column(db.Text)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    # Denormalized counters, kept in step by the like and comment endpoints
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     comments = db.relationship('Comment', backref='diary', lazy='dynamic')
     likes = db.relationship('Like', backref='diary', lazy='dynamic')
 
+    # Keyset pagination seeks on (timestamp, id)
+    __table_args__ = (db.Index('ix_diary_entry_timestamp_id', 'timestamp', 'id'),)
+
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     diary_id = db.Column(db.Integer, db.ForeignKey('diary_entry.id'))
@@ -45,11 +67,17 @@ class Comment(db.Model):
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     user = db.relationship('User', backref='comments')
 
+    # The feed reads each diary's latest comments in this order
+    __table_args__ = (db.Index('ix_comment_diary_timestamp_id', 'diary_id', 'timestamp', 'id'),)
+
 class Like(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     diary_id = db.Column(db.Integer, db.ForeignKey('diary_entry.id'))
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
 
+    # One like per user per diary; also serves the toggle lookup
+    __table_args__ = (db.Index('ux_like_diary_user', 'diary_id', 'user_id', unique=True),)
+
 class Incident(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -57,11 +85,94 @@ class Incident(db.Model):
     category = db.Column(db.String(64), nullable=False)
     description = db.Column(db.Text, nullable=False)
     photo_filename = db.Column(db.String(255))
+    # None for legacy uploads; pending until the derivatives exist
+    photo_status = db.Column(db.String(16))
     approved = db.Column(db.Boolean, default=False)
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    # Filled by the geocoder when the incident is approved
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+
+    __table_args__ = (
+        db.Index('ix_incident_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_incident_approved_timestamp_id', 'approved', 'timestamp', 'id'),
+        # Map viewports seek one geohash prefix range per covering cell
+        db.Index('ix_incident_approved_geohash', 'approved', 'geohash'),
+    )
 
 class Alert(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     message = db.Column(db.Text, nullable=False)
-    sent_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+
+class DailyStat(db.Model):
+    """Per-day rollup counter, maintained incrementally by ``rollups``.
+
+    Each event updates a totals row (empty category and bucket) and a row for
+    its category and geohash bucket, so a day's total is one row and a
+    breakdown is a handful.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    metric = db.Column(db.String(32), nullable=False)
+    category = db.Column(db.String(64), nullable=False, default='')
+    bucket = db.Column(db.String(12), nullable=False, default='')
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ux_daily_stat_key', 'metric', 'day', 'category', 'bucket', unique=True),
+    )
+
+class OutboxEvent(db.Model):
+    """Event written in the same transaction as the change that caused it.
+
+    ``outbox.relay`` publishes undispatched events to the task queue, so a
+    broker outage delays side effects instead of losing them.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    dispatched_at = db.Column(db.DateTime)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+
+    __table_args__ = (db.Index('ix_outbox_event_pending', 'dispatched_at', 'id'),)
+
+class PendingDigestItem(db.Model):
+    """An approved incident buffered for a recipient's next digest"""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    incident_id = db.Column(db.Integer, db.ForeignKey('incident.id'), nullable=False)
+    channel = db.Column(db.String(16))
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    claim = db.Column(db.String(32))
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_pending_digest_item_user_created', 'user_id', 'created_at'),
+        db.Index('ix_pending_digest_item_claim', 'claim'),
+    )
+
+class AlertDelivery(db.Model):
+    """One alert for one incident to one user over one channel.
+
+    The unique key is the idempotency guard: whichever task run inserts the
+    row owns that delivery, so retries never message a user twice.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    incident_id = db.Column(db.Integer, db.ForeignKey('incident.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    channel = db.Column(db.String(16), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    claim = db.Column(db.String(32))
+    attempts = db.Column(db.Integer, nullable=False, default=1)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ux_alert_delivery_key', 'incident_id', 'user_id', 'channel', unique=True),
+        db.Index('ix_alert_delivery_claim', 'incident_id', 'claim'),
+    )
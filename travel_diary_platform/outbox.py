@@ -0,0 +1,45 @@
+import json
+from datetime import datetime
+from database import db
+from models import OutboxEvent
+
+
+def enqueue(topic, payload):
+    """Add an event to the current transaction; it is published after commit by ``relay``"""
+    event = OutboxEvent(topic=topic, payload=json.dumps(payload))
+    db.session.add(event)
+    return event
+
+
+def relay(publish, batch_size=100):
+    """Publish one batch of undispatched events, oldest first.
+
+    ``publish(topic, payload)`` hands an event to the broker. Events are
+    marked dispatched only after it returns, so delivery is at-least-once;
+    consumers are expected to be idempotent. The first failure ends the batch
+    because it usually means the broker is unreachable. Rows are locked with
+    SKIP LOCKED where the database supports it so concurrent relays split the
+    work instead of racing.
+    """
+    stats = {'dispatched': 0, 'failed': 0}
+    events = db.session.execute(
+        db.select(OutboxEvent)
+        .where(OutboxEvent.dispatched_at.is_(None))
+        .order_by(OutboxEvent.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+
+    for event in events:
+        try:
+            publish(event.topic, json.loads(event.payload))
+        except Exception as e:
+            event.attempts += 1
+            event.last_error = str(e)
+            stats['failed'] += 1
+            break
+        event.dispatched_at = datetime.utcnow()
+        stats['dispatched'] += 1
+
+    db.session.commit()
+    return stats
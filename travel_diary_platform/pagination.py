@@ -0,0 +1,51 @@
+import base64
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app, request
+from database import db
+
+Page = namedtuple('Page', 'items next_cursor')
+
+
+def encode_cursor(timestamp, row_id):
+    """Opaque cursor for the position just after (timestamp, id)"""
+    raw = f'{timestamp.isoformat()}|{row_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of ``encode_cursor``; raises ValueError for a malformed cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        timestamp, row_id = raw.split('|')
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError('Invalid cursor') from e
+
+
+def page_args():
+    """Read ``cursor`` and ``limit`` from the query string, clamping the limit"""
+    limit = request.args.get('limit', type=int) or current_app.config['PAGE_SIZE']
+    limit = max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+    return request.args.get('cursor') or None, limit
+
+
+def keyset_page(query, model, cursor=None, limit=20, key=None):
+    """Return one page of ``query``, newest first, seeking past ``cursor``.
+
+    Rows are ordered by (timestamp, id) descending and the cursor becomes a
+    row-value comparison on that pair, so every page is an index range scan
+    and costs the same however deep it is. ``key`` extracts the model instance
+    from each row when the query selects extra columns.
+    """
+    if cursor:
+        timestamp, row_id = decode_cursor(cursor)
+        query = query.filter(db.tuple_(model.timestamp, model.id) < (timestamp, row_id))
+    rows = query.order_by(model.timestamp.desc(), model.id.desc()).limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = key(rows[-1]) if key else rows[-1]
+        next_cursor = encode_cursor(last.timestamp, last.id)
+    return Page(rows, next_cursor)
@@ -0,0 +1,246 @@
+import hashlib
+import io
+import os
+import tempfile
+from flask import Request, current_app, url_for
+from werkzeug.exceptions import RequestEntityTooLarge
+
+PENDING = 'pending'
+READY = 'ready'
+FAILED = 'failed'
+REJECTED = 'rejected'
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+# Leading bytes of each accepted format, checked by the background task
+SIGNATURES = {
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'jpg': (b'\xff\xd8\xff',),
+    'jpeg': (b'\xff\xd8\xff',),
+    'gif': (b'GIF87a', b'GIF89a'),
+}
+
+# Uploads are received here, on the same filesystem as the store so the
+# final rename is atomic
+INCOMING = '.incoming'
+
+CHUNK_SIZE = 64 * 1024
+WEBP_QUALITY = 80
+
+_prepared_folders = set()
+
+
+def allowed_file(filename):
+    return '.' in filename and \
+           filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+
+def _prepare(folder):
+    # Directories are created once per process rather than on every upload
+    if folder not in _prepared_folders:
+        os.makedirs(os.path.join(folder, INCOMING), exist_ok=True)
+        _prepared_folders.add(folder)
+
+
+def photo_sizes():
+    """{size name: longest edge in pixels} for the derivatives of every photo"""
+    return {'thumb': current_app.config['PHOTO_THUMB_SIZE'],
+            'large': current_app.config['PHOTO_LARGE_SIZE']}
+
+
+def content_name(digest, ext):
+    """Storage name for a photo: sharded by the first hash byte, e.g. ``ab/abcd….jpg``"""
+    return f'{digest[:2]}/{digest}.{ext}'
+
+
+def derivative_name(name, size):
+    """Storage name of the ``size`` WebP derivative of a stored photo"""
+    return f"{name.rsplit('.', 1)[0]}-{size}.webp"
+
+
+class HashingUpload:
+    """Temporary file that hashes and measures an upload while it is received.
+
+    Returned by ``UploadRequest`` as the target of each file part, so the
+    body is written to disk chunk by chunk as it is parsed and an oversized
+    file is refused as soon as it crosses ``limit``. Closing it removes the
+    file unless it has been moved into the store.
+    """
+
+    def __init__(self, folder, limit=None):
+        _prepare(folder)
+        fd, self.path = tempfile.mkstemp(dir=os.path.join(folder, INCOMING), suffix='.part')
+        self._file = os.fdopen(fd, 'w+b')
+        self._digest = hashlib.sha256()
+        self.folder = folder
+        self.limit = limit
+        self.size = 0
+        self.stored = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.limit and self.size > self.limit:
+            # The parser drops a part whose write fails, so clean up here
+            self.close()
+            raise RequestEntityTooLarge(f'Photos may be at most {self.limit // (1024 * 1024)} MB')
+        self._digest.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._digest.hexdigest()
+
+    def close(self):
+        self._file.close()
+        if not self.stored and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class DiscardedUpload(io.BytesIO):
+    """Target for file parts that will not be stored: their bytes are dropped"""
+
+    def write(self, data):
+        return len(data)
+
+
+class UploadRequest(Request):
+    """Request that streams photo uploads straight into the upload folder.
+
+    Every file field in the app is a photo, so file parts with an accepted
+    extension go to a ``HashingUpload`` and all others are discarded unread.
+    Plain form fields are capped in memory.
+    """
+
+    max_form_memory_size = 512 * 1024
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        if filename and allowed_file(filename):
+            return HashingUpload(current_app.config['UPLOAD_FOLDER'],
+                                 current_app.config['PHOTO_MAX_BYTES'])
+        return DiscardedUpload()
+
+
+def _commit(temp_path, digest, ext, folder):
+    name = content_name(digest, ext.lower())
+    path = os.path.join(folder, name)
+    if os.path.exists(path):
+        os.remove(temp_path)
+        return name, False
+    try:
+        os.replace(temp_path, path)
+    except FileNotFoundError:
+        # First photo in this shard
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+    return name, True
+
+
+def store_upload(upload, folder=None):
+    """Move an uploaded FileStorage into content-addressed storage; returns (name, created).
+
+    A file received through ``UploadRequest`` is already on disk and hashed,
+    so storing it is a rename; anything else is copied by ``store_photo``.
+    """
+    ext = upload.filename.rsplit('.', 1)[1]
+    stream = upload.stream
+    if not isinstance(stream, HashingUpload):
+        return store_photo(stream, ext, folder)
+    stream.flush()
+    name, created = _commit(stream.path, stream.hexdigest(), ext, stream.folder)
+    stream.stored = True
+    return name, created
+
+
+def store_photo(stream, ext, folder=None):
+    """Copy a photo from ``stream`` into content-addressed storage; returns (name, created).
+
+    The photo is hashed while it is copied to a temporary file, then renamed
+    into place, so a reader never sees a partial file. Identical photos map
+    to the same name and are kept once.
+    """
+    target = HashingUpload(folder or current_app.config['UPLOAD_FOLDER'])
+    try:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            target.write(chunk)
+        target.flush()
+        name, created = _commit(target.path, target.hexdigest(), ext, target.folder)
+        target.stored = True
+        return name, created
+    finally:
+        target.close()
+
+
+def check_signature(name, folder=None):
+    """Whether a stored file starts with the magic bytes of its extension"""
+    folder = folder or current_app.config['UPLOAD_FOLDER']
+    signatures = SIGNATURES.get(name.rsplit('.', 1)[1].lower(), ())
+    with open(os.path.join(folder, name), 'rb') as f:
+        head = f.read(16)
+    return any(head.startswith(signature) for signature in signatures)
+
+
+def discard_photo(name, folder=None):
+    """Delete a stored photo and any derivatives"""
+    folder = folder or current_app.config['UPLOAD_FOLDER']
+    for target in [name] + [derivative_name(name, size) for size in photo_sizes()]:
+        try:
+            os.remove(os.path.join(folder, target))
+        except FileNotFoundError:
+            pass
+
+
+def has_derivatives(name, folder=None):
+    folder = folder or current_app.config['UPLOAD_FOLDER']
+    return all(os.path.exists(os.path.join(folder, derivative_name(name, size)))
+               for size in photo_sizes())
+
+
+def make_derivatives(name, folder=None):
+    """Render a WebP derivative of a stored photo for every configured size.
+
+    Needs Pillow (raises ImportError without it); raises OSError for files
+    that are not decodable images. Existing derivatives are left alone.
+    """
+    from PIL import Image, ImageOps
+
+    folder = folder or current_app.config['UPLOAD_FOLDER']
+    written = []
+    with Image.open(os.path.join(folder, name)) as original:
+        # Phones record rotation in EXIF; bake it in since WebP output drops it
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+        for size, edge in photo_sizes().items():
+            target = derivative_name(name, size)
+            path = os.path.join(folder, target)
+            if os.path.exists(path):
+                continue
+            derivative = image.copy()
+            derivative.thumbnail((edge, edge))
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+            with os.fdopen(fd, 'wb') as temp:
+                derivative.save(temp, 'WEBP', quality=WEBP_QUALITY)
+            os.replace(temp_path, path)
+            written.append(target)
+    return written
+
+
+def photo_url(incident, size=None):
+    """URL of an incident's photo, or its ``size`` derivative once it has been rendered.
+
+    Until the background task has finished (or when Pillow is unavailable)
+    the original is served. Registered as a Jinja global.
+    """
+    if not incident.photo_filename:
+        return None
+    name = incident.photo_filename
+    if size and incident.photo_status == READY:
+        name = derivative_name(name, size)
+    return url_for('static', filename=f'uploads/{name}')
+
+
+def init_app(app):
+    app.request_class = UploadRequest
+    app.add_template_global(photo_url)
@@ -0,0 +1,160 @@
+import sys
+from datetime import datetime, time, timedelta
+from flask import current_app
+from database import db
+from models import DailyStat, Incident
+from rollups import APPROVED_INCIDENTS
+
+TOP_INCIDENTS = 3
+DESCRIPTION_PREVIEW = 100
+
+
+def report_window(start=None, end=None, days=7):
+    """Resolve a [start, end) window, defaulting to the ``days`` before ``end``.
+
+    ``end`` defaults to midnight UTC today, so the scheduled report covers
+    whole days and is answered from the daily rollups.
+    """
+    if isinstance(start, str):
+        start = datetime.fromisoformat(start)
+    if isinstance(end, str):
+        end = datetime.fromisoformat(end)
+    end = end or datetime.combine(datetime.utcnow().date(), time.min)
+    start = start or end - timedelta(days=days)
+    if start >= end:
+        raise ValueError('Report start must be before its end')
+    return start, end
+
+
+def _approved_between(start, end):
+    return (Incident.approved == True, Incident.timestamp >= start, Incident.timestamp < end)
+
+
+def _whole_days(start, end):
+    return start.time() == time.min and end.time() == time.min
+
+
+def _rollup_between(start, end):
+    return (DailyStat.metric == APPROVED_INCIDENTS, DailyStat.category != '',
+            DailyStat.day >= start.date(), DailyStat.day < end.date())
+
+
+def category_counts(start, end):
+    """(category, count) for approved incidents in the window, busiest first.
+
+    Windows on day boundaries are answered from the daily rollups; anything
+    else falls back to grouping the incidents themselves.
+    """
+    if _whole_days(start, end):
+        total = db.func.sum(DailyStat.count)
+        rows = db.session.execute(
+            db.select(DailyStat.category, total)
+            .where(*_rollup_between(start, end))
+            .group_by(DailyStat.category)
+            .having(total > 0)
+            .order_by(total.desc(), DailyStat.category)
+        ).all()
+        return [(category, int(count)) for category, count in rows]
+
+    total = db.func.count(Incident.id)
+    return db.session.execute(
+        db.select(Incident.category, total)
+        .where(*_approved_between(start, end))
+        .group_by(Incident.category)
+        .order_by(total.desc(), Incident.category)
+    ).all()
+
+
+def top_incidents(start, end, limit=TOP_INCIDENTS):
+    """Newest ``limit`` incidents per category, keyed by category.
+
+    A row_number window ranks incidents inside each category so the database
+    returns at most ``limit`` rows per category, with descriptions already
+    trimmed to the preview length.
+    """
+    rank = db.func.row_number().over(
+        partition_by=Incident.category,
+        order_by=(Incident.timestamp.desc(), Incident.id.desc()),
+    ).label('rank')
+    ranked = db.select(
+        Incident.category,
+        Incident.location,
+        db.func.substr(Incident.description, 1, DESCRIPTION_PREVIEW).label('preview'),
+        rank,
+    ).where(*_approved_between(start, end)).subquery()
+    rows = db.session.execute(
+        db.select(ranked.c.category, ranked.c.location, ranked.c.preview)
+        .where(ranked.c.rank <= limit)
+        .order_by(ranked.c.category, ranked.c.rank)
+    ).all()
+    by_category = {}
+    for row in rows:
+        by_category.setdefault(row.category, []).append(row)
+    return by_category
+
+
+def region_counts(start, end, precision=3):
+    """(region, category, count) grouped by geohash prefix of ``precision`` characters.
+
+    Incidents that were never geocoded are grouped under a ``None`` region.
+    Day-aligned windows no finer than the rollup buckets read the rollups.
+    """
+    if _whole_days(start, end) and precision <= current_app.config['ROLLUP_BUCKET_PRECISION']:
+        region = db.func.nullif(db.func.substr(DailyStat.bucket, 1, precision), '').label('region')
+        total = db.func.sum(DailyStat.count)
+        rows = db.session.execute(
+            db.select(region, DailyStat.category, total)
+            .where(*_rollup_between(start, end))
+            .group_by(region, DailyStat.category)
+            .having(total > 0)
+            .order_by(region, total.desc(), DailyStat.category)
+        ).all()
+        return [(row_region, category, int(count)) for row_region, category, count in rows]
+
+    region = db.func.substr(Incident.geohash, 1, precision).label('region')
+    total = db.func.count(Incident.id)
+    return db.session.execute(
+        db.select(region, Incident.category, total)
+        .where(*_approved_between(start, end))
+        .group_by(region, Incident.category)
+        .order_by(region, total.desc(), Incident.category)
+    ).all()
+
+
+def write_safety_report(out=None, start=None, end=None, days=7, top=TOP_INCIDENTS,
+                        region_precision=None):
+    """Write the safety report for a window to ``out`` line by line.
+
+    ``out`` is anything with a ``write`` method (defaults to stdout). The cost
+    is a GROUP BY and a windowed top-N query, so it scales with the number of
+    categories rather than the number of incidents. With ``region_precision``
+    a per-region breakdown by geohash prefix is appended. Returns the total
+    number of incidents covered.
+    """
+    out = out or sys.stdout
+    start, end = report_window(start, end, days)
+    counts = category_counts(start, end)
+    total = sum(count for _, count in counts)
+    examples = top_incidents(start, end, top) if top else {}
+
+    out.write('SAFETY REPORT\n')
+    out.write(f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}\n")
+    out.write(f"Period: {start.strftime('%Y-%m-%d %H:%M')} to {end.strftime('%Y-%m-%d %H:%M')} UTC\n\n")
+    out.write(f'Total Incidents: {total}\n\n')
+    out.write('BREAKDOWN BY CATEGORY:\n')
+    for category, count in counts:
+        out.write(f'\n{category.upper()}: {count} incidents\n')
+        for incident in examples.get(category, []):
+            out.write(f'  - {incident.location}: {incident.preview}...\n')
+
+    if region_precision:
+        out.write('\n\nBREAKDOWN BY REGION:\n')
+        current = object()
+        for region, category, count in region_counts(start, end, region_precision):
+            if region != current:
+                current = region
+                out.write(f"\n{region or 'UNLOCATED'}:\n")
+            out.write(f'  {category}: {count}\n')
+
+    out.write('\n\nFor more details, visit the Travel Diary Platform safety map.\n')
+    return total
@@ -0,0 +1,111 @@
+import gzip
+import json
+import os
+import time
+from datetime import datetime
+from database import db
+from models import Alert, AlertDelivery
+
+
+def archive_path_for(directory, now=None):
+    """Timestamped path for an alert archive inside ``directory``"""
+    now = now or datetime.utcnow()
+    return os.path.join(directory, f"alerts-{now.strftime('%Y%m%dT%H%M%S')}.ndjson.gz")
+
+
+def purge_alerts(cutoff, batch_size=5000, archive_path=None):
+    """Delete alerts sent before ``cutoff`` in primary-key batches.
+
+    Each batch finds the next ``batch_size`` expired ids in index order and
+    removes them with one set-based DELETE over that id range, committing per
+    batch so locks stay short and memory stays flat. With ``archive_path`` the
+    batch is first appended to a gzipped NDJSON file, and flushed before the
+    delete commits, so a row is never gone without being archived.
+    """
+    stats = {'deleted': 0, 'archived': 0, 'batches': 0}
+    started = time.monotonic()
+    archive = None
+    if archive_path:
+        os.makedirs(os.path.dirname(archive_path) or '.', exist_ok=True)
+        archive = gzip.open(archive_path, 'xt', encoding='utf-8')
+
+    try:
+        last_id = 0
+        while True:
+            columns = [Alert.id, Alert.user_id, Alert.message, Alert.sent_at] if archive else [Alert.id]
+            rows = db.session.execute(
+                db.select(*columns)
+                .where(Alert.sent_at < cutoff, Alert.id > last_id)
+                .order_by(Alert.id)
+                .limit(batch_size)
+            ).all()
+            ids = [row.id for row in rows]
+            if not ids:
+                break
+
+            low, high = ids[0], ids[-1]
+            if archive:
+                for row in rows:
+                    archive.write(json.dumps({
+                        'id': row.id,
+                        'user_id': row.user_id,
+                        'message': row.message,
+                        'sent_at': row.sent_at.isoformat() if row.sent_at else None,
+                    }) + '\n')
+                archive.flush()
+                stats['archived'] += len(rows)
+
+            deleted = db.session.execute(
+                db.delete(Alert).where(Alert.id.between(low, high), Alert.sent_at < cutoff)
+            ).rowcount
+            db.session.commit()
+
+            stats['deleted'] += deleted
+            stats['batches'] += 1
+            last_id = high
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if archive:
+            archive.close()
+
+    elapsed = time.monotonic() - started
+    stats['elapsed'] = round(elapsed, 3)
+    stats['rows_per_second'] = round(stats['deleted'] / elapsed, 1) if elapsed else None
+    if archive_path:
+        stats['archive'] = archive_path
+    return stats
+
+
+def purge_deliveries(cutoff, batch_size=5000):
+    """Delete finished alert deliveries created before ``cutoff`` in primary-key batches.
+
+    Only ``sent`` and ``failed`` rows go; a delivery still pending or queued
+    for a digest is left for its task. Commits per batch.
+    """
+    deleted = 0
+    last_id = 0
+    try:
+        while True:
+            ids = db.session.execute(
+                db.select(AlertDelivery.id)
+                .where(AlertDelivery.id > last_id,
+                       AlertDelivery.created_at < cutoff,
+                       AlertDelivery.status.in_(['sent', 'failed']))
+                .order_by(AlertDelivery.id)
+                .limit(batch_size)
+            ).scalars().all()
+            if not ids:
+                break
+            deleted += db.session.execute(
+                db.delete(AlertDelivery).where(AlertDelivery.id.in_(ids))
+            ).rowcount
+            db.session.commit()
+            last_id = ids[-1]
+            if len(ids) < batch_size:
+                break
+    except Exception:
+        db.session.rollback()
+        raise
+    return deleted
@@ -0,0 +1,128 @@
+from datetime import date, datetime, timedelta
+from flask import current_app
+from database import db, insert_or_add
+from models import DailyStat, DiaryEntry, Incident
+
+INCIDENTS = 'incidents'
+APPROVED_INCIDENTS = 'approved_incidents'
+DIARIES = 'diaries'
+
+KEY = ['metric', 'day', 'category', 'bucket']
+
+
+def _day(timestamp):
+    return (timestamp or datetime.utcnow()).date()
+
+
+def _bucket(geohash):
+    if not geohash:
+        return ''
+    return geohash[:current_app.config['ROLLUP_BUCKET_PRECISION']]
+
+
+def increment(metric, day, category='', bucket='', delta=1):
+    """Add ``delta`` to the totals row and, if given, the category/bucket row.
+
+    Runs in the caller's transaction, so the rollup commits or rolls back
+    together with the change it counts.
+    """
+    rows = [{'metric': metric, 'day': day, 'category': '', 'bucket': '', 'count': delta}]
+    if category or bucket:
+        rows.append({'metric': metric, 'day': day, 'category': category,
+                     'bucket': bucket, 'count': delta})
+    for row in rows:
+        db.session.execute(insert_or_add(DailyStat, KEY, 'count').values(**row))
+
+
+def incident_reported(incident, delta=1):
+    """Count a new (or, with ``delta=-1``, deleted) incident report"""
+    increment(INCIDENTS, _day(incident.timestamp), incident.category, delta=delta)
+
+
+def incident_approved(incident, delta=1):
+    """Count an approval (or, with ``delta=-1``, the removal of an approved incident).
+
+    Approved incidents are bucketed by geohash prefix; reports are bucketed
+    only by category because they are not geocoded until approval.
+    """
+    increment(APPROVED_INCIDENTS, _day(incident.timestamp), incident.category,
+              _bucket(incident.geohash), delta)
+
+
+def diary_created(diary, delta=1):
+    """Count a new (or, with ``delta=-1``, deleted) diary entry"""
+    increment(DIARIES, _day(diary.timestamp), delta=delta)
+
+
+def day_count(metric, day):
+    """Total for one metric on one day: a single-row lookup"""
+    return db.session.execute(
+        db.select(DailyStat.count).where(
+            DailyStat.metric == metric, DailyStat.day == day,
+            DailyStat.category == '', DailyStat.bucket == '',
+        )
+    ).scalar() or 0
+
+
+def totals():
+    """All-time total of every metric, summed over the daily totals rows"""
+    rows = db.session.execute(
+        db.select(DailyStat.metric, db.func.sum(DailyStat.count))
+        .where(DailyStat.category == '', DailyStat.bucket == '')
+        .group_by(DailyStat.metric)
+    ).all()
+    return {metric: int(total or 0) for metric, total in rows}
+
+
+def daily_series(metric, start, end):
+    """[(day, count)] for every day in [start, end), zero-filled"""
+    counts = dict(db.session.execute(
+        db.select(DailyStat.day, DailyStat.count).where(
+            DailyStat.metric == metric, DailyStat.day >= start, DailyStat.day < end,
+            DailyStat.category == '', DailyStat.bucket == '',
+        )
+    ).all())
+    return [(start + timedelta(days=i), counts.get(start + timedelta(days=i), 0))
+            for i in range((end - start).days)]
+
+
+def rebuild_rollups():
+    """Recompute every rollup row from the incident and diary tables.
+
+    Used to backfill an existing database and to repair drift after bulk
+    loads that bypass the incremental hooks.
+    """
+    precision = current_app.config['ROLLUP_BUCKET_PRECISION']
+    day = db.func.date(Incident.timestamp)
+    bucket = db.func.coalesce(db.func.substr(Incident.geohash, 1, precision), '')
+    sources = [
+        (INCIDENTS, db.select(day, Incident.category, db.literal(''), db.func.count(Incident.id))
+            .group_by(day, Incident.category)),
+        (APPROVED_INCIDENTS, db.select(day, Incident.category, bucket, db.func.count(Incident.id))
+            .where(Incident.approved == True)
+            .group_by(day, Incident.category, bucket)),
+    ]
+    diary_day = db.func.date(DiaryEntry.timestamp)
+    sources.append((DIARIES, db.select(diary_day, db.literal(''), db.literal(''),
+                                       db.func.count(DiaryEntry.id)).group_by(diary_day)))
+
+    counts = {}
+    for metric, query in sources:
+        for row_day, category, row_bucket, count in db.session.execute(query):
+            if not isinstance(row_day, date):
+                row_day = date.fromisoformat(row_day)
+            keys = [(metric, row_day, '', '')]
+            if category or row_bucket:
+                keys.append((metric, row_day, category, row_bucket))
+            for key in keys:
+                counts[key] = counts.get(key, 0) + count
+
+    db.session.execute(db.delete(DailyStat))
+    if counts:
+        db.session.execute(db.insert(DailyStat), [
+            {'metric': metric, 'day': row_day, 'category': category, 'bucket': row_bucket,
+             'count': count}
+            for (metric, row_day, category, row_bucket), count in counts.items()
+        ])
+    db.session.commit()
+    return len(counts)
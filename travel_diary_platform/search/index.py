@@ -0,0 +1,354 @@
+import bisect
+import math
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app
+from markupsafe import Markup, escape
+from sqlalchemy import DDL, event
+from database import db
+from models import DiaryEntry, Incident
+
+SearchHit = namedtuple('SearchHit', 'kind id title snippet category timestamp score')
+
+KINDS = ('diary', 'incident')
+TITLE_WEIGHT = 4.0
+SNIPPET_WORDS = 16
+
+# Highlight markers: control characters that never appear in user text, so
+# the text can be escaped first and the markers turned into <mark> after
+_OPEN, _CLOSE = '\x02', '\x03'
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def _fts5_available():
+    try:
+        conn = sqlite3.connect(':memory:')
+        conn.execute('CREATE VIRTUAL TABLE probe USING fts5(body)')
+        conn.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+FTS5_AVAILABLE = _fts5_available()
+
+# The FTS table lives beside the ORM tables so create_all/drop_all manage it
+event.listen(db.metadata, 'after_create', DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "title, body, kind UNINDEXED, category UNINDEXED, timestamp UNINDEXED, "
+    "tokenize='porter unicode61')"
+).execute_if(dialect='sqlite', callable_=lambda *args, **kwargs: FTS5_AVAILABLE))
+event.listen(db.metadata, 'before_drop', DDL(
+    "DROP TABLE IF EXISTS search_index"
+).execute_if(dialect='sqlite'))
+
+
+def terms(text):
+    """Lower-cased word tokens of ``text``"""
+    return _WORD.findall((text or '').lower())
+
+
+def highlight(text):
+    """Escape marked-up text and turn the match markers into <mark> tags"""
+    return Markup(str(escape(text)).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>'))
+
+
+def diary_document(diary):
+    body = diary.body if not diary.safety_tips else f'{diary.body}\n{diary.safety_tips}'
+    return 'diary', diary.id, diary.title, body, '', diary.timestamp or datetime.utcnow()
+
+
+def incident_document(incident):
+    return ('incident', incident.id, incident.location, incident.description,
+            incident.category, incident.timestamp or datetime.utcnow())
+
+
+def _rowid(kind, ref_id):
+    # Both kinds share one table; the low bit keeps their ids apart
+    return ref_id * 2 + KINDS.index(kind)
+
+
+class Fts5Index:
+    """Search backed by an SQLite FTS5 table with BM25 ranking.
+
+    Writes go through the ORM session, so index updates commit or roll back
+    with the change that caused them. Each document's rowid is derived from
+    its kind and id, so replacing or removing one is a primary-key operation.
+    """
+
+    INSERT = db.text(
+        'INSERT INTO search_index (rowid, title, body, kind, category, timestamp) '
+        'VALUES (:rowid, :title, :body, :kind, :category, :timestamp)'
+    )
+
+    @staticmethod
+    def _row(kind, ref_id, title, body, category, timestamp):
+        return {'rowid': _rowid(kind, ref_id), 'title': title, 'body': body, 'kind': kind,
+                'category': category, 'timestamp': timestamp.isoformat()}
+
+    def add(self, kind, ref_id, title, body, category, timestamp):
+        self.remove(kind, ref_id)
+        db.session.execute(self.INSERT, self._row(kind, ref_id, title, body, category, timestamp))
+
+    def add_many(self, documents, batch_size=1000):
+        """Insert new documents with one executemany per batch; returns the count"""
+        batch, count = [], 0
+        for document in documents:
+            batch.append(self._row(*document))
+            if len(batch) == batch_size:
+                db.session.execute(self.INSERT, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            db.session.execute(self.INSERT, batch)
+            count += len(batch)
+        return count
+
+    def remove(self, kind, ref_id):
+        db.session.execute(db.text('DELETE FROM search_index WHERE rowid = :rowid'),
+                           {'rowid': _rowid(kind, ref_id)})
+
+    def clear(self):
+        db.session.execute(db.text('DELETE FROM search_index'))
+
+    def search(self, query, kinds=None, category=None, since=None, until=None, limit=20, offset=0):
+        words = terms(query)
+        if not words:
+            return []
+        # Quote every term so user input cannot inject FTS syntax; the last
+        # one is a prefix so results follow as the user types
+        match = ' '.join(f'"{word}"' for word in words) + '*'
+        sql = ['SELECT rowid, kind, category, timestamp, '
+               "highlight(search_index, 0, char(2), char(3)) AS title, "
+               f"snippet(search_index, 1, char(2), char(3), '…', {SNIPPET_WORDS}) AS snippet, "
+               f'bm25(search_index, {TITLE_WEIGHT}, 1.0) AS rank '
+               'FROM search_index WHERE search_index MATCH :match']
+        params = {'match': match, 'limit': limit, 'offset': offset}
+        if kinds:
+            sql.append('AND kind IN (%s)' % ', '.join(f':kind{i}' for i in range(len(kinds))))
+            params.update({f'kind{i}': kind for i, kind in enumerate(kinds)})
+        if category:
+            sql.append('AND category = :category')
+            params['category'] = category
+        if since:
+            sql.append('AND timestamp >= :since')
+            params['since'] = since.isoformat()
+        if until:
+            sql.append('AND timestamp < :until')
+            params['until'] = until.isoformat()
+        sql.append('ORDER BY rank LIMIT :limit OFFSET :offset')
+        rows = db.session.execute(db.text(' '.join(sql)), params).all()
+        return [SearchHit(row.kind, row.rowid // 2, highlight(row.title), highlight(row.snippet),
+                          row.category or None, datetime.fromisoformat(row.timestamp), -row.rank)
+                for row in rows]
+
+
+class InvertedIndex:
+    """In-process inverted index with BM25 ranking, for databases without FTS5.
+
+    Loaded from the database on first search and then kept current by the
+    same incremental calls as the FTS backend. Each process holds its own
+    copy, so writes made by other processes appear after ``rebuild_search_index``.
+    """
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._docs = {}
+        self._postings = {}
+        self._vocabulary = []
+        self._total_length = 0
+
+    def _ensure_loaded(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    for document in _all_documents():
+                        self._add(*document)
+                    self._loaded = True
+
+    def _add(self, kind, ref_id, title, body, category, timestamp):
+        key = (kind, ref_id)
+        self._remove(key)
+        frequencies = {}
+        for word in terms(title):
+            frequencies[word] = frequencies.get(word, 0) + TITLE_WEIGHT
+        for word in terms(body):
+            frequencies[word] = frequencies.get(word, 0) + 1
+        length = sum(frequencies.values())
+        self._docs[key] = (title, body, category, timestamp, frequencies, length)
+        self._total_length += length
+        for word, frequency in frequencies.items():
+            if word not in self._postings:
+                self._postings[word] = {}
+                bisect.insort(self._vocabulary, word)
+            self._postings[word][key] = frequency
+
+    def _remove(self, key):
+        doc = self._docs.pop(key, None)
+        if doc is None:
+            return
+        self._total_length -= doc[5]
+        for word in doc[4]:
+            posting = self._postings[word]
+            posting.pop(key, None)
+            if not posting:
+                del self._postings[word]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, word)]
+
+    def add(self, kind, ref_id, title, body, category, timestamp):
+        with self._lock:
+            if self._loaded:
+                self._add(kind, ref_id, title, body, category, timestamp)
+
+    def remove(self, kind, ref_id):
+        with self._lock:
+            if self._loaded:
+                self._remove((kind, ref_id))
+
+    def add_many(self, documents):
+        count = 0
+        for document in documents:
+            self.add(*document)
+            count += 1
+        return count
+
+    def clear(self):
+        with self._lock:
+            self._loaded = False
+            self._docs = {}
+            self._postings = {}
+            self._vocabulary = []
+            self._total_length = 0
+
+    def _expand(self, prefix):
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        end = bisect.bisect_left(self._vocabulary, prefix + '\uffff')
+        return self._vocabulary[start:end]
+
+    def search(self, query, kinds=None, category=None, since=None, until=None, limit=20, offset=0):
+        words = terms(query)
+        if not words:
+            return []
+        self._ensure_loaded()
+        with self._lock:
+            # Every term must match; the last one may match any word it prefixes
+            groups = [[word] for word in words[:-1]] + [self._expand(words[-1])]
+            candidates = None
+            for group in groups:
+                keys = set()
+                for word in group:
+                    keys.update(self._postings.get(word, ()))
+                candidates = keys if candidates is None else candidates & keys
+                if not candidates:
+                    return []
+
+            count = len(self._docs)
+            average = self._total_length / count if count else 0
+            scored = []
+            for key in candidates:
+                title, body, doc_category, timestamp, frequencies, length = self._docs[key]
+                if kinds and key[0] not in kinds:
+                    continue
+                if category and doc_category != category:
+                    continue
+                if (since and timestamp < since) or (until and timestamp >= until):
+                    continue
+                score = 0.0
+                for group in groups:
+                    for word in group:
+                        frequency = frequencies.get(word)
+                        if not frequency:
+                            continue
+                        idf = math.log(1 + (count - len(self._postings[word]) + 0.5)
+                                       / (len(self._postings[word]) + 0.5))
+                        score += idf * frequency * (self.K1 + 1) / (
+                            frequency + self.K1 * (1 - self.B + self.B * length / average))
+                scored.append((score, key))
+
+            scored.sort(key=lambda item: (-item[0], item[1]))
+            hits = []
+            for score, key in scored[offset:offset + limit]:
+                title, body, doc_category, timestamp = self._docs[key][:4]
+                matches = set(word for group in groups for word in group)
+                hits.append(SearchHit(key[0], key[1], highlight(_mark(title, matches)),
+                                      highlight(_snippet(body, matches)), doc_category or None,
+                                      timestamp, score))
+            return hits
+
+
+def _mark(text, matches):
+    return _WORD.sub(lambda m: f'{_OPEN}{m.group(0)}{_CLOSE}'
+                     if m.group(0).lower() in matches else m.group(0), text or '')
+
+
+def _snippet(text, matches):
+    """A window of ``SNIPPET_WORDS`` words around the first match, marked up"""
+    words = list(_WORD.finditer(text or ''))
+    first = next((i for i, m in enumerate(words) if m.group(0).lower() in matches), 0)
+    start = max(0, first - SNIPPET_WORDS // 4)
+    end = min(len(words), start + SNIPPET_WORDS)
+    if not words:
+        return ''
+    piece = _mark(text[words[start].start():words[end - 1].end()], matches)
+    return ('…' if start > 0 else '') + piece + ('…' if end < len(words) else '')
+
+
+def _all_documents():
+    for diary in DiaryEntry.query.yield_per(500):
+        yield diary_document(diary)
+    for incident in Incident.query.filter_by(approved=True).yield_per(500):
+        yield incident_document(incident)
+
+
+def init_app(app):
+    backend = app.config.get('SEARCH_BACKEND', 'auto')
+    if backend == 'auto':
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        backend = 'fts5' if uri.startswith('sqlite') and FTS5_AVAILABLE else 'memory'
+    app.extensions['search'] = Fts5Index() if backend == 'fts5' else InvertedIndex()
+
+
+def get_search_index():
+    return current_app.extensions['search']
+
+
+def index_diary(diary):
+    """Add or replace a diary in the index; call before the commit that saves it"""
+    get_search_index().add(*diary_document(diary))
+
+
+def remove_diary(diary_id):
+    get_search_index().remove('diary', diary_id)
+
+
+def index_incident(incident):
+    """Index an approved incident, or drop it from the index if it is not approved"""
+    if incident.approved:
+        get_search_index().add(*incident_document(incident))
+    else:
+        get_search_index().remove('incident', incident.id)
+
+
+def remove_incident(incident_id):
+    get_search_index().remove('incident', incident_id)
+
+
+def search(query, **filters):
+    """Ranked SearchHits for ``query``; see the backends for the filters"""
+    return get_search_index().search(query, **filters)
+
+
+def rebuild_search_index():
+    """Re-index every diary and approved incident from the database"""
+    index = get_search_index()
+    index.clear()
+    count = index.add_many(_all_documents())
+    db.session.commit()
+    return count
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+from flask import render_template, request, jsonify, current_app
+from search import search_bp
+from search.index import search, KINDS
+
+def search_args():
+    """Parse the query and filters; raises ValueError for malformed dates"""
+    query = request.args.get('q', '').strip()
+    kind = request.args.get('kind') or None
+    if kind and kind not in KINDS:
+        raise ValueError(f'kind must be one of {", ".join(KINDS)}')
+    since = request.args.get('since')
+    until = request.args.get('until')
+    # Dates are inclusive days; ``until`` covers the whole of its day
+    since = datetime.fromisoformat(since) if since else None
+    until = datetime.fromisoformat(until) + timedelta(days=1) if until else None
+    page = max(1, request.args.get('page', 1, type=int))
+    limit = max(1, min(request.args.get('limit', type=int) or current_app.config['PAGE_SIZE'],
+                       current_app.config['MAX_PAGE_SIZE']))
+    filters = {
+        'kinds': [kind] if kind else None,
+        'category': request.args.get('category') or None,
+        'since': since,
+        'until': until,
+        'limit': limit + 1,
+        'offset': (page - 1) * limit,
+    }
+    return query, filters, page, limit
+
+@search_bp.route('/')
+def search_page():
+    try:
+        query, filters, page, limit = search_args()
+    except ValueError as e:
+        return render_template('search/results.html', query='', hits=[], page=1,
+                               has_next=False, error=str(e)), 400
+    hits = search(query, **filters) if query else []
+    return render_template('search/results.html', query=query, hits=hits[:limit], page=page,
+                           has_next=len(hits) > limit, error=None)
+
+@search_bp.route('/api')
+def api_search():
+    try:
+        query, filters, page, limit = search_args()
+    except ValueError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 400
+    hits = search(query, **filters) if query else []
+    items = []
+    for hit in hits[:limit]:
+        items.append({
+            'kind': hit.kind,
+            'id': hit.id,
+            'title': str(hit.title),
+            'snippet': str(hit.snippet),
+            'category': hit.category,
+            'timestamp': hit.timestamp.isoformat(),
+            'score': round(hit.score, 4)
+        })
+    return jsonify({'items': items, 'page': page, 'has_next': len(hits) > limit})
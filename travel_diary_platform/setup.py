@@ -2,13 +2,41 @@
 """
 Setup script for Travel Diary Platform
 """
+import argparse
+import bisect
 import os
+import random
 import sys
 import subprocess
+import time
+from datetime import datetime, timedelta
+from flask import current_app
 from app import create_app, db
-from models import User, Preference
+from database import insert_ignore
+from migrations import upgrade_schema
+from models import (User, Preference, AlertSubscriptionCell, DiaryEntry, Comment, Like,
+                    Incident, Alert)
+from rollups import rebuild_rollups
+from diary.counters import recount_diary_counters
+from search.index import rebuild_search_index
+import geo
 from werkzeug.security import generate_password_hash
 
+# Synthetic data: cities weighted by how much traffic they attract, and
+# incident categories weighted by how often they are reported
+SEED_CITIES = [
+    ('Paris', 48.8566, 2.3522, 20), ('Rome', 41.9028, 12.4964, 14),
+    ('Bangkok', 13.7563, 100.5018, 14), ('Barcelona', 41.3874, 2.1686, 10),
+    ('New York', 40.7128, -74.0060, 10), ('Mexico City', 19.4326, -99.1332, 8),
+    ('Istanbul', 41.0082, 28.9784, 8), ('Bali', -8.4095, 115.1889, 6),
+    ('Cape Town', -33.9249, 18.4241, 4), ('Rio de Janeiro', -22.9068, -43.1729, 4),
+    ('Hanoi', 21.0278, 105.8342, 1), ('Lima', -12.0464, -77.0428, 1),
+]
+SEED_CATEGORIES = [('theft', 40), ('scam', 25), ('harassment', 15), ('unsafe_area', 12), ('other', 8)]
+SEED_WORDS = ('market street station beach temple night bus taxi hostel museum crowded '
+              'friendly quiet scenic pickpocket tour guide ferry square bridge').split()
+SEED_BATCH_SIZE = 10000
+
 def run_command(command, description):
     """Run a command and handle errors."""
     print(f"🔄 {description}...")
@@ -27,8 +55,21 @@ def setup_database():
     app = create_app()
     with app.app_context():
         try:
-            # Create all tables
-            db.create_all()
+            # Create missing tables, then add the columns and indexes that
+            # newer releases added to existing ones
+            for change in upgrade_schema():
+                print(f"✅ Schema upgrade: {change}")
+            
+            # Diaries from before the like/comment counters were added start at 0
+            recount_diary_counters()
+            
+            # Place incidents approved before geocoding existed on the map,
+            # then backfill the rollups (bucketed by geohash) and search index
+            located, checked = geo.geocode_missing_incidents()
+            if checked:
+                print(f"✅ Geocoded {located} of {checked} approved incidents without coordinates")
+            rebuild_rollups()
+            rebuild_search_index()
             
             # Create admin user if it doesn't exist
             admin = User.query.filter_by(username='admin').first()
@@ -60,6 +101,213 @@ def setup_database():
             print(f"❌ Database setup failed: {e}")
             return False
 
+class SkewedPicker:
+    """Draws values with realistic skew from a seeded random generator"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self._city_weights = []
+        total = 0
+        for city in SEED_CITIES:
+            total += city[3]
+            self._city_weights.append(total)
+        self._category_weights = []
+        total = 0
+        for category in SEED_CATEGORIES:
+            total += category[1]
+            self._category_weights.append(total)
+
+    def hot(self, order):
+        """An item of ``order``, log-uniformly by rank: the top 1% get about half the picks"""
+        return order[int(len(order) ** self.rng.random()) - 1]
+
+    def location(self):
+        """(lat, lon) clustered around a weighted city, with some scattered worldwide"""
+        if self.rng.random() < 0.05:
+            return self.rng.uniform(-60, 70), self.rng.uniform(-180, 180)
+        city = SEED_CITIES[bisect.bisect(self._city_weights, self.rng.random() * self._city_weights[-1])]
+        return (max(-90, min(90, city[1] + self.rng.gauss(0, 0.04))),
+                max(-180, min(180, city[2] + self.rng.gauss(0, 0.06))))
+
+    def category(self):
+        return SEED_CATEGORIES[bisect.bisect(
+            self._category_weights, self.rng.random() * self._category_weights[-1])][0]
+
+    def recent(self, now, days=365):
+        """A timestamp within ``days`` of ``now``, most of them in the last two months"""
+        return now - timedelta(days=min(days, self.rng.expovariate(1 / 60)),
+                               seconds=self.rng.randrange(86400))
+
+    def text(self, words):
+        return ' '.join(self.rng.choices(SEED_WORDS, k=words))
+
+def _next_id(model):
+    return (db.session.execute(db.select(db.func.max(model.id))).scalar() or 0) + 1
+
+def _bulk_insert(label, statement, rows, batch_size=SEED_BATCH_SIZE):
+    """executemany ``rows`` in batches on the session's connection; commits and returns the count"""
+    started = time.monotonic()
+    connection = db.session.connection()
+    batch, count = [], 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            connection.execute(statement, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        connection.execute(statement, batch)
+        count += len(batch)
+    db.session.commit()
+    elapsed = time.monotonic() - started
+    print(f"✅ {count:,} {label} in {elapsed:.1f}s ({count / elapsed if elapsed else 0:,.0f} rows/s)")
+    return count
+
+def seed_database(users=1000, diaries=10000, incidents=10000, comments=None, likes=None,
+                  alerts=None, admins=0, password='password123', seed=42):
+    """Bulk-load synthetic users, preferences, diaries, comments, likes, incidents and alerts.
+
+    Rows go in with core executemany inserts in batches, using explicit ids
+    after the current maximum so existing data is kept. The data is skewed
+    the way real traffic is: a few authors and hot posts get most of the
+    activity, locations cluster around popular cities and most content is
+    recent. Seeded users are ``user<id>``, the first ``admins`` of them admins,
+    all sharing ``password``. Rollups and the search index are rebuilt at the
+    end. Call inside an app context; returns the row counts.
+    """
+    rng = random.Random(seed)
+    pick = SkewedPicker(rng)
+    now = datetime.utcnow()
+    comments = diaries // 2 if comments is None else comments
+    likes = diaries * 2 if likes is None else likes
+    alerts = users * 5 if alerts is None else alerts
+    password_hash = generate_password_hash(password)
+    started = time.monotonic()
+
+    # Durability is pointless for a throwaway load on SQLite; restored below
+    sqlite = db.session.get_bind().dialect.name == 'sqlite'
+    if sqlite:
+        synchronous = db.session.execute(db.text('PRAGMA synchronous')).scalar()
+        db.session.execute(db.text('PRAGMA synchronous = OFF'))
+
+    first_user = _next_id(User)
+    user_ids = list(range(first_user, first_user + users))
+    # Activity order: the users (and below, the diaries) that attract most traffic
+    active_users = user_ids[:]
+    rng.shuffle(active_users)
+    counts = {}
+    counts['users'] = _bulk_insert('users', db.insert(User), ({
+        'id': user_id, 'username': f'user{user_id}', 'email': f'user{user_id}@example.com',
+        'password_hash': password_hash, 'is_admin': user_id - first_user < admins,
+    } for user_id in user_ids))
+
+    # A quarter of the users follow a home area; their cell rows are built here
+    # rather than by rebuild_subscriptions, which works one preference at a time
+    radius = current_app.config['ALERT_DEFAULT_RADIUS_KM']
+    max_cells = current_app.config['SUBSCRIPTION_MAX_CELLS']
+    homes = {}
+
+    def preference(user_id):
+        row = {'user_id': user_id, 'alert_via_email': True, 'email': f'user{user_id}@example.com',
+               'alert_via_whatsapp': rng.random() < 0.3, 'whatsapp_number': None,
+               'home_latitude': None, 'home_longitude': None, 'alert_radius_km': None,
+               'geo_targeted': False}
+        if row['alert_via_whatsapp']:
+            row['whatsapp_number'] = f'+1555{user_id % 10000000:07d}'
+        if rng.random() < 0.25:
+            lat, lon = pick.location()
+            homes[user_id] = (lat, lon)
+            row.update(home_latitude=lat, home_longitude=lon, alert_radius_km=radius,
+                       geo_targeted=True)
+        return row
+
+    counts['preferences'] = _bulk_insert('preferences', db.insert(Preference),
+                                         (preference(user_id) for user_id in user_ids))
+    counts['subscription_cells'] = _bulk_insert('subscription cells', db.insert(AlertSubscriptionCell), (
+        {'cell': cell, 'user_id': user_id}
+        for user_id, (lat, lon) in homes.items()
+        for cell in sorted(geo.cover_radius(lat, lon, radius, max_cells))
+    ))
+    homes.clear()
+
+    first_diary = _next_id(DiaryEntry)
+    diary_ids = list(range(first_diary, first_diary + diaries))
+    counts['diaries'] = _bulk_insert('diaries', db.insert(DiaryEntry), ({
+        'id': diary_id, 'user_id': pick.hot(active_users),
+        'title': pick.text(rng.randint(2, 6)).title(),
+        'body': pick.text(rng.randint(20, 200)),
+        'safety_tips': pick.text(rng.randint(5, 30)) if rng.random() < 0.4 else None,
+        'timestamp': pick.recent(now), 'like_count': 0, 'comment_count': 0,
+    } for diary_id in diary_ids))
+
+    hot_diaries = diary_ids[:]
+    rng.shuffle(hot_diaries)
+    counts['comments'] = _bulk_insert('comments', db.insert(Comment), ({
+        'diary_id': pick.hot(hot_diaries), 'user_id': pick.hot(active_users),
+        'body': pick.text(rng.randint(3, 30)), 'timestamp': pick.recent(now),
+    } for _ in range(comments)))
+    # Duplicate (diary, user) pairs are dropped by the unique index
+    counts['likes'] = _bulk_insert('likes', insert_ignore(Like), (
+        {'diary_id': pick.hot(hot_diaries), 'user_id': rng.choice(user_ids)}
+        for _ in range(likes)
+    ))
+    del hot_diaries
+
+    # Denormalized counters, each counted through its table's diary index
+    db.session.execute(db.update(DiaryEntry).where(DiaryEntry.id >= first_diary).values(
+        like_count=db.select(db.func.count(Like.id)).where(Like.diary_id == DiaryEntry.id)
+        .scalar_subquery(),
+        comment_count=db.select(db.func.count(Comment.id)).where(Comment.diary_id == DiaryEntry.id)
+        .scalar_subquery()))
+    db.session.commit()
+
+    def incident():
+        lat, lon = pick.location()
+        approved = rng.random() < 0.85
+        return {
+            'user_id': pick.hot(active_users), 'location': f'{lat:.4f}, {lon:.4f}',
+            'category': pick.category(), 'description': pick.text(rng.randint(10, 60)),
+            'approved': approved, 'timestamp': pick.recent(now),
+            'latitude': lat if approved else None, 'longitude': lon if approved else None,
+            'geohash': geo.encode(lat, lon) if approved else None,
+        }
+
+    counts['incidents'] = _bulk_insert('incidents', db.insert(Incident),
+                                       (incident() for _ in range(incidents)))
+    counts['alerts'] = _bulk_insert('alerts', db.insert(Alert), ({
+        'user_id': rng.choice(user_ids), 'message': f'Safety Alert: {pick.text(8)}',
+        'sent_at': pick.recent(now, days=90),
+    } for _ in range(alerts)))
+
+    if sqlite:
+        db.session.execute(db.text(f'PRAGMA synchronous = {int(synchronous)}'))
+
+    rebuild_rollups()
+    rebuild_search_index()
+    print(f"✅ Seeded {sum(counts.values()):,} rows in {time.monotonic() - started:.1f}s")
+    return counts
+
+def seed_command(argv):
+    """``python setup.py seed``: load a production-sized synthetic dataset"""
+    parser = argparse.ArgumentParser(prog='setup.py seed', description=seed_database.__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--diaries', type=int, default=1000000)
+    parser.add_argument('--incidents', type=int, default=1000000)
+    parser.add_argument('--comments', type=int, help='default: half the diaries')
+    parser.add_argument('--likes', type=int, help='default: twice the diaries')
+    parser.add_argument('--alerts', type=int, help='default: five per user')
+    parser.add_argument('--admins', type=int, default=0, help='make the first N seeded users admins')
+    parser.add_argument('--password', default='password123', help='password of every seeded user')
+    parser.add_argument('--seed', type=int, default=42, help='random seed, for repeatable data')
+    args = parser.parse_args(argv)
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        seed_database(users=args.users, diaries=args.diaries, incidents=args.incidents,
+                      comments=args.comments, likes=args.likes, alerts=args.alerts,
+                      admins=args.admins, password=args.password, seed=args.seed)
+
 def generate_ssl_certificates():
     """Generate SSL certificates for development."""
     print("🔄 Generating SSL certificates...")
@@ -177,4 +425,10 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main()
+    if sys.argv[1:2] == ['seed']:
+        seed_command(sys.argv[2:])
+    elif sys.argv[1:2] == ['upgrade']:
+        # Database only: upgrade the schema and backfill, e.g. after a deploy
+        sys.exit(0 if setup_database() else 1)
+    else:
+        main()
@@ -178,6 +178,7 @@ function loadRiskPoints(map) {
                             <h6>${risk.category}</h6>
                             <p><strong>Location:</strong> ${risk.location}</p>
                             <p>${risk.description}</p>
+                            ${risk.thumbnail_url ? `<img src="${risk.thumbnail_url}" alt="Incident photo" style="max-width: 160px;" class="mb-2 d-block">` : ''}
                             <small class="text-muted">${new Date(risk.timestamp).toLocaleDateString()}</small>
                         </div>
                     `
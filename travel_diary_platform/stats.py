@@ -0,0 +1,97 @@
+import threading
+import time
+from flask import current_app
+from database import db
+from cache import data_version
+from models import DiaryEntry, Incident, User
+import rollups
+
+RECENT_ITEMS = 3
+
+
+class StatsService:
+    """Site-wide counts and recent-content snapshot, refreshed at most once per TTL.
+
+    The snapshot holds plain dicts rather than ORM objects so it can outlive
+    the session that loaded it. It is also refreshed early when the incident
+    data version moves or when ``invalidate`` is called, and only one thread
+    rebuilds it at a time. The version only reflects approvals made in other
+    processes when it is shared through ``CACHE_REDIS_URL``; otherwise those
+    show up once the TTL expires.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._snapshot = None
+        self._loaded_at = 0.0
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _stale(self, version):
+        return (self._snapshot is None
+                or time.monotonic() - self._loaded_at > self.ttl
+                or version != self._version)
+
+    def get(self):
+        try:
+            version = data_version()[0]
+        except Exception:
+            version = self._version
+        if self._stale(version):
+            with self._lock:
+                if self._stale(version):
+                    self._snapshot = self._load()
+                    self._loaded_at = time.monotonic()
+                    self._version = version
+        return self._snapshot
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _load(self):
+        # Content totals come from the daily rollups rather than table scans
+        totals = rollups.totals()
+        total_incidents = totals.get(rollups.INCIDENTS, 0)
+        approved_incidents = totals.get(rollups.APPROVED_INCIDENTS, 0)
+        total_users = db.session.execute(db.select(db.func.count(User.id))).scalar()
+
+        recent_diaries = DiaryEntry.query.options(db.joinedload(DiaryEntry.author)) \
+            .order_by(DiaryEntry.timestamp.desc()).limit(RECENT_ITEMS).all()
+        recent_incidents = Incident.query.filter_by(approved=True) \
+            .order_by(Incident.timestamp.desc()).limit(RECENT_ITEMS).all()
+
+        return {
+            'total_diaries': totals.get(rollups.DIARIES, 0),
+            'total_incidents': total_incidents,
+            'approved_incidents': approved_incidents,
+            'pending_incidents': total_incidents - approved_incidents,
+            'total_users': total_users,
+            'recent_diaries': [{
+                'id': diary.id,
+                'title': diary.title,
+                'body': diary.body,
+                'timestamp': diary.timestamp,
+                'author': {'username': diary.author.username if diary.author else None},
+            } for diary in recent_diaries],
+            'recent_incidents': [{
+                'id': incident.id,
+                'location': incident.location,
+                'category': incident.category,
+                'description': incident.description,
+                'timestamp': incident.timestamp,
+            } for incident in recent_incidents],
+        }
+
+
+def init_app(app):
+    app.extensions['stats'] = StatsService(app.config.get('STATS_TTL', 60))
+
+
+def get_stats():
+    """Current stats snapshot for the app"""
+    return current_app.extensions['stats'].get()
+
+
+def invalidate_stats():
+    """Drop the snapshot so the next read reloads it"""
+    current_app.extensions['stats'].invalidate()
@@ -0,0 +1,59 @@
+import re
+from flask import current_app
+from database import db
+from geo import cover_radius, prefixes
+from models import AlertSubscriptionCell, Preference
+
+_CELL = re.compile(r'^[0-9b-hjkmnp-z]{1,12}$')
+
+
+def parse_cells(value):
+    """Split a comma/space separated list of geohash cells; raises ValueError on a bad cell"""
+    cells = [cell for cell in re.split(r'[\s,]+', (value or '').strip().lower()) if cell]
+    for cell in cells:
+        if not _CELL.match(cell):
+            raise ValueError(f'{cell!r} is not a geohash cell')
+    return cells
+
+
+def subscription_cells(pref):
+    """Cells covering a preference's home radius plus its explicit cells"""
+    cells = set(parse_cells(pref.alert_cells))
+    if pref.home_latitude is not None and pref.home_longitude is not None:
+        radius = pref.alert_radius_km or current_app.config['ALERT_DEFAULT_RADIUS_KM']
+        cells |= cover_radius(pref.home_latitude, pref.home_longitude, radius,
+                              current_app.config['SUBSCRIPTION_MAX_CELLS'])
+    return cells
+
+
+def update_subscription(pref):
+    """Rewrite a user's rows in the cell index; runs in the caller's transaction"""
+    cells = subscription_cells(pref)
+    pref.geo_targeted = bool(cells)
+    db.session.execute(db.delete(AlertSubscriptionCell)
+                       .where(AlertSubscriptionCell.user_id == pref.user_id))
+    if cells:
+        db.session.execute(db.insert(AlertSubscriptionCell), [
+            {'cell': cell, 'user_id': pref.user_id} for cell in sorted(cells)
+        ])
+    return cells
+
+
+def subscribers_for(geohash):
+    """Subquery of user ids whose areas contain ``geohash``.
+
+    Subscriptions are stored at whatever precision fits the area, so the
+    lookup is an IN over the incident's prefixes on the (cell, user_id)
+    index: at most twelve index probes however many users there are.
+    """
+    return db.select(AlertSubscriptionCell.user_id) \
+        .where(AlertSubscriptionCell.cell.in_(prefixes(geohash)))
+
+
+def rebuild_subscriptions():
+    """Recompute the cell index for every preference"""
+    count = 0
+    for pref in Preference.query.all():
+        count += len(update_subscription(pref))
+    db.session.commit()
+    return count
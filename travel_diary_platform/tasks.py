@@ -1,16 +1,50 @@
 import os
-from celery import Celery
-from flask import current_app
+import threading
+import uuid
+from celery import Celery, Task
+from celery.signals import worker_process_init, worker_process_shutdown
+from flask import current_app, has_app_context
 from app import create_app, db
 from config import Config
-from models import User, Incident, Alert, Preference
-from twilio.rest import Client
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from models import User, Incident, Alert, OutboxEvent, PendingDigestItem
+from fanout import AlertFanout, iter_recipient_chunks, recipient_query, claim_deliveries, record_deliveries
+import outbox
+from digest import queue_digest_items, due_digest_users, claim_digest_items, compose_digest, finish_digests
+from whatsapp import get_whatsapp_sender, close_whatsapp_sender
+from mailer import get_mail_pool, close_mail_pool
+from retention import purge_alerts, purge_deliveries, archive_path_for
+from reports import report_window, write_safety_report
+import photos
+from cache import bump_data_version
+
+_app = None
+_app_lock = threading.Lock()
+
+def get_app():
+    """The Flask app shared by every task in this worker process, built on first use"""
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = create_app()
+    return _app
+
+class FlaskTask(Task):
+    """Run each task inside the shared app's context.
+
+    Pushing a context on an existing app costs microseconds, whereas
+    ``create_app`` re-registers every blueprint and builds a new engine and
+    connection pool. A task called while a context is already active (e.g.
+    directly from a request or a test) runs in that context instead.
+    """
+    def __call__(self, *args, **kwargs):
+        if has_app_context():
+            return self.run(*args, **kwargs)
+        with get_app().app_context():
+            return self.run(*args, **kwargs)
 
 # Initialize Celery
-celery = Celery('travel_diary_platform')
+celery = Celery('travel_diary_platform', task_cls=FlaskTask)
 celery.conf.update(
     broker_url=os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0'),
     result_backend=os.environ.get('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0'),
@@ -21,35 +55,33 @@ celery.conf.update(
     enable_utc=True,
 )
 
+@worker_process_init.connect
+def init_worker_app(**kwargs):
+    """Build the app once per worker process, dropping connections inherited from a fork"""
+    app = get_app()
+    with app.app_context():
+        # close=False leaves the parent's sockets alone; the child opens its own
+        db.engine.dispose(close=False)
+
+@worker_process_shutdown.connect
+def close_transports(**kwargs):
+    """Close pooled provider connections when a worker process exits"""
+    close_mail_pool()
+    close_whatsapp_sender()
+    if _app is not None:
+        with _app.app_context():
+            db.engine.dispose()
+
 def make_celery(app):
-    """Create Celery instance with Flask app context"""
+    """Bind Celery to ``app``, which then serves as every task's shared app"""
+    global _app
+    _app = app
     celery.conf.update(app.config)
-    
-    class ContextTask(celery.Task):
-        def __call__(self, *args, **kwargs):
-            with app.app_context():
-                return self.run(*args, **kwargs)
-    
-    celery.Task = ContextTask
     return celery
 
-@celery.task
-def send_incident_alert(incident_id):
-    """Send alerts to users when an incident is approved"""
-    try:
-        app = create_app()
-        with app.app_context():
-            incident = Incident.query.get(incident_id)
-            if not incident or not incident.approved:
-                return {'status': 'error', 'message': 'Incident not found or not approved'}
-            
-            # Get all users who want alerts
-            users_with_alerts = User.query.join(Preference).filter(
-                (Preference.alert_via_whatsapp == True) | 
-                (Preference.alert_via_email == True)
-            ).all()
-            
-            alert_message = f"""
+def incident_alert(incident):
+    """(subject, message) for a single incident alert"""
+    message = f"""
 🚨 TRAVEL SAFETY ALERT 🚨
 
 Location: {incident.location}
@@ -59,80 +91,171 @@ Description: {incident.description[:200]}{'...' if len(incident.description) > 2
 Stay safe and be aware of your surroundings.
 
 - Travel Diary Platform
-            """.strip()
-            
-            sent_count = 0
-            failed_count = 0
-            
-            for user in users_with_alerts:
-                try:
-                    pref = user.preferences
-                    
-                    # Send WhatsApp alert if enabled
-                    if pref.alert_via_whatsapp and pref.whatsapp_number:
-                        success = send_whatsapp_alert(pref.whatsapp_number, alert_message)
-                        if success:
-                            sent_count += 1
-                        else:
-                            failed_count += 1
-                    
-                    # Send email alert if enabled (or as fallback)
-                    elif pref.alert_via_email and pref.email:
-                        success = send_email_alert(pref.email, 
-                                                 f"Safety Alert: {incident.location}", 
-                                                 alert_message)
-                        if success:
-                            sent_count += 1
-                        else:
-                            failed_count += 1
-                    
-                    # Log the alert
-                    alert_record = Alert(
-                        user_id=user.id,
-                        message=alert_message
-                    )
-                    db.session.add(alert_record)
-                    
-                except Exception as e:
-                    print(f"Error sending alert to user {user.id}: {str(e)}")
-                    failed_count += 1
-            
-            db.session.commit()
-            
+    """.strip()
+    return f"Safety Alert: {incident.location}", message
+
+def alert_fanout(config):
+    """Fan-out engine over the pooled providers, opened on the calling thread"""
+    # Open the provider transports on this thread so the send threads share them
+    get_mail_pool(config)
+    get_whatsapp_sender(config)
+    return AlertFanout(
+        senders={
+            'whatsapp': lambda address, subject, message: send_whatsapp_alert(address, message),
+            'email': send_email_alert,
+        },
+        max_workers=config['ALERT_MAX_WORKERS'],
+        channel_limits={
+            'whatsapp': config['ALERT_WHATSAPP_CONCURRENCY'],
+            'email': config['ALERT_EMAIL_CONCURRENCY'],
+        },
+    )
+
+@celery.task(bind=True, max_retries=5)
+def send_incident_alert(self, incident_id):
+    """Send alerts to users when an incident is approved, or buffer them in digest mode"""
+    try:
+        incident = Incident.query.get(incident_id)
+        if not incident or not incident.approved:
+            return {'status': 'error', 'message': 'Incident not found or not approved'}
+        
+        alert_subject, alert_message = incident_alert(incident)
+        config = current_app.config
+        
+        # Each run claims its deliveries under its own tag, so retries and
+        # duplicate runs only message users nobody has alerted yet
+        claim = uuid.uuid4().hex
+        skipped = {'already_claimed': 0}
+        
+        def claimed_chunks():
+            recipients = recipient_query(incident, config['ALERT_BROADCAST_UNTARGETED'])
+            for chunk in iter_recipient_chunks(recipients, config['ALERT_CHUNK_SIZE']):
+                claimed = claim_deliveries(incident_id, chunk, claim)
+                skipped['already_claimed'] += len(chunk) - len(claimed)
+                if claimed:
+                    yield claimed
+        
+        if config['ALERT_DIGEST_WINDOW']:
+            # Digest mode: buffer for flush_alert_digests instead of sending now
+            queued = sum(queue_digest_items(incident_id, chunk) for chunk in claimed_chunks())
             return {
-                'status': 'success',
-                'sent': sent_count,
-                'failed': failed_count,
+                'status': 'queued',
+                'queued': queued,
+                'already_claimed': skipped['already_claimed'],
                 'incident_id': incident_id
             }
-            
+        
+        def log_chunk(chunk, results):
+            # Record outcomes and log the sent alerts for this chunk in one commit;
+            # failed sends are logged by the retry that delivers them
+            record_deliveries(incident_id, results)
+            alerts = [
+                {'user_id': recipient.id, 'message': alert_message}
+                for recipient in chunk if results[recipient.id][1]
+            ]
+            if alerts:
+                db.session.execute(db.insert(Alert), alerts)
+            db.session.commit()
+        
+        def report_progress(stats):
+            if self.request.id:
+                self.update_state(state='PROGRESS', meta=stats)
+        
+        stats = alert_fanout(config).run(
+            claimed_chunks(),
+            alert_subject,
+            alert_message,
+            on_chunk=log_chunk,
+            on_progress=report_progress,
+        )
+        
+    except Exception as e:
+        db.session.rollback()
+        if self.request.id and self.request.retries < self.max_retries:
+            raise self.retry(exc=e, countdown=retry_delay(self.request.retries))
+        return {'status': 'error', 'message': str(e)}
+    
+    # Failed deliveries stay claimable, so a retry resends only those
+    if stats['failed'] and self.request.id and self.request.retries < self.max_retries:
+        raise self.retry(countdown=retry_delay(self.request.retries))
+    
+    return {
+        'status': 'success',
+        'sent': stats['sent'],
+        'failed': stats['failed'],
+        'recipients': stats['recipients'],
+        'already_claimed': skipped['already_claimed'],
+        'elapsed': stats['elapsed'],
+        'incident_id': incident_id
+    }
+
+@celery.task
+def flush_alert_digests():
+    """Send one combined message per recipient for buffered incidents (run every few seconds)"""
+    try:
+        config = current_app.config
+        engine = alert_fanout(config)
+        claim = uuid.uuid4().hex
+        claimed = {}
+        
+        def due_chunks():
+            # Claiming commits, so a concurrent flush never picks the same users
+            while True:
+                user_ids = due_digest_users(config['ALERT_DIGEST_WINDOW'],
+                                            config['ALERT_DIGEST_MAX_LATENCY'],
+                                            config['ALERT_CHUNK_SIZE'])
+                if not user_ids:
+                    return
+                claimed.update(claim_digest_items(user_ids, claim))
+                chunk = recipient_query().filter(User.id.in_(user_ids)).order_by(User.id).all()
+                chunk = [recipient for recipient in chunk if recipient.id in claimed]
+                if chunk:
+                    yield chunk
+                # Drops items of recipients with no channel; failed sends were
+                # already released by finish_digests
+                db.session.execute(db.delete(PendingDigestItem).where(
+                    PendingDigestItem.claim == claim,
+                    PendingDigestItem.user_id.in_(user_ids)))
+                db.session.commit()
+        
+        def compose(recipient):
+            return compose_digest(claimed[recipient.id], incident_alert)
+        
+        def log_chunk(chunk, results):
+            finish_digests(claimed, results, claim, config['ALERT_DIGEST_MAX_ATTEMPTS'])
+            alerts = [
+                {'user_id': recipient.id, 'message': compose(recipient)[1]}
+                for recipient in chunk if results[recipient.id][1]
+            ]
+            if alerts:
+                db.session.execute(db.insert(Alert), alerts)
+            db.session.commit()
+        
+        stats = engine.run(due_chunks(), None, None, on_chunk=log_chunk, compose=compose)
+        items = sum(len(claimed[user_id]) for user_id in claimed)
+        print(f"Flushed {items} buffered alerts as {stats['sent']} digest messages")
+        return {'status': 'success', 'incidents': items, **stats}
+        
     except Exception as e:
+        db.session.rollback()
         return {'status': 'error', 'message': str(e)}
 
+def retry_delay(retries):
+    """Exponential backoff for alert retries, capped at five minutes"""
+    return min(300, 5 * 2 ** retries)
+
 def send_whatsapp_alert(phone_number, message):
-    """Send WhatsApp alert using Twilio"""
+    """Send WhatsApp alert through the shared, rate-limited Twilio client"""
     try:
-        account_sid = os.environ.get('TWILIO_ACCOUNT_SID')
-        auth_token = os.environ.get('TWILIO_AUTH_TOKEN')
-        whatsapp_from = os.environ.get('TWILIO_WHATSAPP_FROM')
+        sender = get_whatsapp_sender()
         
-        if not all([account_sid, auth_token, whatsapp_from]):
+        if not sender.configured:
             print("Twilio credentials not configured")
             return False
         
-        client = Client(account_sid, auth_token)
-        
-        # Ensure phone number has country code
-        if not phone_number.startswith('+'):
-            phone_number = '+' + phone_number
+        sid = sender.send(phone_number, message)
         
-        message = client.messages.create(
-            body=message,
-            from_=whatsapp_from,
-            to=f'whatsapp:{phone_number}'
-        )
-        
-        print(f"WhatsApp alert sent: {message.sid}")
+        print(f"WhatsApp alert sent: {sid}")
         return True
         
     except Exception as e:
@@ -140,37 +263,15 @@ def send_whatsapp_alert(phone_number, message):
         return False
 
 def send_email_alert(email, subject, message):
-    """Send email alert using SMTP"""
+    """Send email alert through the pooled SMTP transport"""
     try:
-        smtp_server = os.environ.get('MAIL_SERVER')
-        smtp_port = int(os.environ.get('MAIL_PORT', 587))
-        smtp_username = os.environ.get('MAIL_USERNAME')
-        smtp_password = os.environ.get('MAIL_PASSWORD')
-        use_tls = os.environ.get('MAIL_USE_TLS', 'True').lower() == 'true'
+        pool = get_mail_pool()
         
-        if not all([smtp_server, smtp_username, smtp_password]):
+        if not all([pool.host, pool.username, pool.password]):
             print("SMTP credentials not configured")
             return False
         
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = smtp_username
-        msg['To'] = email
-        msg['Subject'] = subject
-        
-        # Add body to email
-        msg.attach(MIMEText(message, 'plain'))
-        
-        # Create SMTP session
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        if use_tls:
-            server.starttls()
-        server.login(smtp_username, smtp_password)
-        
-        # Send email
-        text = msg.as_string()
-        server.sendmail(smtp_username, email, text)
-        server.quit()
+        pool.send(email, subject, message)
         
         print(f"Email alert sent to: {email}")
         return True
@@ -183,70 +284,129 @@ def send_email_alert(email, subject, message):
 def cleanup_old_alerts():
     """Clean up old alert records (run daily)"""
     try:
-        app = create_app()
-        with app.app_context():
-            from datetime import datetime, timedelta
-            
-            # Delete alerts older than 30 days
-            cutoff_date = datetime.utcnow() - timedelta(days=30)
-            old_alerts = Alert.query.filter(Alert.sent_at < cutoff_date).all()
-            
-            count = len(old_alerts)
-            for alert in old_alerts:
-                db.session.delete(alert)
-            
-            db.session.commit()
-            
-            return {'status': 'success', 'deleted': count}
-            
+        from datetime import datetime, timedelta
+        
+        # Delete alerts older than the retention window, archiving them first if configured
+        cutoff_date = datetime.utcnow() - timedelta(days=current_app.config['ALERT_RETENTION_DAYS'])
+        archive_dir = current_app.config['ALERT_ARCHIVE_DIR']
+        stats = purge_alerts(
+            cutoff_date,
+            batch_size=current_app.config['ALERT_PURGE_BATCH_SIZE'],
+            archive_path=archive_path_for(archive_dir) if archive_dir else None,
+        )
+        
+        print(f"Purged {stats['deleted']} alerts in {stats['batches']} batches "
+              f"({stats['rows_per_second']} rows/s)")
+        
+        # Delivery rows only guard against resending while a task may still retry
+        stats['deliveries_deleted'] = purge_deliveries(
+            cutoff_date, batch_size=current_app.config['ALERT_PURGE_BATCH_SIZE'])
+        print(f"Purged {stats['deliveries_deleted']} alert deliveries")
+        
+        # Dispatched outbox events are only kept for troubleshooting
+        db.session.execute(db.delete(OutboxEvent).where(OutboxEvent.dispatched_at < cutoff_date))
+        db.session.commit()
+        return {'status': 'success', **stats}
+        
+    except Exception as e:
+        return {'status': 'error', 'message': str(e)}
+
+@celery.task
+def generate_safety_report(start=None, end=None, days=7, region_precision=None):
+    """Generate the safety report for a date range (run weekly for the past seven whole days)"""
+    try:
+        start, end = report_window(start, end, days)
+        if region_precision is None:
+            region_precision = current_app.config['REPORT_REGION_PRECISION']
+
+        # Stream the report to a file when a report directory is configured
+        report_dir = current_app.config['REPORT_DIR']
+        if report_dir:
+            os.makedirs(report_dir, exist_ok=True)
+            path = os.path.join(report_dir, f"safety-report-{start:%Y%m%d}-{end:%Y%m%d}.txt")
+            with open(path, 'w', encoding='utf-8') as out:
+                total = write_safety_report(out, start, end, region_precision=region_precision)
+            print(f"Safety report written to {path}")
+        else:
+            path = None
+            print("Safety report generated:")
+            total = write_safety_report(None, start, end, region_precision=region_precision)
+        
+        return {'status': 'success', 'incidents_count': total, 'path': path}
+        
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
 @celery.task
-def generate_safety_report():
-    """Generate weekly safety report (run weekly)"""
+def process_photo(name):
+    """Check an uploaded photo and render its WebP thumbnails"""
     try:
-        app = create_app()
-        with app.app_context():
-            from datetime import datetime, timedelta
-            
-            # Get incidents from the past week
-            week_ago = datetime.utcnow() - timedelta(days=7)
-            recent_incidents = Incident.query.filter(
-                Incident.timestamp >= week_ago,
-                Incident.approved == True
-            ).all()
-            
-            # Group by category
-            categories = {}
-            for incident in recent_incidents:
-                if incident.category not in categories:
-                    categories[incident.category] = []
-                categories[incident.category].append(incident)
-            
-            # Generate report
-            report = f"""
-WEEKLY SAFETY REPORT
-Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}
+        # Uploads are only checked by extension while the request streams
+        # them in; a file that is not what it claims is deleted here
+        if not photos.check_signature(name):
+            photos.discard_photo(name)
+            db.session.execute(db.update(Incident).where(Incident.photo_filename == name)
+                               .values(photo_filename=None, photo_status=photos.REJECTED))
+            db.session.commit()
+            print(f"Rejected upload {name}: not a valid image file")
+            return {'status': photos.REJECTED, 'name': name}
+        
+        status = photos.READY
+        try:
+            written = photos.make_derivatives(name)
+        except ImportError:
+            # Without Pillow the pages keep serving the original
+            print("Pillow is not installed; photo thumbnails are disabled")
+            return {'status': 'skipped', 'name': name}
+        except OSError as e:
+            print(f"Could not render thumbnails for {name}: {str(e)}")
+            status, written = photos.FAILED, []
+        
+        # Identical uploads share the file, so every incident using it is updated
+        db.session.execute(db.update(Incident).where(Incident.photo_filename == name)
+                           .values(photo_status=status))
+        db.session.commit()
+        # The map's cached risks carry thumbnail URLs
+        bump_data_version()
+        return {'status': status, 'name': name, 'written': written}
+        
+    except Exception as e:
+        db.session.rollback()
+        return {'status': 'error', 'message': str(e)}
+
+# Outbox topics and the tasks that consume them
+OUTBOX_TASKS = {
+    'incident.approved': send_incident_alert,
+    'photo.stored': process_photo,
+}
 
-Total Incidents This Week: {len(recent_incidents)}
+def relay_outbox_batch(batch_size):
+    """Relay one outbox batch over a single broker connection that fails fast.
 
-BREAKDOWN BY CATEGORY:
-"""
-            
-            for category, incidents in categories.items():
-                report += f"\n{category.upper()}: {len(incidents)} incidents\n"
-                for incident in incidents[:3]:  # Show top 3 per category
-                    report += f"  - {incident.location}: {incident.description[:100]}...\n"
-            
-            report += f"\n\nFor more details, visit the Travel Diary Platform safety map."
-            
-            # Here you could send this report to admins or save it
-            print("Weekly safety report generated:")
-            print(report)
-            
-            return {'status': 'success', 'incidents_count': len(recent_incidents)}
-            
+    Publishing must not stall a request or the relay for long when the
+    broker is down: the events simply stay in the outbox for the next run.
+    Results are ignored because the delivery log is the record of the send.
+    """
+    with celery.connection_for_write(transport_options={'max_retries': 0}) as connection:
+        def publish(topic, payload):
+            OUTBOX_TASKS[topic].apply_async(kwargs=payload, connection=connection,
+                                            retry=False, ignore_result=True)
+        return outbox.relay(publish, batch_size)
+
+@celery.task
+def relay_outbox():
+    """Publish events committed to the outbox (run every few seconds)"""
+    try:
+        batch_size = current_app.config['OUTBOX_BATCH_SIZE']
+        totals = {'dispatched': 0, 'failed': 0}
+        while True:
+            stats = relay_outbox_batch(batch_size)
+            totals['dispatched'] += stats['dispatched']
+            totals['failed'] += stats['failed']
+            if stats['failed'] or stats['dispatched'] < batch_size:
+                break
+        return {'status': 'success', **totals}
+        
     except Exception as e:
         return {'status': 'error', 'message': str(e)}
 
@@ -254,6 +414,14 @@ BREAKDOWN BY CATEGORY:
 from celery.schedules import crontab
 
 celery.conf.beat_schedule = {
+    'relay-outbox': {
+        'task': 'tasks.relay_outbox',
+        'schedule': float(Config.OUTBOX_RELAY_INTERVAL),
+    },
+    'flush-alert-digests': {
+        'task': 'tasks.flush_alert_digests',
+        'schedule': float(Config.ALERT_DIGEST_FLUSH_INTERVAL),
+    },
     'cleanup-old-alerts': {
         'task': 'tasks.cleanup_old_alerts',
         'schedule': crontab(hour=2, minute=0),  # Daily at 2 AM
@@ -266,6 +434,5 @@ celery.conf.beat_schedule = {
 
 if __name__ == '__main__':
     # For testing tasks directly
-    app = create_app()
-    celery = make_celery(app)
+    celery = make_celery(get_app())
     celery.start()
@@ -0,0 +1,30 @@
+import pytest
+from app import create_app, db
+
+# Applied before the extensions are initialized, so the engine is built on
+# an in-memory database rather than DATABASE_URL or the default app.db
+TEST_CONFIG = {
+    'TESTING': True,
+    'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:',
+    'WTF_CSRF_ENABLED': False,
+}
+
+@pytest.fixture
+def app_config():
+    """Extra config for the app; override (or parametrize) it in a test module."""
+    return {}
+
+@pytest.fixture
+def app(app_config):
+    """Create and configure a new app instance for each test."""
+    app = create_app({**TEST_CONFIG, **app_config})
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.drop_all()
+
+@pytest.fixture
+def client(app):
+    """A test client for the app."""
+    return app.test_client()
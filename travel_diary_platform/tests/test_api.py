@@ -1,27 +1,9 @@
 import pytest
 import json
-from app import create_app, db
+from app import db
 from models import User, Incident, DiaryEntry
 from werkzeug.security import generate_password_hash
 
-@pytest.fixture
-def app():
-    """Create and configure a new app instance for each test."""
-    app = create_app()
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['WTF_CSRF_ENABLED'] = False
-    
-    with app.app_context():
-        db.create_all()
-        yield app
-        db.drop_all()
-
-@pytest.fixture
-def client(app):
-    """A test client for the app."""
-    return app.test_client()
-
 @pytest.fixture
 def admin_user(app):
     """Create an admin user for testing."""
@@ -195,3 +177,62 @@ def test_risks_api_json_format(client, app, regular_user):
         required_fields = ['id', 'location', 'category', 'description', 'timestamp']
         for field in required_fields:
             assert field in risk
+
+def test_risks_api_etag_and_not_modified(client):
+    """Test that a matching If-None-Match gets a 304 with no body."""
+    response = client.get('/alerts/api/risks')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert response.headers['Last-Modified']
+
+    response = client.get('/alerts/api/risks', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+def test_risks_api_cache_invalidated_by_version_bump(client, app):
+    """Test that cached risks are served until the data version changes."""
+    from cache import bump_data_version
+
+    etag = client.get('/alerts/api/risks').headers['ETag']
+    incident = Incident(user_id=1, location='Rome, Italy', category='theft',
+                        description='Bag snatching', approved=True)
+    db.session.add(incident)
+    db.session.commit()
+
+    # Without a bump the cached (empty) list is still served
+    response = client.get('/alerts/api/risks', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+
+    bump_data_version()
+    response = client.get('/alerts/api/risks', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert len(json.loads(response.data)) == 1
+
+def test_risks_api_cache_entries_expire_after_max_age(client, app):
+    """Test that without a shared counter, cached risks expire after CACHE_MAX_AGE."""
+    from cache import get_response_cache
+
+    client.get('/alerts/api/risks')
+    db.session.add(Incident(user_id=1, location='Rome, Italy', category='theft',
+                            description='Bag snatching', approved=True))
+    db.session.commit()
+    assert json.loads(client.get('/alerts/api/risks').data) == []
+
+    # Another process approved it: this one only sees it once the entry is too old
+    for entry in get_response_cache()._entries.values():
+        entry.created -= app.config['CACHE_MAX_AGE'] + 1
+    assert len(json.loads(client.get('/alerts/api/risks').data)) == 1
+
+def test_health_check_stats_are_cached_until_invalidated(client, app):
+    """Test that health stats come from the shared snapshot."""
+    from stats import invalidate_stats
+
+    assert client.get('/admin/health').get_json()['stats']['users'] == 0
+
+    db.session.add(User(username='someone', email='someone@example.com', password_hash='x'))
+    db.session.commit()
+    assert client.get('/admin/health').get_json()['stats']['users'] == 0
+
+    invalidate_stats()
+    assert client.get('/admin/health').get_json()['stats']['users'] == 1
@@ -1,26 +1,8 @@
 import pytest
-from app import create_app, db
+from app import db
 from models import User, Preference
 from werkzeug.security import generate_password_hash
 
-@pytest.fixture
-def app():
-    """Create and configure a new app instance for each test."""
-    app = create_app()
-    app.config['TESTING'] = True
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
-    app.config['WTF_CSRF_ENABLED'] = False
-    
-    with app.app_context():
-        db.create_all()
-        yield app
-        db.drop_all()
-
-@pytest.fixture
-def client(app):
-    """A test client for the app."""
-    return app.test_client()
-
 @pytest.fixture
 def runner(app):
     """A test runner for the app's Click commands."""
@@ -169,3 +151,40 @@ def test_logout(client, app):
     # Should not be able to access profile after logout
     response = client.get('/auth/profile')
     assert response.status_code == 302  # Redirect to login
+
+def test_profile_alert_area_builds_cell_index(client, app):
+    """Test that saving a home area indexes it and clearing it untargets the user."""
+    from models import AlertSubscriptionCell
+    client.post('/auth/signup', data={
+        'username': 'testuser',
+        'email': 'test@example.com',
+        'password': 'testpassword123'
+    })
+    client.post('/auth/login', data={'username': 'testuser', 'password': 'testpassword123'})
+
+    client.post('/auth/profile', data={'alert_via_email': 'on', 'email': 'test@example.com',
+                                       'home_location': 'Paris, France', 'alert_radius_km': '10',
+                                       'alert_cells': 'sr2y'})
+    pref = Preference.query.one()
+    assert pref.geo_targeted
+    assert (pref.home_latitude, pref.home_longitude) == (48.8566, 2.3522)
+    cells = {row.cell for row in AlertSubscriptionCell.query.all()}
+    assert 'sr2y' in cells
+    assert any('u09tvw0'.startswith(cell) for cell in cells)
+
+    client.post('/auth/profile', data={'alert_via_email': 'on', 'email': 'test@example.com'})
+    assert not Preference.query.one().geo_targeted
+    assert AlertSubscriptionCell.query.count() == 0
+
+def test_profile_rejects_unknown_home_location(client, app):
+    """Test that an unresolvable home location leaves preferences untouched."""
+    client.post('/auth/signup', data={
+        'username': 'testuser',
+        'email': 'test@example.com',
+        'password': 'testpassword123'
+    })
+    client.post('/auth/login', data={'username': 'testuser', 'password': 'testpassword123'})
+
+    response = client.post('/auth/profile', data={'home_location': 'Atlantis'})
+    assert b'Could not find that home location' in response.data
+    assert Preference.query.one().home_location is None
@@ -0,0 +1,56 @@
+import pytest
+from sqlalchemy import create_engine, event, text
+from app import db
+from config import Config
+import database
+
+def settings(**overrides):
+    config = {name: getattr(Config, name) for name in dir(Config) if name.isupper()}
+    config.update(overrides)
+    return config
+
+def test_engine_options_pool_for_server_databases():
+    """Test that server databases get the configured connection pool."""
+    options = database.engine_options(settings(
+        SQLALCHEMY_DATABASE_URI='postgresql://db/travel', DATABASE_POOL_SIZE=7,
+        DATABASE_MAX_OVERFLOW=3, DATABASE_POOL_RECYCLE=600))
+    assert options['pool_size'] == 7
+    assert options['max_overflow'] == 3
+    assert options['pool_recycle'] == 600
+    assert options['pool_pre_ping'] is True
+
+def test_engine_options_sqlite_and_overrides():
+    """Test that SQLite keeps the default pool and explicit options win."""
+    assert database.engine_options(settings(SQLALCHEMY_DATABASE_URI='sqlite:///app.db')) == {}
+    options = database.engine_options(settings(
+        SQLALCHEMY_DATABASE_URI='postgresql://db/travel',
+        SQLALCHEMY_ENGINE_OPTIONS={'pool_size': 2, 'echo': True}))
+    assert options['pool_size'] == 2
+    assert options['echo'] is True
+
+def test_unsupported_database_is_refused_at_startup():
+    """Test that a backend without upsert support fails when the app is created."""
+    from app import create_app
+    with pytest.raises(ValueError, match='mssql'):
+        create_app({'SQLALCHEMY_DATABASE_URI': 'mssql+pyodbc://db/travel'})
+
+def test_app_connections_get_pragmas(app):
+    """Test that the app's SQLite connections are configured on connect."""
+    assert db.engine.url.database == ':memory:'
+    busy_timeout = db.session.execute(text('PRAGMA busy_timeout')).scalar()
+    assert busy_timeout == app.config['SQLITE_BUSY_TIMEOUT_MS']
+    # An in-memory database has no journal file to switch to WAL
+    assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'memory'
+
+def test_pragmas_switch_journal_mode(tmp_path):
+    """Test that a file database is moved to WAL with the tuned pragmas."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    pragmas = database.sqlite_pragmas(settings(SQLITE_BUSY_TIMEOUT_MS=1234,
+                                               SQLITE_CACHE_SIZE_KB=4096))
+    event.listen(engine, 'connect', database._pragma_listener(pragmas))
+    with engine.connect() as conn:
+        assert conn.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conn.execute(text('PRAGMA synchronous')).scalar() == 1
+        assert conn.execute(text('PRAGMA busy_timeout')).scalar() == 1234
+        assert conn.execute(text('PRAGMA cache_size')).scalar() == -4096
+    engine.dispose()
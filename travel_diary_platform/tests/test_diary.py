@@ -0,0 +1,147 @@
+import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
+from app import db
+from models import User, DiaryEntry, Comment, Like
+from werkzeug.security import generate_password_hash
+from diary.counters import recount_diary_counters
+
+@pytest.fixture
+def author_id(app):
+    """Create a user and return its id."""
+    user = User(username='writer', email='writer@example.com',
+                password_hash=generate_password_hash('writerpass'))
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+@contextmanager
+def count_queries():
+    """Count SQL statements executed inside the block."""
+    statements = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+def add_diaries(author_id, count, comments=0, likes=0):
+    for i in range(count):
+        diary = DiaryEntry(user_id=author_id, title=f'Trip {i}', body='Lovely place')
+        db.session.add(diary)
+        db.session.flush()
+        for j in range(comments):
+            db.session.add(Comment(diary_id=diary.id, user_id=author_id, body=f'Comment {j}'))
+        for j in range(likes):
+            db.session.add(Like(diary_id=diary.id, user_id=author_id + j))
+    db.session.commit()
+    recount_diary_counters()
+
+def login(client):
+    client.post('/auth/login', data={'username': 'writer', 'password': 'writerpass'})
+
+def test_feed_shows_counts_and_recent_comments(client, author_id):
+    """Test that the feed renders aggregated counts and the latest comments."""
+    add_diaries(author_id, 1, comments=5, likes=2)
+    login(client)
+
+    response = client.get('/diary/all')
+    assert response.status_code == 200
+    assert b'<span class="like-count">2</span>' in response.data
+    assert b'5 Comments' in response.data
+    assert b'View all 5 comments' in response.data
+    assert response.data.count(b'class="comment"') == 3
+    assert b'class="like-btn liked"' in response.data
+
+def test_feed_query_count_is_independent_of_page_size(client, author_id):
+    """Test that the feed runs a fixed number of queries."""
+    add_diaries(author_id, 2, comments=2, likes=1)
+    with count_queries() as small:
+        client.get('/diary/all')
+
+    add_diaries(author_id, 20, comments=4, likes=3)
+    with count_queries() as large:
+        client.get('/diary/all')
+
+    assert len(large) == len(small)
+    assert len(large) <= 3
+
+def test_recent_comments_seek_the_diary_index(client, author_id):
+    """Test that the feed's comment query searches by diary instead of scanning."""
+    add_diaries(author_id, 3, comments=2)
+    with count_queries() as statements:
+        client.get('/diary/all')
+    sql = next(statement for statement in statements if 'row_number()' in statement)
+    plan = ' '.join(row[-1] for row in db.session.execute(
+        db.text('EXPLAIN QUERY PLAN ' + sql.replace('?', '1'))))
+    assert 'ix_comment_diary_timestamp_id (diary_id=?)' in plan
+    assert 'SCAN comment' not in plan
+
+def test_diary_api_keyset_pagination(client, author_id):
+    """Test that cursors walk every entry exactly once, newest first."""
+    from datetime import datetime
+    same_time = datetime(2024, 1, 1, 12, 0, 0)
+    for i in range(5):
+        # Identical timestamps force the id tie-breaker to do its job
+        db.session.add(DiaryEntry(user_id=author_id, title=f'Trip {i}', body='x',
+                                  timestamp=same_time))
+    db.session.commit()
+
+    seen = []
+    cursor = None
+    while True:
+        url = '/diary/api/diaries?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        data = client.get(url).get_json()
+        seen.extend(item['id'] for item in data['items'])
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+
+    assert seen == sorted(seen, reverse=True)
+    assert len(seen) == len(set(seen)) == 5
+
+def test_diary_api_rejects_bad_cursor(client):
+    """Test that a tampered cursor is a client error."""
+    response = client.get('/diary/api/diaries?cursor=not-a-cursor')
+    assert response.status_code == 400
+
+def test_like_toggle_keeps_counter_in_step(client, author_id):
+    """Test that liking twice undoes the like and the counter follows."""
+    add_diaries(author_id, 1)
+    diary_id = DiaryEntry.query.first().id
+    login(client)
+
+    response = client.post('/diary/like', data={'diary_id': diary_id})
+    assert response.get_json() == {'liked': True, 'like_count': 1}
+
+    response = client.post('/diary/like', data={'diary_id': diary_id})
+    assert response.get_json() == {'liked': False, 'like_count': 0}
+    assert Like.query.count() == 0
+
+def test_like_unknown_diary_is_not_found(client, author_id):
+    """Test that liking a missing diary leaves no like behind."""
+    login(client)
+    response = client.post('/diary/like', data={'diary_id': 999})
+    assert response.status_code == 404
+    assert Like.query.count() == 0
+
+def test_comment_bumps_counter(client, author_id):
+    """Test that posting a comment updates the diary's comment counter."""
+    add_diaries(author_id, 1)
+    diary_id = DiaryEntry.query.first().id
+    login(client)
+
+    client.post('/diary/comment', data={'diary_id': diary_id, 'body': 'Great tips'})
+
+    assert db.session.get(DiaryEntry, diary_id).comment_count == 1
+
+def test_comment_needs_an_existing_diary(client, author_id):
+    """Test that a comment without a valid diary is refused and nothing is stored."""
+    login(client)
+
+    assert client.post('/diary/comment', data={'body': 'Orphan'}).status_code == 400
+    assert client.post('/diary/comment', data={'diary_id': 'abc', 'body': 'Orphan'}).status_code == 400
+    assert client.post('/diary/comment', data={'diary_id': 999, 'body': 'Orphan'}).status_code == 404
+    assert Comment.query.count() == 0
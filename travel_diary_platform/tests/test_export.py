@@ -0,0 +1,77 @@
+import csv
+import gzip
+import io
+import json
+import pytest
+from datetime import datetime
+from app import db
+from models import User, Incident, DiaryEntry
+
+@pytest.fixture
+def app_config():
+    """Small batches, so exports span several round trips."""
+    return {'EXPORT_BATCH_SIZE': 2}
+
+@pytest.fixture(autouse=True)
+def rows(app):
+    """A few rows to export."""
+    user = User(username='writer', email='writer@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    for day, category, approved in [(1, 'theft', True), (2, 'scam', True),
+                                    (3, 'theft', False), (4, 'theft', True)]:
+        db.session.add(Incident(user_id=user.id, location=f'Town {day}', category=category,
+                                description=f'Report, "quoted" {day}', approved=approved,
+                                timestamp=datetime(2024, 1, day, 12), latitude=41.9,
+                                longitude=12.5, geohash='sr2yk'))
+    db.session.add(DiaryEntry(user_id=user.id, title='Rome', body='Ciao ☀',
+                              timestamp=datetime(2024, 1, 2)))
+    db.session.add(DiaryEntry(title='Anonymous', body='No author',
+                              timestamp=datetime(2024, 1, 3)))
+    db.session.commit()
+
+def ndjson(data):
+    return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+
+def test_export_incidents_ndjson(client):
+    """Test that only approved incidents are streamed, one JSON object per line."""
+    response = client.get('/export/incidents')
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+    assert 'incidents.ndjson' in response.headers['Content-Disposition']
+
+    rows = ndjson(response.data)
+    assert [row['location'] for row in rows] == ['Town 1', 'Town 2', 'Town 4']
+    assert rows[0]['timestamp'] == '2024-01-01T12:00:00'
+    assert rows[0]['description'] == 'Report, "quoted" 1'
+
+def test_export_incidents_filters(client):
+    """Test the category and inclusive date filters."""
+    rows = ndjson(client.get('/export/incidents?category=theft').data)
+    assert [row['location'] for row in rows] == ['Town 1', 'Town 4']
+
+    rows = ndjson(client.get('/export/incidents?since=2024-01-02&until=2024-01-04').data)
+    assert [row['location'] for row in rows] == ['Town 2', 'Town 4']
+
+def test_export_diaries_csv(client):
+    """Test CSV output with a header row, quoting and a missing author."""
+    response = client.get('/export/diaries?format=csv')
+    assert response.mimetype == 'text/csv'
+    rows = list(csv.DictReader(io.StringIO(response.data.decode('utf-8'))))
+    assert [row['title'] for row in rows] == ['Rome', 'Anonymous']
+    assert rows[0]['author'] == 'writer' and rows[0]['body'] == 'Ciao ☀'
+    assert rows[1]['author'] == ''
+
+def test_export_gzip(client):
+    """Test that gzip=1 returns a gzip file holding the same export."""
+    plain = client.get('/export/incidents?format=csv').data
+    response = client.get('/export/incidents?format=csv&gzip=1')
+    assert response.mimetype == 'application/gzip'
+    assert 'incidents.csv.gz' in response.headers['Content-Disposition']
+    assert gzip.decompress(response.data) == plain
+
+def test_export_rejects_bad_arguments(client):
+    """Test that unknown formats and malformed dates are rejected."""
+    assert client.get('/export/incidents?format=xml').status_code == 400
+    assert client.get('/export/diaries?since=yesterday').status_code == 400
@@ -0,0 +1,352 @@
+import threading
+import time
+from collections import namedtuple
+from app import db
+from models import User, Preference, Incident, Alert, AlertDelivery
+from fanout import AlertFanout, iter_recipient_chunks, recipient_query
+from subscriptions import update_subscription
+
+Recipient = namedtuple('Recipient', 'id alert_via_whatsapp whatsapp_number alert_via_email email')
+
+def make_subscribers(count):
+    """Create ``count`` users opted in to email alerts."""
+    for i in range(count):
+        user = User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Preference(user_id=user.id, alert_via_email=True,
+                                  email=f'user{i}@example.com'))
+    db.session.commit()
+
+def test_fanout_prefers_whatsapp_and_skips_unreachable():
+    """Test channel selection mirrors the per-user preferences."""
+    calls = []
+    engine = AlertFanout(senders={
+        'whatsapp': lambda address, subject, message: calls.append(('whatsapp', address)) or True,
+        'email': lambda address, subject, message: calls.append(('email', address)) or True,
+    })
+    chunk = [
+        Recipient(1, True, '+100', True, 'a@example.com'),
+        Recipient(2, False, None, True, 'b@example.com'),
+        Recipient(3, True, None, False, None),
+    ]
+
+    stats = engine.run([chunk], 'subject', 'message')
+
+    assert sorted(calls) == [('email', 'b@example.com'), ('whatsapp', '+100')]
+    assert stats['sent'] == 2
+    assert stats['skipped'] == 1
+    assert stats['recipients'] == 3
+
+def test_fanout_respects_channel_limit():
+    """Test that a channel never exceeds its concurrency limit."""
+    lock = threading.Lock()
+    active = {'now': 0, 'peak': 0}
+
+    def slow_send(address, subject, message):
+        with lock:
+            active['now'] += 1
+            active['peak'] = max(active['peak'], active['now'])
+        time.sleep(0.01)
+        with lock:
+            active['now'] -= 1
+        return True
+
+    engine = AlertFanout(senders={'email': slow_send}, max_workers=8,
+                         channel_limits={'email': 2})
+    chunk = [Recipient(i, False, None, True, f'{i}@example.com') for i in range(20)]
+
+    stats = engine.run([chunk], 'subject', 'message')
+
+    assert stats['sent'] == 20
+    assert active['peak'] <= 2
+
+def test_fanout_slow_channel_does_not_hold_up_others():
+    """Test that queued sends on a capped channel leave other channels free."""
+    release = threading.Event()
+    emailed = threading.Event()
+
+    def stuck_whatsapp(address, subject, message):
+        release.wait(5)
+        return True
+
+    def send_email(address, subject, message):
+        emailed.set()
+        return True
+
+    engine = AlertFanout(senders={'whatsapp': stuck_whatsapp, 'email': send_email},
+                         max_workers=4, channel_limits={'whatsapp': 1})
+    chunk = [Recipient(i, True, f'+{i}', False, None) for i in range(10)]
+    chunk.append(Recipient(10, False, None, True, 'last@example.com'))
+    runner = threading.Thread(target=engine.run, args=([chunk], 'subject', 'message'))
+    runner.start()
+    try:
+        assert emailed.wait(2)
+    finally:
+        release.set()
+        runner.join()
+
+def test_fanout_counts_sender_errors_as_failures():
+    """Test that a raising sender does not abort the chunk."""
+    def flaky_send(address, subject, message):
+        if address.startswith('bad'):
+            raise RuntimeError('provider down')
+        return True
+
+    engine = AlertFanout(senders={'email': flaky_send})
+    chunk = [
+        Recipient(1, False, None, True, 'bad@example.com'),
+        Recipient(2, False, None, True, 'good@example.com'),
+    ]
+    results = {}
+
+    stats = engine.run([chunk], 'subject', 'message',
+                       on_chunk=lambda chunk, chunk_results: results.update(chunk_results))
+
+    assert stats['sent'] == 1
+    assert stats['failed'] == 1
+    assert results == {1: ('email', False), 2: ('email', True)}
+
+def test_recipient_chunks_cover_every_subscriber_once(app):
+    """Test keyset chunking streams each opted-in user exactly once."""
+    make_subscribers(7)
+
+    chunks = list(iter_recipient_chunks(recipient_query(), 3))
+
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    ids = [row.id for chunk in chunks for row in chunk]
+    assert len(set(ids)) == 7
+
+def test_send_incident_alert_logs_every_recipient(app, monkeypatch):
+    """Test the alert task fans out and records one Alert per recipient."""
+    import tasks
+
+    make_subscribers(5)
+    incident = Incident(user_id=1, location='Paris', category='theft',
+                        description='Pickpocket', approved=True)
+    db.session.add(incident)
+    db.session.commit()
+    incident_id = incident.id
+
+    sent = []
+    monkeypatch.setattr(tasks, 'send_email_alert',
+                        lambda email, subject, message: sent.append(email) or True)
+
+    result = tasks.send_incident_alert(incident_id)
+
+    assert result['status'] == 'success'
+    assert result['sent'] == 5
+    assert len(sent) == 5
+    assert Alert.query.count() == 5
+
+def test_send_incident_alert_is_idempotent(app, monkeypatch):
+    """Test that running the alert task again does not message anyone twice."""
+    import tasks
+
+    make_subscribers(5)
+    incident = Incident(user_id=1, location='Paris', category='theft',
+                        description='Pickpocket', approved=True)
+    db.session.add(incident)
+    db.session.commit()
+    incident_id = incident.id
+
+    sent = []
+    monkeypatch.setattr(tasks, 'send_email_alert',
+                        lambda email, subject, message: sent.append(email) or True)
+
+    tasks.send_incident_alert(incident_id)
+    result = tasks.send_incident_alert(incident_id)
+
+    assert len(sent) == 5
+    assert result['sent'] == 0
+    assert result['already_claimed'] == 5
+    assert Alert.query.count() == 5
+    assert {d.status for d in AlertDelivery.query.all()} == {'sent'}
+
+def test_send_incident_alert_retries_only_failed_deliveries(app, monkeypatch):
+    """Test that a second run resends exactly the deliveries that failed."""
+    import tasks
+
+    make_subscribers(3)
+    incident = Incident(user_id=1, location='Paris', category='theft',
+                        description='Pickpocket', approved=True)
+    db.session.add(incident)
+    db.session.commit()
+    incident_id = incident.id
+
+    sent = []
+    down = {'user1@example.com'}
+    def send(email, subject, message):
+        if email in down:
+            return False
+        sent.append(email)
+        return True
+    monkeypatch.setattr(tasks, 'send_email_alert', send)
+
+    first = tasks.send_incident_alert(incident_id)
+    down.clear()
+    second = tasks.send_incident_alert(incident_id)
+
+    assert first['failed'] == 1
+    assert second['sent'] == 1
+    assert sorted(sent) == ['user0@example.com', 'user1@example.com', 'user2@example.com']
+    retried = AlertDelivery.query.filter_by(user_id=2).one()
+    assert (retried.status, retried.attempts) == ('sent', 2)
+    # The failed first attempt is not logged, so the retry leaves one Alert each
+    assert Alert.query.count() == 3
+
+def test_recipient_query_targets_users_near_the_incident(app):
+    """Test that only nearby subscribers (and untargeted users if broadcasting) match."""
+    homes = {'paris': (48.8566, 2.3522), 'rome': (41.9028, 12.4964), 'anywhere': None}
+    for name, home in homes.items():
+        user = User(username=name, email=f'{name}@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        pref = Preference(user_id=user.id, alert_via_email=True, email=f'{name}@example.com')
+        if home:
+            pref.home_latitude, pref.home_longitude = home
+            pref.alert_radius_km = 20
+        db.session.add(pref)
+        db.session.flush()
+        update_subscription(pref)
+    db.session.commit()
+
+    incident = Incident(user_id=1, location='Paris', category='theft', description='Pickpocket',
+                        approved=True, geohash='u09tvw0r8xyz')
+
+    def audience(**kwargs):
+        return sorted(row.email for row in recipient_query(incident, **kwargs).all())
+    assert audience() == ['anywhere@example.com', 'paris@example.com']
+    assert audience(broadcast_untargeted=False) == ['paris@example.com']
+
+    incident.geohash = None
+    assert audience(broadcast_untargeted=False) == []
+
+def test_digest_mode_coalesces_bursts_into_one_message(app, monkeypatch):
+    """Test that a burst of approvals reaches each subscriber as a single digest."""
+    import tasks
+    from datetime import datetime, timedelta
+    from models import PendingDigestItem
+
+    app.config['ALERT_DIGEST_WINDOW'] = 60
+    make_subscribers(3)
+    incident_ids = []
+    for location in ('Paris', 'Rome', 'Madrid'):
+        incident = Incident(user_id=1, location=location, category='theft',
+                            description='Pickpocket', approved=True)
+        db.session.add(incident)
+        db.session.commit()
+        incident_ids.append(incident.id)
+
+    sent = []
+    monkeypatch.setattr(tasks, 'send_email_alert',
+                        lambda email, subject, message: sent.append((email, message)) or True)
+
+    for incident_id in incident_ids:
+        assert tasks.send_incident_alert(incident_id)['queued'] == 3
+    assert tasks.flush_alert_digests()['sent'] == 0
+
+    # Let the quiet window pass
+    db.session.execute(db.update(PendingDigestItem).values(
+        created_at=datetime.utcnow() - timedelta(seconds=120)))
+    db.session.commit()
+    result = tasks.flush_alert_digests()
+
+    assert result['sent'] == 3
+    assert result['incidents'] == 9
+    assert len(sent) == 3
+    assert all('3 NEW INCIDENTS' in message and 'Madrid' in message for _, message in sent)
+    assert PendingDigestItem.query.count() == 0
+    assert {d.status for d in AlertDelivery.query.all()} == {'sent'}
+    assert Alert.query.count() == 3
+
+def test_digest_max_latency_bounds_a_busy_buffer(app):
+    """Test that a buffer still receiving items is flushed once its oldest item is too old."""
+    from datetime import datetime, timedelta
+    from models import PendingDigestItem
+    from digest import due_digest_users
+
+    now = datetime.utcnow()
+    db.session.execute(db.insert(PendingDigestItem), [
+        {'user_id': 1, 'incident_id': 1, 'created_at': now - timedelta(seconds=700)},
+        {'user_id': 1, 'incident_id': 2, 'created_at': now},
+        {'user_id': 2, 'incident_id': 2, 'created_at': now},
+        {'user_id': 3, 'incident_id': 1, 'created_at': now - timedelta(seconds=90)},
+    ])
+    db.session.commit()
+
+    assert due_digest_users(window=60, max_latency=600, limit=10, now=now) == [1, 3]
+
+def test_digest_failed_send_is_retried_until_the_attempt_cap(app, monkeypatch):
+    """Test that a failed digest stays buffered for the next flush and is dropped at the cap."""
+    import tasks
+    from datetime import datetime, timedelta
+    from models import PendingDigestItem
+
+    app.config['ALERT_DIGEST_WINDOW'] = 60
+    app.config['ALERT_DIGEST_MAX_ATTEMPTS'] = 2
+    make_subscribers(2)
+    incident = Incident(user_id=1, location='Paris', category='theft',
+                        description='Pickpocket', approved=True)
+    db.session.add(incident)
+    db.session.commit()
+    assert tasks.send_incident_alert(incident.id)['queued'] == 2
+
+    def flush(down):
+        db.session.execute(db.update(PendingDigestItem).values(
+            created_at=datetime.utcnow() - timedelta(seconds=120)))
+        db.session.commit()
+        monkeypatch.setattr(tasks, 'send_email_alert',
+                            lambda email, subject, message: email not in down)
+        return tasks.flush_alert_digests()
+
+    result = flush(down={'user0@example.com', 'user1@example.com'})
+    assert result['failed'] == 2
+    items = PendingDigestItem.query.all()
+    assert [(item.claim, item.attempts) for item in items] == [(None, 1), (None, 1)]
+    assert {d.status for d in AlertDelivery.query.all()} == {'queued'}
+    assert Alert.query.count() == 0
+
+    result = flush(down={'user1@example.com'})
+    assert (result['sent'], result['failed']) == (1, 1)
+    assert PendingDigestItem.query.count() == 0
+    statuses = {d.user_id: d.status for d in AlertDelivery.query.all()}
+    assert sorted(statuses.values()) == ['failed', 'sent']
+    assert Alert.query.count() == 1
+
+def test_rejecting_an_alerted_incident_removes_its_deliveries(client, app, monkeypatch):
+    """Test that an approved, alerted incident can be rejected with foreign keys enforced."""
+    import tasks
+    from werkzeug.security import generate_password_hash
+    from models import PendingDigestItem
+
+    db.session.execute(db.text('PRAGMA foreign_keys = ON'))
+    monkeypatch.setattr(tasks, 'relay_outbox_batch', lambda batch_size: None)
+    monkeypatch.setattr(tasks, 'send_email_alert', lambda email, subject, message: True)
+    db.session.add(User(username='admin', email='admin@example.com', is_admin=True,
+                        password_hash=generate_password_hash('adminpass')))
+    db.session.commit()
+    make_subscribers(2)
+    incident = Incident(user_id=1, location='Paris', category='theft', description='Pickpocket')
+    db.session.add(incident)
+    db.session.commit()
+    incident_id = incident.id
+    client.post('/auth/login', data={'username': 'admin', 'password': 'adminpass'})
+
+    client.post(f'/admin/approve_incident/{incident_id}')
+    assert tasks.send_incident_alert(incident_id)['sent'] == 2
+    # A later subscriber gets the incident buffered for a digest instead
+    late = User(username='late', email='late@example.com', password_hash='x')
+    db.session.add(late)
+    db.session.flush()
+    db.session.add(Preference(user_id=late.id, alert_via_email=True, email='late@example.com'))
+    db.session.commit()
+    app.config['ALERT_DIGEST_WINDOW'] = 60
+    assert tasks.send_incident_alert(incident_id)['queued'] == 1
+
+    response = client.post(f'/admin/reject_incident/{incident_id}')
+
+    assert response.status_code == 302
+    assert db.session.get(Incident, incident_id) is None
+    assert AlertDelivery.query.count() == 0
+    assert PendingDigestItem.query.count() == 0
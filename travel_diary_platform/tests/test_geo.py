@@ -0,0 +1,152 @@
+import json
+import pytest
+import geo
+from app import db
+from models import Incident
+from geo import GazetteerGeocoder
+from clusters import get_cluster_index
+
+def add_incident(location, approved=True):
+    incident = Incident(user_id=1, location=location, category='theft',
+                        description='Test incident', approved=approved)
+    geo.geocode_incident(incident)
+    db.session.add(incident)
+    db.session.commit()
+    return incident.id
+
+def test_geohash_round_trip():
+    """Test that decoding a geohash lands back near the encoded point."""
+    cell = geo.encode(48.8566, 2.3522, 9)
+    assert cell == 'u09tvw0f6'
+    lat, lon = geo.decode(cell)
+    assert abs(lat - 48.8566) < 1e-3
+    assert abs(lon - 2.3522) < 1e-3
+
+def test_cover_bbox_contains_points_inside():
+    """Test that the cover includes the cell of every point in the box."""
+    cells = geo.cover_bbox(48.0, 1.0, 50.0, 4.0, 3)
+    for lat, lon in [(48.0, 1.0), (49.0, 2.5), (50.0, 4.0)]:
+        assert geo.encode(lat, lon, 3) in cells
+
+def test_gazetteer_geocoder():
+    """Test place-name and literal coordinate lookups."""
+    geocoder = GazetteerGeocoder()
+    assert geocoder.geocode('Near the Eiffel Tower, Paris, France') == (48.8566, 2.3522)
+    assert geocoder.geocode('-33.9, 151.2') == (-33.9, 151.2)
+    assert geocoder.geocode('Somewhere unknown') is None
+
+def test_gazetteer_geocoder_matches_whole_words():
+    """Test that place names only match as whole words, longest first."""
+    rome, hanoi, new_york, york = (41.9, 12.5), (21.0, 105.8), (40.7, -74.0), (53.96, -1.08)
+    geocoder = GazetteerGeocoder(places={'rome': rome, 'hanoi': hanoi,
+                                         'new york': new_york, 'york': york})
+    assert geocoder.geocode('Jerome Ave, Bronx') is None
+    assert geocoder.geocode('City Aerodrome') is None
+    assert geocoder.geocode('Chrome store, Hanoi') == hanoi
+    assert geocoder.geocode('Termini station (Rome)') == rome
+    assert geocoder.geocode('Times Square, New York') == new_york
+    assert geocoder.geocode('York Minster') == york
+
+def test_geocode_missing_incidents(app):
+    """Test that incidents approved before geocoding get coordinates, once."""
+    for location, approved in [('Louvre, Paris', True), ('Nowhere in particular', True),
+                               ('Louvre, Paris', False)]:
+        db.session.add(Incident(user_id=1, location=location, category='theft',
+                                description='Legacy row', approved=approved))
+    db.session.commit()
+
+    assert geo.geocode_missing_incidents(batch_size=1) == (1, 2)
+    located = Incident.query.filter(Incident.geohash.isnot(None)).all()
+    assert [(incident.location, incident.approved) for incident in located] == [('Louvre, Paris', True)]
+    assert located[0].geohash == geo.encode(located[0].latitude, located[0].longitude)
+    # Only the unlocatable row is checked again
+    assert geo.geocode_missing_incidents() == (0, 1)
+
+def test_parse_bbox_splits_antimeridian():
+    """Test that a viewport across the date line becomes two boxes."""
+    boxes = geo.parse_bbox('170,-10,-170,10')
+    assert boxes == [(-10.0, 170.0, 10.0, 180.0), (-10.0, -180.0, 10.0, -170.0)]
+    with pytest.raises(ValueError):
+        geo.parse_bbox('1,2,3')
+
+def test_risks_api_bbox_returns_viewport_only(client, app):
+    """Test that bbox limits results to incidents inside the viewport."""
+    paris_id = add_incident('Paris, France')
+    add_incident('Tokyo, Japan')
+    add_incident('Paris, France', approved=False)
+
+    response = client.get('/alerts/api/risks?bbox=1.0,48.0,4.0,50.0&zoom=8')
+    assert response.status_code == 200
+
+    data = json.loads(response.data)
+    assert [risk['id'] for risk in data] == [paris_id]
+    assert data[0]['latitude'] == pytest.approx(48.8566)
+
+def test_viewport_filter_seeks_the_geohash_index(app):
+    """Test that each covering cell is an index range seek, not a prefix LIKE."""
+    from alerts.routes import viewport_filter
+    boxes = geo.parse_bbox('2.25,48.80,2.45,48.92')
+    query = db.select(Incident.id).where(viewport_filter(boxes, 5)) \
+        .order_by(Incident.timestamp.desc())
+    sql = str(query.compile(db.engine, compile_kwargs={'literal_binds': True}))
+    plan = ' '.join(row[-1] for row in db.session.execute(db.text('EXPLAIN QUERY PLAN ' + sql)))
+    assert 'ix_incident_approved_geohash (approved=? AND geohash>? AND geohash<?)' in plan
+    assert 'LIKE' not in sql
+
+def test_risks_api_rejects_bad_bbox(client):
+    """Test that a malformed bbox is a client error."""
+    response = client.get('/alerts/api/risks?bbox=abc')
+    assert response.status_code == 400
+
+def test_clusters_group_by_cell_with_category_counts(client, app):
+    """Test that nearby incidents collapse into one cluster per cell."""
+    add_incident('Paris, France')
+    add_incident('48.8570, 2.3530')
+    add_incident('Tokyo, Japan')
+
+    response = client.get('/alerts/api/clusters?zoom=3')
+    assert response.status_code == 200
+
+    clusters = {c['count']: c for c in json.loads(response.data)['clusters']}
+    assert sorted(clusters) == [1, 2]
+    assert clusters[2]['categories'] == {'theft': 2}
+
+    response = client.get('/alerts/api/clusters?zoom=3&bbox=1.0,48.0,4.0,50.0')
+    assert [c['count'] for c in json.loads(response.data)['clusters']] == [2]
+
+def test_clusters_expire_after_max_age(client, app):
+    """Test that approvals from another process reach the clusters once CACHE_MAX_AGE passes."""
+    from cache import get_response_cache
+    cluster_index = get_cluster_index()
+    assert json.loads(client.get('/alerts/api/clusters?zoom=3').data)['clusters'] == []
+
+    # Approved elsewhere: no add() and no version bump in this process
+    add_incident('Paris, France')
+    assert json.loads(client.get('/alerts/api/clusters?zoom=3').data)['clusters'] == []
+
+    for entry in get_response_cache()._entries.values():
+        entry.created -= app.config['CACHE_MAX_AGE'] + 1
+    for precision in cluster_index._built:
+        cluster_index._built[precision] -= app.config['CACHE_MAX_AGE'] + 1
+    clusters = json.loads(client.get('/alerts/api/clusters?zoom=3').data)['clusters']
+    assert [c['count'] for c in clusters] == [1]
+
+def test_clusters_update_incrementally(client, app):
+    """Test that the cached grids follow approvals without a rebuild."""
+    cluster_index = get_cluster_index()
+    add_incident('Paris, France')
+    assert [c['count'] for c in cluster_index.clusters(4)] == [1]
+
+    incident = Incident(user_id=1, location='Paris', category='scam',
+                        description='Test incident', approved=True)
+    geo.geocode_incident(incident)
+    db.session.add(incident)
+    db.session.commit()
+    cluster_index.add(incident)
+
+    [cluster] = cluster_index.clusters(4)
+    assert cluster['count'] == 2
+    assert cluster['categories'] == {'theft': 1, 'scam': 1}
+
+    cluster_index.remove(incident)
+    assert cluster_index.clusters(4)[0]['categories'] == {'theft': 1}
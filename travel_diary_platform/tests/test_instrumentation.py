@@ -0,0 +1,51 @@
+import pytest
+from app import db
+from models import User
+from werkzeug.security import generate_password_hash
+
+@pytest.fixture
+def app_config():
+    """SQL instrumentation switched on, logging every statement as slow."""
+    return {'SQL_INSTRUMENTATION': True, 'SLOW_QUERY_MS': 0}
+
+@pytest.fixture
+def client(app):
+    """A client logged in as an admin."""
+    db.session.add(User(username='admin', email='admin@example.com', is_admin=True,
+                        password_hash=generate_password_hash('adminpass')))
+    db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'adminpass'})
+    return client
+
+def test_server_timing_header_reports_queries(client):
+    """Test that each response carries the request's query count and DB time."""
+    response = client.get('/diary/all')
+    timing = response.headers.get_all('Server-Timing')
+    assert timing[0].startswith('db;dur=') and 'queries' in timing[0]
+    assert int(timing[0].split('desc="')[1].split()[0]) > 0
+    assert timing[1].startswith('app;dur=')
+
+def test_sql_stats_aggregate_per_endpoint(client):
+    """Test that the admin endpoint reports per-endpoint counts and slow statements."""
+    client.get('/diary/all')
+    client.get('/diary/all')
+
+    data = client.get('/admin/api/sql-stats').get_json()
+    feed = next(stats for stats in data['endpoints'] if stats['endpoint'] == 'diary.view_diaries')
+    assert feed['requests'] == 2
+    assert feed['queries'] >= 2 and feed['avg_queries'] == feed['queries'] / 2
+    # With a zero threshold every statement is logged, with its parameters
+    assert data['slow_queries'][0]['statement']
+    assert any(slow['endpoint'] == 'diary.view_diaries' for slow in data['slow_queries'])
+
+    assert client.delete('/admin/api/sql-stats').status_code == 200
+    data = client.get('/admin/api/sql-stats').get_json()
+    assert [stats['endpoint'] for stats in data['endpoints']] == ['admin.api_sql_stats']
+
+@pytest.mark.parametrize('app_config', [{}])
+def test_sql_stats_require_instrumentation(client):
+    """Test that the endpoint and header are absent when instrumentation is off."""
+    response = client.get('/admin/api/sql-stats')
+    assert response.status_code == 404
+    assert 'Server-Timing' not in response.headers
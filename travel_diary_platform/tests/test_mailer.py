@@ -0,0 +1,92 @@
+import smtplib
+import pytest
+import mailer
+from mailer import SMTPPool
+
+class FakeSMTP:
+    """Stand-in for smtplib.SMTP that records sessions and messages."""
+    sessions = []
+    refuse_login = False
+
+    def __init__(self, host, port, timeout=None):
+        self.logins = 0
+        self.sent = []
+        self.drop_next = False
+        FakeSMTP.sessions.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        if FakeSMTP.refuse_login:
+            raise smtplib.SMTPAuthenticationError(535, b'Authentication failed')
+        self.logins += 1
+
+    def sendmail(self, from_addr, to_addrs, message):
+        if self.drop_next:
+            self.drop_next = False
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        self.sent.append(to_addrs)
+
+    def rset(self):
+        pass
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+@pytest.fixture(autouse=True)
+def fake_smtp(monkeypatch):
+    FakeSMTP.sessions = []
+    FakeSMTP.refuse_login = False
+    monkeypatch.setattr(mailer.smtplib, 'SMTP', FakeSMTP)
+
+def make_pool(**kwargs):
+    return SMTPPool('smtp.example.com', 587, 'user', 'secret', use_tls=True, **kwargs)
+
+def test_pool_reuses_authenticated_session():
+    """Test that many sends share one login."""
+    pool = make_pool(size=1)
+
+    for i in range(10):
+        pool.send(f'user{i}@example.com', 'Subject', 'Body')
+
+    assert len(FakeSMTP.sessions) == 1
+    assert FakeSMTP.sessions[0].logins == 1
+    assert len(FakeSMTP.sessions[0].sent) == 10
+
+def test_pool_reconnects_after_server_drop():
+    """Test that a dropped session is replaced and the message still goes out."""
+    pool = make_pool(size=1)
+    pool.send('first@example.com', 'Subject', 'Body')
+    FakeSMTP.sessions[0].drop_next = True
+
+    pool.send('second@example.com', 'Subject', 'Body')
+
+    assert len(FakeSMTP.sessions) == 2
+    assert FakeSMTP.sessions[1].sent == ['second@example.com']
+
+def test_pool_reports_a_failed_reconnect():
+    """Test that an SMTP error while reconnecting reaches the caller and frees the slot."""
+    pool = make_pool(size=1)
+    pool.send('first@example.com', 'Subject', 'Body')
+    FakeSMTP.sessions[0].drop_next = True
+    FakeSMTP.refuse_login = True
+
+    with pytest.raises(smtplib.SMTPAuthenticationError):
+        pool.send('second@example.com', 'Subject', 'Body')
+
+    FakeSMTP.refuse_login = False
+    pool.send('third@example.com', 'Subject', 'Body')
+    assert FakeSMTP.sessions[-1].sent == ['third@example.com']
+
+def test_pool_recycles_session_after_message_cap():
+    """Test that sessions are reopened after max_messages sends."""
+    pool = make_pool(size=1, max_messages=3)
+
+    for i in range(7):
+        pool.send(f'user{i}@example.com', 'Subject', 'Body')
+
+    assert [len(session.sent) for session in FakeSMTP.sessions] == [3, 3, 1]
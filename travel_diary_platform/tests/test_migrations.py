@@ -0,0 +1,67 @@
+from sqlalchemy import inspect
+from app import db
+from models import DiaryEntry, Incident, Like
+from migrations import upgrade_schema
+
+# Tables as the first release created them, before any columns or indexes were added
+LEGACY_SCHEMA = [
+    'CREATE TABLE user (id INTEGER NOT NULL PRIMARY KEY, username VARCHAR(64) NOT NULL UNIQUE, '
+    'email VARCHAR(120) NOT NULL UNIQUE, password_hash VARCHAR(128) NOT NULL, is_admin BOOLEAN)',
+    'CREATE TABLE preference (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER, '
+    'alert_via_whatsapp BOOLEAN, alert_via_email BOOLEAN, whatsapp_number VARCHAR(20), '
+    'email VARCHAR(120))',
+    'CREATE TABLE diary_entry (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER, '
+    'title VARCHAR(140) NOT NULL, body TEXT NOT NULL, safety_tips TEXT, timestamp DATETIME)',
+    'CREATE TABLE comment (id INTEGER NOT NULL PRIMARY KEY, diary_id INTEGER, user_id INTEGER, '
+    'body TEXT NOT NULL, timestamp DATETIME)',
+    'CREATE TABLE "like" (id INTEGER NOT NULL PRIMARY KEY, diary_id INTEGER, user_id INTEGER)',
+    'CREATE TABLE incident (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER, '
+    'location VARCHAR(255) NOT NULL, category VARCHAR(64) NOT NULL, description TEXT NOT NULL, '
+    'photo_filename VARCHAR(255), approved BOOLEAN, timestamp DATETIME)',
+    'CREATE TABLE alert (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER, '
+    'message TEXT NOT NULL, sent_at DATETIME)',
+]
+
+def legacy_database():
+    db.drop_all()
+    for statement in LEGACY_SCHEMA:
+        db.session.execute(db.text(statement))
+    db.session.execute(db.text(
+        "INSERT INTO user (id, username, email, password_hash) VALUES (1, 'u', 'u@example.com', 'x')"))
+    db.session.execute(db.text(
+        "INSERT INTO diary_entry (id, user_id, title, body) VALUES (1, 1, 'Rome', 'Ciao')"))
+    db.session.execute(db.text(
+        'INSERT INTO "like" (diary_id, user_id) VALUES (1, 1), (1, 1), (1, NULL), (1, NULL)'))
+    db.session.execute(db.text(
+        "INSERT INTO incident (user_id, location, category, description, approved) "
+        "VALUES (1, 'Rome', 'theft', 'Bag snatched', 1)"))
+    db.session.commit()
+
+def test_upgrade_adds_columns_and_indexes(app):
+    """Test that tables from the first release gain every new column and index."""
+    legacy_database()
+    changes = upgrade_schema()
+
+    assert 'added column incident.geohash' in changes
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        assert columns == {column.name for column in table.columns}
+        indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        assert indexes >= {index.name for index in table.indexes}
+    incident = Incident.query.one()
+    assert incident.geohash is None and incident.photo_status is None
+    assert DiaryEntry.query.one().like_count == 0
+
+    # Running it again changes nothing
+    assert upgrade_schema() == []
+
+def test_upgrade_removes_duplicate_likes(app):
+    """Test that duplicate likes are dropped so the unique index can be built."""
+    legacy_database()
+    changes = upgrade_schema()
+
+    assert 'removed 1 duplicate like rows' in changes
+    assert Like.query.filter_by(diary_id=1, user_id=1).count() == 1
+    # Rows without a user never conflict and are kept
+    assert Like.query.filter_by(diary_id=1, user_id=None).count() == 2
@@ -0,0 +1,48 @@
+from app import db
+from models import User, Incident, OutboxEvent
+from werkzeug.security import generate_password_hash
+import outbox
+
+def broker_down(topic, payload):
+    raise ConnectionError('broker unreachable')
+
+def test_approval_writes_outbox_event_that_survives_broker_outage(client, monkeypatch):
+    """Test that an approval is not lost when the broker cannot be reached."""
+    import tasks
+    monkeypatch.setattr(tasks, 'relay_outbox_batch',
+                        lambda batch_size: outbox.relay(broker_down, batch_size))
+    db.session.add(User(username='admin', email='admin@example.com', is_admin=True,
+                        password_hash=generate_password_hash('adminpass')))
+    incident = Incident(user_id=1, location='Paris', category='theft', description='Pickpocket')
+    db.session.add(incident)
+    db.session.commit()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'adminpass'})
+
+    client.post(f'/admin/approve_incident/{incident.id}')
+
+    event = OutboxEvent.query.one()
+    assert event.topic == 'incident.approved'
+    assert event.dispatched_at is None
+    assert event.attempts == 1
+
+    published = []
+    stats = outbox.relay(lambda topic, payload: published.append((topic, payload)))
+    assert stats == {'dispatched': 1, 'failed': 0}
+    assert published == [('incident.approved', {'incident_id': incident.id})]
+    assert db.session.get(OutboxEvent, event.id).dispatched_at is not None
+
+def test_relay_drains_in_order_and_stops_at_first_failure(app):
+    """Test that relay publishes oldest first and keeps the rest on failure."""
+    for incident_id in range(1, 5):
+        outbox.enqueue('incident.approved', {'incident_id': incident_id})
+    db.session.commit()
+
+    published = []
+    def flaky(topic, payload):
+        if payload['incident_id'] == 3:
+            raise ConnectionError('broker unreachable')
+        published.append(payload['incident_id'])
+
+    assert outbox.relay(flaky, batch_size=10) == {'dispatched': 2, 'failed': 1}
+    assert published == [1, 2]
+    assert OutboxEvent.query.filter(OutboxEvent.dispatched_at.is_(None)).count() == 2
@@ -0,0 +1,131 @@
+import io
+import os
+import pytest
+from app import db
+from models import User, Incident, OutboxEvent
+from werkzeug.security import generate_password_hash
+import photos
+
+@pytest.fixture
+def app_config(tmp_path):
+    """Store uploads in a temp dir."""
+    return {'UPLOAD_FOLDER': str(tmp_path)}
+
+@pytest.fixture
+def client(app):
+    """A client logged in as a regular user."""
+    db.session.add(User(username='traveler', email='traveler@example.com',
+                        password_hash=generate_password_hash('travelpass')))
+    db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'traveler', 'password': 'travelpass'})
+    return client
+
+def report(client, data, filename):
+    client.post('/incidents/report', data={
+        'location': 'Rome', 'category': 'theft', 'description': 'Bag snatched',
+        'photo': (io.BytesIO(data), filename),
+    }, content_type='multipart/form-data')
+    return Incident.query.order_by(Incident.id.desc()).first()
+
+def flashes(client):
+    with client.session_transaction() as session:
+        return [message for _, message in session.get('_flashes', [])]
+
+def png_bytes(size=(1600, 900)):
+    Image = pytest.importorskip('PIL.Image')
+    out = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(out, 'PNG')
+    return out.getvalue()
+
+def test_uploads_are_stored_once_by_content_hash(client, app):
+    """Test that identical uploads share one file and queue thumbnailing."""
+    first = report(client, b'same bytes', 'IMG_0001.jpg')
+    second = report(client, b'same bytes', 'holiday.JPG')
+    other = report(client, b'other bytes', 'IMG_0001.jpg')
+
+    assert first.photo_filename == second.photo_filename != other.photo_filename
+    shard, name = first.photo_filename.split('/')
+    assert len(shard) == 2 and name.startswith(shard) and name.endswith('.jpg')
+    with open(os.path.join(app.config['UPLOAD_FOLDER'], first.photo_filename), 'rb') as f:
+        assert f.read() == b'same bytes'
+    assert first.photo_status == photos.PENDING
+    assert OutboxEvent.query.filter_by(topic='photo.stored').count() == 3
+    assert os.listdir(os.path.join(app.config['UPLOAD_FOLDER'], photos.INCOMING)) == []
+
+def test_photo_url_serves_derivative_once_ready(client, app):
+    """Test that pages link the original until the thumbnails exist."""
+    incident = report(client, b'photo', 'a.png')
+    with app.test_request_context():
+        assert photos.photo_url(incident, 'thumb').endswith(incident.photo_filename)
+        incident.photo_status = photos.READY
+        assert photos.photo_url(incident, 'thumb').endswith(
+            incident.photo_filename.rsplit('.', 1)[0] + '-thumb.webp')
+        assert photos.photo_url(incident).endswith(incident.photo_filename)
+
+def test_reupload_of_processed_photo_is_ready_at_once(client, app):
+    """Test that a photo whose thumbnails exist is not queued again."""
+    name, _ = photos.store_photo(io.BytesIO(b'known photo'), 'jpg')
+    for size in photos.photo_sizes():
+        open(os.path.join(app.config['UPLOAD_FOLDER'], photos.derivative_name(name, size)), 'w').close()
+
+    incident = report(client, b'known photo', 'copy.jpg')
+    assert incident.photo_filename == name
+    assert incident.photo_status == photos.READY
+    assert OutboxEvent.query.count() == 0
+    assert not any('PNG, JPG or GIF' in message for message in flashes(client))
+
+def test_process_photo_renders_webp_thumbnails(client, app):
+    """Test that the task writes bounded WebP derivatives and marks incidents ready."""
+    Image = pytest.importorskip('PIL.Image')
+    from tasks import process_photo
+    incident = report(client, png_bytes(), 'wide.png')
+
+    result = process_photo(incident.photo_filename)
+    assert result['status'] == photos.READY
+    db.session.refresh(incident)
+    assert incident.photo_status == photos.READY
+    with Image.open(os.path.join(app.config['UPLOAD_FOLDER'],
+                                 photos.derivative_name(incident.photo_filename, 'thumb'))) as thumb:
+        assert thumb.format == 'WEBP'
+        assert max(thumb.size) == app.config['PHOTO_THUMB_SIZE']
+
+def test_process_photo_marks_undecodable_files_failed(client, app):
+    """Test that a file Pillow cannot read is marked failed and keeps its original."""
+    pytest.importorskip('PIL')
+    from tasks import process_photo
+    incident = report(client, b'\x89PNG\r\n\x1a\n truncated', 'broken.png')
+
+    assert process_photo(incident.photo_filename)['status'] == photos.FAILED
+    db.session.refresh(incident)
+    assert incident.photo_status == photos.FAILED
+
+def test_oversized_upload_is_refused_while_streaming(client, app):
+    """Test that a photo over the limit gets a 413 and leaves nothing behind."""
+    app.config['PHOTO_MAX_BYTES'] = 1024
+    response = client.post('/incidents/report', data={
+        'location': 'Rome', 'category': 'theft', 'description': 'Bag snatched',
+        'photo': (io.BytesIO(b'x' * 4096), 'big.jpg'),
+    }, content_type='multipart/form-data')
+    assert response.status_code == 413
+    assert Incident.query.count() == 0
+    assert os.listdir(os.path.join(app.config['UPLOAD_FOLDER'], photos.INCOMING)) == []
+
+def test_unsupported_file_types_are_not_stored(client, app):
+    """Test that a file with another extension is dropped and the report kept."""
+    incident = report(client, b'<script>', 'evil.html')
+    assert incident.photo_filename is None
+    assert any('PNG, JPG or GIF' in message for message in flashes(client))
+    assert not [f for _, _, files in os.walk(app.config['UPLOAD_FOLDER']) for f in files]
+
+def test_process_photo_rejects_files_that_are_not_images(client, app):
+    """Test that the background check deletes a file whose bytes do not match its type."""
+    from tasks import process_photo
+    incident = report(client, b'<html>not a png</html>', 'fake.png')
+    name = incident.photo_filename
+
+    assert process_photo(name)['status'] == photos.REJECTED
+    db.session.refresh(incident)
+    assert incident.photo_filename is None
+    assert incident.photo_status == photos.REJECTED
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], name))
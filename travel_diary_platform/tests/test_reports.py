@@ -0,0 +1,70 @@
+import io
+import pytest
+from datetime import datetime, timedelta
+from app import db
+from models import User, Incident
+from reports import write_safety_report, category_counts, top_incidents, region_counts, report_window
+from rollups import rebuild_rollups
+
+@pytest.fixture
+def window(app):
+    """Seed incidents around a fixed week and return its (start, end)."""
+    user = User(username='reporter', email='reporter@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    start = datetime(2024, 3, 4)
+    rows = []
+    for i in range(5):
+        rows.append(dict(location=f'Paris {i}', category='theft', description='Pickpocket ' * 20,
+                         geohash='u09tvw0', timestamp=start + timedelta(hours=i)))
+    rows.append(dict(location='Rome', category='scam', description='Fake petition',
+                     geohash='sr2yk3', timestamp=start + timedelta(days=1)))
+    rows.append(dict(location='Rome', category='scam', description='Unapproved',
+                     geohash='sr2yk3', timestamp=start + timedelta(days=1), approved=False))
+    rows.append(dict(location='Old', category='scam', description='Last month',
+                     geohash='sr2yk3', timestamp=start - timedelta(days=30)))
+    for row in rows:
+        row.setdefault('approved', True)
+        db.session.add(Incident(user_id=user.id, **row))
+    db.session.commit()
+    rebuild_rollups()
+    return start, start + timedelta(days=7)
+
+def test_category_counts_respect_window_and_approval(window):
+    """Test that only approved incidents inside the range are counted."""
+    assert category_counts(*window) == [('theft', 5), ('scam', 1)]
+
+def test_top_incidents_are_limited_per_category(window):
+    """Test that the window query returns the newest few per category."""
+    top = top_incidents(*window, limit=3)
+    assert [row.location for row in top['theft']] == ['Paris 4', 'Paris 3', 'Paris 2']
+    assert all(len(row.preview) <= 100 for row in top['theft'])
+    assert len(top['scam']) == 1
+
+def test_region_breakdown_groups_by_geohash_prefix(window):
+    """Test that regions are geohash prefixes of the requested precision."""
+    assert region_counts(*window, precision=2) == [('sr', 'scam', 1), ('u0', 'theft', 5)]
+
+def test_report_streams_to_writer(window):
+    """Test that the report is written to any file-like object."""
+    out = io.StringIO()
+    total = write_safety_report(out, *window, region_precision=2)
+    report = out.getvalue()
+    assert total == 6
+    assert 'Total Incidents: 6' in report
+    assert 'THEFT: 5 incidents' in report
+    assert report.count('  - Paris') == 3
+    assert 'BREAKDOWN BY REGION' in report and 'u0:' in report
+
+def test_partial_day_window_reads_incidents_directly(window):
+    """Test that a window off day boundaries still counts exactly."""
+    start, end = window
+    assert category_counts(start + timedelta(hours=2), end) == [('theft', 3), ('scam', 1)]
+    assert region_counts(start + timedelta(hours=2), end, precision=5) == [
+        ('sr2yk', 'scam', 1), ('u09tv', 'theft', 3)]
+
+def test_default_window_ends_at_midnight_utc():
+    """Test that the scheduled report window covers whole days, so rollups answer it."""
+    start, end = report_window(days=7)
+    assert end == datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    assert start == end - timedelta(days=7)
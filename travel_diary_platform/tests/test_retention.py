@@ -0,0 +1,63 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+from app import db
+from models import User, Alert, AlertDelivery
+from retention import purge_alerts, purge_deliveries
+
+def make_alerts(old, recent):
+    """Create ``old`` alerts from last year and ``recent`` alerts from today."""
+    user = User(username='traveler', email='traveler@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    now = datetime.utcnow()
+    rows = [{'user_id': user.id, 'message': f'old {i}', 'sent_at': now - timedelta(days=365)}
+            for i in range(old)]
+    rows += [{'user_id': user.id, 'message': f'new {i}', 'sent_at': now} for i in range(recent)]
+    # Interleave so the expired ids are not one contiguous range
+    rows.sort(key=lambda row: row['message'][-1])
+    db.session.execute(db.insert(Alert), rows)
+    db.session.commit()
+    return now - timedelta(days=30)
+
+def test_purge_deletes_only_expired_alerts_in_batches(app):
+    """Test that batches remove every expired alert and nothing newer."""
+    cutoff = make_alerts(old=7, recent=3)
+
+    stats = purge_alerts(cutoff, batch_size=2)
+
+    assert stats['deleted'] == 7
+    assert stats['batches'] == 4
+    assert Alert.query.count() == 3
+    assert all(alert.message.startswith('new') for alert in Alert.query.all())
+
+def test_purge_archives_before_deleting(app, tmp_path):
+    """Test that every deleted alert is written to the archive."""
+    cutoff = make_alerts(old=5, recent=2)
+    path = str(tmp_path / 'archive' / 'alerts.ndjson.gz')
+
+    stats = purge_alerts(cutoff, batch_size=3, archive_path=path)
+
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        archived = [json.loads(line) for line in archive]
+    assert stats['archived'] == stats['deleted'] == 5
+    assert sorted(row['message'] for row in archived) == [f'old {i}' for i in range(5)]
+    assert Alert.query.count() == 2
+
+def test_purge_deliveries_keeps_recent_and_unfinished_rows(app):
+    """Test that only finished deliveries older than the cutoff are removed."""
+    now = datetime.utcnow()
+    old = now - timedelta(days=365)
+    db.session.execute(db.insert(AlertDelivery), [
+        {'incident_id': 1, 'user_id': 1, 'channel': 'email', 'status': 'sent', 'created_at': old},
+        {'incident_id': 1, 'user_id': 2, 'channel': 'email', 'status': 'failed', 'created_at': old},
+        {'incident_id': 1, 'user_id': 3, 'channel': 'email', 'status': 'queued', 'created_at': old},
+        {'incident_id': 2, 'user_id': 1, 'channel': 'email', 'status': 'sent', 'created_at': now},
+        {'incident_id': 2, 'user_id': 2, 'channel': 'email', 'status': 'sent', 'created_at': old},
+    ])
+    db.session.commit()
+
+    assert purge_deliveries(now - timedelta(days=30), batch_size=2) == 3
+
+    remaining = [(d.incident_id, d.user_id) for d in AlertDelivery.query.order_by(AlertDelivery.id)]
+    assert remaining == [(1, 3), (2, 1)]
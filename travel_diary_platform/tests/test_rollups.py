@@ -0,0 +1,74 @@
+import pytest
+from datetime import datetime, timedelta
+from app import db
+from models import User, Incident, DailyStat
+from werkzeug.security import generate_password_hash
+import rollups
+
+@pytest.fixture
+def admin_client(client, monkeypatch):
+    """A client logged in as an admin, with alert dispatch switched off."""
+    import tasks
+    monkeypatch.setattr(tasks, 'relay_outbox_batch',
+                        lambda batch_size: {'dispatched': 0, 'failed': 0})
+    db.session.add(User(username='admin', email='admin@example.com', is_admin=True,
+                        password_hash=generate_password_hash('adminpass')))
+    db.session.commit()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'adminpass'})
+    return client
+
+def report(client, category='theft', location='48.8566, 2.3522'):
+    client.post('/incidents/report', data={'location': location, 'category': category,
+                                           'description': 'Bag snatched'})
+    return Incident.query.order_by(Incident.id.desc()).first()
+
+def test_report_approve_reject_keep_rollups_in_step(admin_client):
+    """Test that each moderation step moves the daily counters."""
+    today = datetime.utcnow().date()
+    first = report(admin_client)
+    second = report(admin_client, category='scam')
+    assert rollups.day_count(rollups.INCIDENTS, today) == 2
+
+    admin_client.post(f'/admin/approve_incident/{first.id}')
+    admin_client.post(f'/admin/approve_incident/{first.id}')
+    assert rollups.day_count(rollups.APPROVED_INCIDENTS, today) == 1
+    bucket = DailyStat.query.filter(DailyStat.metric == rollups.APPROVED_INCIDENTS,
+                                    DailyStat.category == 'theft').one().bucket
+    assert bucket == first.geohash[:4]
+
+    admin_client.post(f'/admin/reject_incident/{first.id}')
+    admin_client.post(f'/admin/reject_incident/{second.id}')
+    assert rollups.day_count(rollups.INCIDENTS, today) == 0
+    assert rollups.day_count(rollups.APPROVED_INCIDENTS, today) == 0
+
+def test_dashboard_reads_approved_today_from_rollup(admin_client):
+    """Test that the dashboard's approved-today card uses the rollup."""
+    incident = report(admin_client)
+    admin_client.post(f'/admin/approve_incident/{incident.id}')
+
+    response = admin_client.get('/admin/dashboard')
+    assert b'<h4 class="text-success">1</h4>' in response.data
+
+def test_rebuild_matches_incremental_counts(admin_client):
+    """Test that a rebuild reproduces what the hooks recorded."""
+    for category in ('theft', 'theft', 'scam'):
+        incident = report(admin_client, category=category)
+        admin_client.post(f'/admin/approve_incident/{incident.id}')
+    admin_client.post('/diary/create', data={'title': 'Trip', 'body': 'Lovely'})
+
+    def snapshot():
+        return sorted((row.metric, row.day, row.category, row.bucket, row.count)
+                      for row in DailyStat.query.all())
+    incremental = snapshot()
+    rollups.rebuild_rollups()
+    assert snapshot() == incremental
+    assert rollups.totals() == {'incidents': 3, 'approved_incidents': 3, 'diaries': 1}
+
+def test_daily_series_is_zero_filled(app):
+    """Test that the time series covers every day in the range."""
+    start = datetime(2024, 5, 1).date()
+    rollups.increment(rollups.DIARIES, start + timedelta(days=2), delta=4)
+    db.session.commit()
+    assert rollups.daily_series(rollups.DIARIES, start, start + timedelta(days=4)) == [
+        (start, 0), (start + timedelta(days=1), 0), (start + timedelta(days=2), 4),
+        (start + timedelta(days=3), 0)]
@@ -0,0 +1,89 @@
+import pytest
+from datetime import datetime
+from app import db
+from models import User, DiaryEntry, Incident
+from werkzeug.security import generate_password_hash
+from search.index import FTS5_AVAILABLE, search, index_incident
+
+BACKENDS = ['memory'] + (['fts5'] if FTS5_AVAILABLE else [])
+
+@pytest.fixture(params=BACKENDS)
+def app_config(request):
+    """Run every test against each search backend."""
+    return {'SEARCH_BACKEND': request.param}
+
+@pytest.fixture
+def client(app):
+    """A logged-in test client."""
+    db.session.add(User(username='writer', email='writer@example.com', is_admin=True,
+                        password_hash=generate_password_hash('writerpass')))
+    db.session.commit()
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'writer', 'password': 'writerpass'})
+    return client
+
+def write(client, title, body):
+    client.post('/diary/create', data={'title': title, 'body': body})
+    return DiaryEntry.query.order_by(DiaryEntry.id.desc()).first().id
+
+def test_search_ranks_and_highlights(client):
+    """Test that title matches rank first and matches are highlighted safely."""
+    write(client, 'Night markets', 'In Bangkok we ate <b>street food</b>')
+    write(client, 'Bangkok temples', 'Golden roofs everywhere')
+
+    hits = search('bangkok')
+    assert [hit.title.striptags() for hit in hits] == ['Bangkok temples', 'Night markets']
+    assert '<mark>Bangkok</mark>' in hits[0].title
+    assert '&lt;b&gt;' in hits[1].snippet and '<b>' not in hits[1].snippet
+
+def test_search_follows_edits_and_deletes(client):
+    """Test that the index is updated incrementally by the diary routes."""
+    diary_id = write(client, 'Lisbon trams', 'Tram 28 is crowded')
+    assert search('tram')
+
+    client.post(f'/diary/edit/{diary_id}', data={'title': 'Lisbon hills', 'body': 'Walk instead'})
+    assert not search('crowded')
+    assert search('walk')
+
+    client.post(f'/diary/delete/{diary_id}')
+    assert not search('walk')
+
+def test_incidents_are_searchable_once_approved(client, monkeypatch):
+    """Test that reports stay out of search until an admin approves them."""
+    import tasks
+    monkeypatch.setattr(tasks, 'relay_outbox_batch',
+                        lambda batch_size: {'dispatched': 0, 'failed': 0})
+    client.post('/incidents/report', data={'location': 'Rome', 'category': 'scam',
+                                           'description': 'Fake petition signers'})
+    incident = Incident.query.one()
+    assert not search('petition')
+
+    client.post(f'/admin/approve_incident/{incident.id}')
+    assert [(hit.kind, hit.id) for hit in search('petition')] == [('incident', incident.id)]
+
+    client.post(f'/admin/reject_incident/{incident.id}')
+    assert not search('petition')
+
+def test_search_filters_and_prefixes(client):
+    """Test kind, category and date filters and prefix matching on the last word."""
+    write(client, 'Scam warning', 'A taxi scam near the station')
+    db.session.add(Incident(user_id=1, location='Station', category='scam', approved=True,
+                            description='Taxi meter scam', timestamp=datetime(2023, 5, 1)))
+    db.session.commit()
+    index_incident(Incident.query.one())
+    db.session.commit()
+
+    assert {hit.kind for hit in search('tax')} == {'diary', 'incident'}
+    assert [hit.kind for hit in search('taxi', kinds=['incident'])] == ['incident']
+    assert [hit.kind for hit in search('taxi', category='scam')] == ['incident']
+    assert [hit.kind for hit in search('taxi', since=datetime(2024, 1, 1))] == ['diary']
+    assert search('taxi', until=datetime(2023, 1, 1)) == []
+
+def test_search_api(client):
+    """Test the JSON endpoint and its validation."""
+    write(client, 'Tokyo', 'Trains are punctual')
+    data = client.get('/search/api?q=trains').get_json()
+    assert data['items'][0]['kind'] == 'diary'
+    assert '<mark>Trains</mark>' in data['items'][0]['snippet']
+    assert client.get('/search/api?q=x&kind=bogus').status_code == 400
+    assert client.get('/search/?q=trains').status_code == 200
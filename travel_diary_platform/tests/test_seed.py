@@ -0,0 +1,39 @@
+from app import db
+from models import User, DiaryEntry, Comment, Like, Incident, Preference
+from search.index import search
+from setup import seed_database
+
+def test_seed_database_counts(app):
+    """Test that the seeder writes the requested number of rows."""
+    with app.app_context():
+        counts = seed_database(users=20, diaries=50, incidents=40, comments=30, likes=80,
+                               alerts=10, admins=1)
+        assert counts['users'] == User.query.count() == 20
+        assert counts['diaries'] == DiaryEntry.query.count() == 50
+        assert counts['incidents'] == Incident.query.count() == 40
+        assert counts['comments'] == Comment.query.count() == 30
+        assert Preference.query.count() == 20
+        assert User.query.filter_by(is_admin=True).count() == 1
+
+def test_seed_database_counters_and_index(app):
+    """Test that denormalized counters and the search index match the seeded rows."""
+    with app.app_context():
+        seed_database(users=10, diaries=20, incidents=20, comments=40, likes=60)
+        for diary in DiaryEntry.query.all():
+            assert diary.like_count == Like.query.filter_by(diary_id=diary.id).count()
+            assert diary.comment_count == Comment.query.filter_by(diary_id=diary.id).count()
+        approved = Incident.query.filter_by(approved=True).all()
+        assert all(incident.geohash for incident in approved)
+        word = DiaryEntry.query.first().title.split()[0]
+        assert search(word)
+
+def test_seed_database_appends_and_repeats(app):
+    """Test that a second run continues the ids and the same seed gives the same data."""
+    with app.app_context():
+        seed_database(users=5, diaries=5, incidents=5, seed=7)
+        first = [diary.title for diary in DiaryEntry.query.order_by(DiaryEntry.id)]
+        seed_database(users=5, diaries=5, incidents=5, seed=7)
+        assert User.query.count() == 10
+        assert db.session.get(User, 10).username == 'user10'
+        titles = [diary.title for diary in DiaryEntry.query.order_by(DiaryEntry.id)]
+        assert titles[5:] == first
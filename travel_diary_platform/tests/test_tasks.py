@@ -0,0 +1,39 @@
+import uuid
+import pytest
+from flask import current_app
+from app import create_app
+import tasks
+
+@pytest.fixture
+def current_app_id():
+    """A probe task on the shared Celery app, unregistered afterwards."""
+    name = f'tests.current_app_id.{uuid.uuid4().hex}'
+
+    @tasks.celery.task(name=name, shared=False)
+    def probe():
+        return id(current_app._get_current_object())
+
+    yield probe
+    tasks.celery.tasks.pop(name, None)
+
+def test_tasks_reuse_the_shared_worker_app(monkeypatch, current_app_id):
+    """Test that tasks run in one shared app instead of building their own."""
+    monkeypatch.setattr(tasks, '_app', None)
+    app = create_app()
+    tasks.make_celery(app)
+
+    assert current_app_id() == id(app)
+    assert current_app_id() == id(app)
+    assert tasks.get_app() is app
+
+def test_tasks_build_the_worker_app_once(monkeypatch, current_app_id):
+    """Test that the worker app is created lazily and only once."""
+    monkeypatch.setattr(tasks, '_app', None)
+    built = []
+    monkeypatch.setattr(tasks, 'create_app', lambda: built.append(create_app()) or built[-1])
+
+    first = current_app_id()
+    second = current_app_id()
+
+    assert len(built) == 1
+    assert first == second == id(built[0])
@@ -0,0 +1,79 @@
+import json
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from whatsapp import TokenBucket, WhatsAppSender
+
+class StubTwilioHandler(BaseHTTPRequestHandler):
+    """Minimal Messages endpoint that can be told to rate-limit requests."""
+
+    def do_POST(self):
+        server = self.server
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server.requests.append(self.path)
+        if server.throttle:
+            server.throttle -= 1
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            self.send_header('Content-Type', 'application/json')
+            body = json.dumps({'code': 20429, 'message': 'Too Many Requests', 'status': 429})
+        else:
+            self.send_response(201)
+            self.send_header('Content-Type', 'application/json')
+            body = json.dumps({'sid': f'SM{len(server.requests):032d}', 'status': 'queued'})
+        body = body.encode()
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubTwilioHandler)
+    server.requests = []
+    server.throttle = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def make_sender(server, **kwargs):
+    host, port = server.server_address
+    return WhatsAppSender('AC' + '0' * 32, 'token', 'whatsapp:+10000000000',
+                          base_url=f'http://{host}:{port}', **kwargs)
+
+def test_sender_posts_to_messages_endpoint(stub_server):
+    """Test that sends reach the stub through the shared client."""
+    sender = make_sender(stub_server, rate=100)
+
+    sid = sender.send('15551234567', 'Hello')
+
+    assert sid.startswith('SM')
+    assert stub_server.requests == [f"/2010-04-01/Accounts/{'AC' + '0' * 32}/Messages.json"]
+    sender.close()
+
+def test_sender_retries_after_rate_limit(stub_server):
+    """Test that a 429 is retried instead of surfacing as a failure."""
+    stub_server.throttle = 2
+    sender = make_sender(stub_server, rate=100, max_retries=3)
+
+    sid = sender.send('+15551234567', 'Hello')
+
+    assert sid.startswith('SM')
+    assert len(stub_server.requests) == 3
+    sender.close()
+
+def test_token_bucket_paces_callers():
+    """Test that the bucket releases callers at the configured rate."""
+    bucket = TokenBucket(rate=50, capacity=1)
+    started = time.monotonic()
+
+    for _ in range(6):
+        bucket.acquire()
+
+    # One token is available up front; the other five wait 1/50s each
+    assert time.monotonic() - started >= 5 / 50 * 0.9
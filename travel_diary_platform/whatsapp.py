@@ -0,0 +1,172 @@
+import re
+import threading
+import time
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client
+
+TWILIO_HOST = re.compile(r'^https://[a-z0-9.-]*twilio\.com')
+
+
+class TokenBucket:
+    """Thread-safe token bucket: ``rate`` tokens per second, bursting to ``capacity``.
+
+    ``acquire`` blocks until a token is available, so callers are released at
+    the provider's allowed rate. ``pause`` holds every caller back, which is
+    how a 429 from the provider slows the whole process down at once instead of
+    each thread retrying on its own.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for ``seconds`` and drop any saved burst"""
+        with self._lock:
+            now = time.monotonic()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0
+            self._updated = self._paused_until
+
+
+class RateLimitedHttpClient(TwilioHttpClient):
+    """Keep-alive Twilio HTTP client that paces requests through a token bucket.
+
+    A 429 response pauses the bucket for the server's ``Retry-After`` and the
+    request is retried up to ``max_retries`` times. ``base_url`` replaces the
+    Twilio API host, which lets the client run against a local stub server.
+    """
+
+    def __init__(self, bucket, max_retries=3, base_url=None, pool_size=10, timeout=None):
+        super().__init__(pool_connections=True, timeout=timeout)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.base_url = base_url.rstrip('/') if base_url else None
+
+    def request(self, method, url, *args, **kwargs):
+        if self.base_url:
+            url = TWILIO_HOST.sub(self.base_url, url)
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            response = super().request(method, url, *args, **kwargs)
+            if response.status_code != 429 or attempt >= self.max_retries:
+                return response
+            attempt += 1
+            self.bucket.pause(self._retry_after(response, attempt))
+
+    def _retry_after(self, response, attempt):
+        try:
+            return max(float(response.headers.get('Retry-After')), 0)
+        except (TypeError, ValueError):
+            return min(2 ** attempt / self.bucket.rate, 30)
+
+
+class WhatsAppSender:
+    """One long-lived Twilio client per process, shared by all send threads"""
+
+    def __init__(self, account_sid, auth_token, from_number, rate=10, burst=None,
+                 max_retries=3, base_url=None, pool_size=10, timeout=None):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.bucket = TokenBucket(rate, burst)
+        self.http_client = RateLimitedHttpClient(self.bucket, max_retries=max_retries,
+                                                 base_url=base_url, pool_size=pool_size,
+                                                 timeout=timeout)
+        self._client = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Build a sender from the ``TWILIO_*`` settings of a Flask config"""
+        return cls(
+            account_sid=config.get('TWILIO_ACCOUNT_SID'),
+            auth_token=config.get('TWILIO_AUTH_TOKEN'),
+            from_number=config.get('TWILIO_WHATSAPP_FROM'),
+            rate=config.get('TWILIO_RATE_LIMIT', 10),
+            burst=config.get('TWILIO_RATE_BURST'),
+            max_retries=config.get('TWILIO_MAX_RETRIES', 3),
+            base_url=config.get('TWILIO_API_BASE_URL'),
+            pool_size=config.get('ALERT_WHATSAPP_CONCURRENCY', 10),
+            timeout=config.get('TWILIO_TIMEOUT'),
+        )
+
+    @property
+    def configured(self):
+        return all([self.account_sid, self.auth_token, self.from_number])
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = Client(self.account_sid, self.auth_token,
+                                  http_client=self.http_client)
+        return self._client
+
+    def send(self, phone_number, body):
+        """Send a WhatsApp message and return its Twilio SID"""
+        # Ensure phone number has country code
+        if not phone_number.startswith('+'):
+            phone_number = '+' + phone_number
+        message = self.client.messages.create(
+            body=body,
+            from_=self.from_number,
+            to=f'whatsapp:{phone_number}'
+        )
+        return message.sid
+
+    def close(self):
+        self.http_client.session.close()
+
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def get_whatsapp_sender(config=None):
+    """Return the process-wide WhatsApp sender, creating it from ``config`` on first use"""
+    global _sender
+    if _sender is None:
+        with _sender_lock:
+            if _sender is None:
+                if config is None:
+                    from flask import current_app
+                    config = current_app.config
+                _sender = WhatsAppSender.from_config(config)
+    return _sender
+
+
+def close_whatsapp_sender():
+    """Close and forget the process-wide WhatsApp sender"""
+    global _sender
+    with _sender_lock:
+        if _sender is not None:
+            _sender.close()
+            _sender = None